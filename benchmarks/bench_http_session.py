@@ -0,0 +1,106 @@
+"""Per-call latency of Binance REST calls: a fresh connection per call vs the shared keep-alive session.
+
+    python benchmarks/bench_http_session.py [--calls 2000] [--tls] [--delay-ms 0]
+
+Starts a local stand-in for /api/v3/ticker/price (HTTP/1.1 keep-alive, optionally TLS with a
+throwaway self-signed certificate made by `openssl`) and measures p50/p99 per call for:
+
+  before  `requests.get` per call, as BinanceAPI did originally: a new TCP (+TLS) connection each time
+  after   `BinanceAPI.get_ticker_price` through the pooled session and the rate-limit scheduler
+
+`--delay-ms` adds server think time. A local server has almost no network round trip, so the gap
+here is the connection setup cost alone; against Binance each saved handshake also saves RTTs.
+"""
+import argparse
+import http.server
+import json
+import os
+import ssl
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("TELEGRAM_BOT_TOKEN", "123456:benchmark")
+
+import numpy as np # noqa: E402
+import requests # noqa: E402
+import urllib3 # noqa: E402
+
+import spotAI # noqa: E402
+
+
+class TickerHandler(http.server.BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1" # keep-alive
+    disable_nagle_algorithm = True
+    wbufsize = 1 << 16 # headers and body leave in one segment, no delayed-ACK stall on a kept-alive connection
+    delay = 0.0
+
+    def do_GET(self):
+        if self.delay: time.sleep(self.delay)
+        body = json.dumps({"symbol": "BNBUSDT", "price": "612.34000000"}).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.send_header("X-MBX-USED-WEIGHT-1M", "2")
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+def start_server(tls, delay):
+    TickerHandler.delay = delay
+    server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), TickerHandler)
+    scheme = "http"
+    if tls:
+        directory = tempfile.mkdtemp()
+        cert, key = os.path.join(directory, "cert.pem"), os.path.join(directory, "key.pem")
+        subprocess.run(["openssl", "req", "-x509", "-newkey", "rsa:2048", "-nodes", "-keyout", key, "-out", cert,
+                        "-days", "1", "-subj", "/CN=127.0.0.1"], check=True, capture_output=True)
+        context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+        context.load_cert_chain(cert, key)
+        server.socket = context.wrap_socket(server.socket, server_side=True)
+        scheme = "https"
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return f"{scheme}://127.0.0.1:{server.server_address[1]}"
+
+
+def measure(call, calls):
+    for _ in range(min(20, calls)): call() # warm-up
+    latencies = np.empty(calls)
+    for i in range(calls):
+        started = time.perf_counter()
+        call()
+        latencies[i] = time.perf_counter() - started
+    return latencies
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--calls", type=int, default=2000)
+    parser.add_argument("--tls", action="store_true", help="serve HTTPS, so each new connection also pays a TLS handshake")
+    parser.add_argument("--delay-ms", type=float, default=0.0)
+    args = parser.parse_args()
+    urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
+
+    base_url = start_server(args.tls, args.delay_ms / 1000)
+    url = f"{base_url}/api/v3/ticker/price"
+    config = dict(spotAI.CONFIG, api_key="", api_secret="", rate_limit_weight_per_minute=10 ** 9)
+    api = spotAI.BinanceAPI(config)
+    api.base_url = base_url
+    api.session.verify = False # the throwaway certificate is self-signed
+    api.session.trust_env = False # else REQUESTS_CA_BUNDLE in the environment overrides verify=False
+
+    before = measure(lambda: requests.get(url, params={"symbol": "BNBUSDT"}, timeout=10, verify=False).json(), args.calls)
+    after = measure(lambda: api.get_ticker_price("BNBUSDT"), args.calls)
+    print(f"{args.calls} calls to {url} ({'TLS' if args.tls else 'plain HTTP'}, server delay {args.delay_ms:g} ms)")
+    for label, latencies in (("before (new connection per call)", before), ("after (pooled keep-alive session)", after)):
+        print(f"  {label:<36} p50 {np.percentile(latencies, 50) * 1e3:7.3f} ms   p99 {np.percentile(latencies, 99) * 1e3:7.3f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,64 @@
+"""Throughput of the incremental indicator engine across many symbols.
+
+    python benchmarks/bench_indicators.py [--symbols 500] [--candles 200]
+
+Warms up every symbol from 100 klines, then applies `--candles` closed candles per symbol one
+update at a time (as the kline stream and KlineStore.sync deliver them) and reads the indicators
+after each update. Prints candle updates per second and the per-update latency.
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("TELEGRAM_BOT_TOKEN", "123456:benchmark")
+
+import numpy as np # noqa: E402
+
+import spotAI # noqa: E402
+
+INTERVAL_MS = spotAI.KLINE_INTERVAL_MS["15m"]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--symbols", type=int, default=500)
+    parser.add_argument("--candles", type=int, default=200, help="incremental candles per symbol after warm-up")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(1)
+    start_ms = 1_700_000_000_000
+    total = 100 + args.candles
+    series = {}
+    for s in range(args.symbols):
+        closes = 100 * np.exp(np.cumsum(rng.normal(0, 0.01, total)))
+        series[f"SYM{s}BNB"] = [[start_ms + i * INTERVAL_MS, c, c * 1.002, c * 0.998, c, 10.0, start_ms + (i + 1) * INTERVAL_MS - 1]
+                                for i, c in enumerate(closes)]
+
+    engine = spotAI.IndicatorEngine()
+    started = time.perf_counter()
+    for symbol, rows in series.items():
+        engine.update(symbol, "15m", rows[:100], rows[100][0])
+        engine.indicators(symbol, "15m")
+    warmup = time.perf_counter() - started
+
+    latencies = np.empty(args.symbols * args.candles)
+    n = 0
+    started = time.perf_counter()
+    for i in range(100, total):
+        for symbol, rows in series.items():
+            t0 = time.perf_counter()
+            engine.update(symbol, "15m", rows[i - 1:i + 1], rows[i][6] + 1)
+            engine.indicators(symbol, "15m")
+            latencies[n] = time.perf_counter() - t0
+            n += 1
+    elapsed = time.perf_counter() - started
+
+    print(f"{args.symbols} symbols: warm-up from 100 klines in {warmup:.2f}s ({warmup / args.symbols * 1e3:.2f} ms/symbol)")
+    print(f"{n:,} incremental updates in {elapsed:.2f}s: {n / elapsed:,.0f} updates/s, "
+          f"p50 {np.percentile(latencies, 50) * 1e6:.1f} us, p99 {np.percentile(latencies, 99) * 1e6:.1f} us")
+
+
+if __name__ == "__main__":
+    main()
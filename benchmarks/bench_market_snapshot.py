@@ -0,0 +1,99 @@
+"""Pair filtering and top-k selection over a synthetic 5,000-symbol 24h ticker snapshot.
+
+    python benchmarks/bench_market_snapshot.py [--symbols 5000] [--repeat 200] [--limit 5]
+
+Builds a /ticker/24hr-like payload (a third of the symbols BNB-quoted, a few BNB-based) and times:
+
+  filter    keeping the BNB symbols of the payload: `in` a list (before) vs `in` a set (after)
+  select    MarketAnalyzer.get_best_trading_pairs: scoring a list of row dicts and sorting it in
+            full (before) vs one vectorized pass and argpartition over the MarketSnapshot (after)
+  frame     applying one all-market miniTicker frame to the snapshot in place
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("TELEGRAM_BOT_TOKEN", "123456:benchmark")
+
+import numpy as np # noqa: E402
+
+import spotAI # noqa: E402
+
+
+def synthetic_tickers(count, rng):
+    tickers = []
+    for i in range(count):
+        symbol = f"S{i}BNB" if i % 3 == 0 else f"BNBS{i}" if i % 50 == 1 else f"S{i}USDT"
+        last_price = float(rng.lognormal(0, 2))
+        volume = float(rng.lognormal(8, 2))
+        tickers.append({"symbol": symbol, "volume": f"{volume:.4f}", "quoteVolume": f"{volume * last_price:.4f}",
+                        "priceChangePercent": f"{rng.normal(0, 4):.3f}", "lastPrice": f"{last_price:.8f}"})
+    return tickers
+
+
+def rows_for(tickers, symbols):
+    return [{'pair': t['symbol'], 'volume': float(t['volume']), 'quote_volume': float(t['quoteVolume']),
+             'price_change': float(t['priceChangePercent']), 'last_price': float(t['lastPrice'])}
+            for t in tickers if t['symbol'] in symbols]
+
+
+def best_pairs_list(market_data, min_volume, min_price_change, limit):
+    """get_best_trading_pairs before the MarketSnapshot (list comprehension, scores, full sort), with the
+    filter grouped as it is now so both return the same pairs."""
+    filtered_pairs = [p for p in market_data
+                      if ((p['pair'].endswith("BNB") and p.get('quote_volume', 0) >= min_volume) or
+                          (p['pair'].startswith("BNB") and p.get('volume', 0) >= min_volume))
+                      and abs(p.get("price_change", 0)) >= min_price_change]
+    scored_pairs = [(p, p.get('quote_volume', 0) / 1000 + abs(p.get("price_change", 0)) * 2) for p in filtered_pairs]
+    scored_pairs.sort(key=lambda x: x[1], reverse=True)
+    return [p for p, _ in scored_pairs[:limit]]
+
+
+def timed(call, repeat):
+    call() # warm-up
+    latencies = np.empty(repeat)
+    for i in range(repeat):
+        started = time.perf_counter()
+        call()
+        latencies[i] = time.perf_counter() - started
+    return latencies
+
+
+def report(label, latencies):
+    print(f"  {label:<40} p50 {np.percentile(latencies, 50) * 1e3:8.3f} ms   p99 {np.percentile(latencies, 99) * 1e3:8.3f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--symbols", type=int, default=5000)
+    parser.add_argument("--repeat", type=int, default=200)
+    parser.add_argument("--limit", type=int, default=5)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(6)
+    tickers = synthetic_tickers(args.symbols, rng)
+    bnb_symbols = [t['symbol'] for t in tickers if "BNB" in t['symbol']]
+    bnb_symbol_set = set(bnb_symbols)
+    market_data = rows_for(tickers, bnb_symbol_set)
+
+    analyzer = spotAI.MarketAnalyzer(dict(spotAI.CONFIG, mock_mode=False, api_key="", api_secret=""))
+    analyzer.market_data = market_data
+    analyzer._stream_symbols = bnb_symbol_set
+    min_volume, min_price_change = analyzer.config.get("min_volume", 100), analyzer.config.get("min_price_change", 1.0)
+    expected = [row['pair'] for row in best_pairs_list(market_data, min_volume, min_price_change, args.limit)]
+    assert [row['pair'] for row in analyzer.get_best_trading_pairs(limit=args.limit)] == expected, "selections differ"
+
+    frame = [{"s": t['symbol'], "c": t['lastPrice'], "o": t['lastPrice'], "v": t['volume'], "q": t['quoteVolume']} for t in tickers]
+
+    print(f"{args.symbols} symbols in the payload, {len(market_data)} BNB pairs in the snapshot, top {args.limit}")
+    report("filter, list membership (before)", timed(lambda: rows_for(tickers, bnb_symbols), max(5, args.repeat // 20)))
+    report("filter, set membership (after)", timed(lambda: rows_for(tickers, bnb_symbol_set), args.repeat))
+    report("select, list of dicts + sort (before)", timed(lambda: best_pairs_list(market_data, min_volume, min_price_change, args.limit), args.repeat))
+    report("select, vectorized snapshot (after)", timed(lambda: analyzer.get_best_trading_pairs(limit=args.limit), args.repeat))
+    report("miniTicker frame applied in place", timed(lambda: analyzer._on_mini_ticker_frame("!miniTicker@arr", frame), args.repeat))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,114 @@
+"""Memory held by the in-memory trade history after a long run, and the cost of its common lookups.
+
+    python benchmarks/bench_trade_memory.py [--trades 50000] [--open 20] [--capacity 500]
+
+Opens and completes `--trades` trades with realistic fields, keeping `--open` of them open, in:
+
+  before  plain dicts in ACTIVE_TRADES / COMPLETED_TRADES lists that grow for the whole uptime
+  after   TradeRecord objects in a TradeRegistry whose completed-trade ring buffer holds `--capacity`
+
+and reports the memory still allocated afterwards (tracemalloc), the size of one trade, and the
+time of the lookups trading_loop, monitor_trades_loop and /trades make.
+"""
+import argparse
+import collections
+import os
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("TELEGRAM_BOT_TOKEN", "123456:benchmark")
+
+import spotAI # noqa: E402
+
+PAIRS = [f"P{i}BNB" for i in range(300)]
+
+
+def trade_fields(i):
+    opened = 1_700_000_000 + i * 60
+    return {'id': 1_700_000_000_000 + i, 'timestamp': float(opened), 'pair': PAIRS[i % len(PAIRS)], 'base_asset': f"P{i % len(PAIRS)}",
+            'quote_asset': "BNB", 'type': "BUY" if i % 2 else "SELL", 'entry_price': 0.00123 + i * 1e-9, 'amount': 12.5,
+            'bnb_value_of_trade': 0.015, 'take_profit': 0.00125, 'stop_loss': 0.00121, 'max_time_seconds': 600,
+            'entry_time': time.strftime("%Y-%m-%d %H:%M:%S", time.gmtime(opened)), 'completed': False, 'mode': "balanced_growth",
+            'order_id': None, 'real_trade_opened': False, 'real_trade_filled': False, 'strategy': "Momentum",
+            'percentage_based': False, 'ai_rationale': None}
+
+
+def close_fields(i):
+    return {'completed': True, 'exit_price': 0.00124, 'result': 0.8, 'close_reason': "take_profit", 'profit_in_bnb': 0.00012,
+            'exit_time': time.strftime("%Y-%m-%d %H:%M:%S", time.gmtime(1_700_000_000 + i * 60 + 300))}
+
+
+def run_lists(count, open_count):
+    active, completed = [], []
+    for i in range(count):
+        active.append(trade_fields(i))
+        if len(active) > open_count:
+            trade = active.pop(0)
+            trade.update(close_fields(i))
+            completed.append(trade)
+    return active, completed
+
+
+def run_registry(count, open_count, capacity):
+    registry, opened = spotAI.TradeRegistry(capacity), collections.deque()
+    for i in range(count):
+        trade = spotAI.TradeRecord(trade_fields(i))
+        registry.add(trade)
+        opened.append(trade)
+        if len(opened) > open_count:
+            trade = opened.popleft()
+            trade.update(close_fields(i))
+            registry.complete(trade)
+    return registry
+
+
+def retained(build):
+    tracemalloc.start()
+    result = build()
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, current, peak
+
+
+def per_call_us(call, repeat=2000):
+    started = time.perf_counter()
+    for _ in range(repeat): call()
+    return (time.perf_counter() - started) / repeat * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--trades", type=int, default=50000)
+    parser.add_argument("--open", type=int, default=20)
+    parser.add_argument("--capacity", type=int, default=500)
+    args = parser.parse_args()
+
+    (active, completed), lists_current, lists_peak = retained(lambda: run_lists(args.trades, args.open))
+    registry, registry_current, registry_peak = retained(lambda: run_registry(args.trades, args.open, args.capacity))
+
+    def one_trade(make):
+        tracemalloc.start()
+        trade = make()
+        size = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+        del trade
+        return size
+
+    dict_size = one_trade(lambda: dict(trade_fields(1), **close_fields(1)))
+    record_size = one_trade(lambda: spotAI.TradeRecord(dict(trade_fields(1), **close_fields(1))))
+
+    pair = active[len(active) // 2]['pair']
+    print(f"{args.trades} trades, {args.open} open, completed ring buffer {args.capacity}")
+    print(f"  one completed trade              dict {dict_size:6d} B   TradeRecord {record_size:6d} B")
+    print(f"  retained after the run           lists {lists_current / 1e6:7.2f} MB   registry {registry_current / 1e6:7.2f} MB")
+    print(f"  peak while running               lists {lists_peak / 1e6:7.2f} MB   registry {registry_peak / 1e6:7.2f} MB")
+    print(f"  open trade on a pair             any() {per_call_us(lambda: any(t['pair'] == pair for t in active)):7.2f} us   "
+          f"has_open_trade {per_call_us(lambda: registry.has_open_trade(pair)):7.2f} us")
+    print(f"  10 most recent trades            sort all {per_call_us(lambda: sorted(active + completed, key=lambda t: t['timestamp'], reverse=True)[:10], 20):9.1f} us   "
+          f"recent {per_call_us(lambda: registry.recent(10)):7.2f} us")
+
+
+if __name__ == "__main__":
+    main()
@@ -4,20 +4,41 @@ import logging
 import threading
 import random
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 import asyncio
 import hmac
 import hashlib
 import urllib.parse
 import queue
+import sqlite3
+import collections
+import itertools
+import heapq
+import math
+import sys
+import argparse
+import re
 from datetime import datetime, timedelta
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.ext import Application, CommandHandler, CallbackQueryHandler, ContextTypes, MessageHandler, filters
 from telegram.constants import ParseMode
-import pandas as pd
-import pandas_ta as ta
+from telegram.error import RetryAfter, TimedOut, NetworkError
+import numpy as np
 import google.generativeai as genai
 import os
+import functools
+import concurrent.futures
+from decimal import Decimal, ROUND_DOWN, ROUND_HALF_UP
 from dotenv import load_dotenv
+try:
+    import aiohttp # Optional: AsyncBinanceAPI falls back to the pooled requests session in a thread without it
+except ImportError:
+    aiohttp = None
+try:
+    import websocket # Optional (websocket-client): streaming market data falls back to REST polling without it
+except ImportError:
+    websocket = None
 
 print("Script starting...")
 print(f"Current working directory: {os.getcwd()}")
@@ -63,6 +84,8 @@ BINANCE_API_KEY = os.getenv("BINANCE_API_KEY", "YOUR_BINANCE_API_KEY")
 BINANCE_API_SECRET = os.getenv("BINANCE_API_SECRET", "YOUR_BINANCE_API_SECRET")
 BINANCE_API_URL = "https://api.binance.com"
 BINANCE_TEST_API_URL = "https://testnet.binance.vision"
+BINANCE_WS_URL = "wss://stream.binance.com:9443"
+BINANCE_TEST_WS_URL = "wss://stream.testnet.binance.vision"
 
 GEMINI_API_KEY = os.getenv("GEMINI_API_KEY", "YOUR_GEMINI_API_KEY")
 
@@ -74,7 +97,12 @@ print(f"Final BINANCE_API_KEY for script: '{BINANCE_API_KEY}'")
 print(f"Final BINANCE_API_SECRET for script: '{BINANCE_API_SECRET}'")
 
 
-if not TELEGRAM_BOT_TOKEN_FROM_ENV:
+OFFLINE_COMMANDS = ("backtest", "replay", "train-advisor") # command-line modes that do not need Telegram (see main)
+RUNNING_OFFLINE = len(sys.argv) > 1 and sys.argv[1] in OFFLINE_COMMANDS
+
+if RUNNING_OFFLINE:
+    pass
+elif not TELEGRAM_BOT_TOKEN_FROM_ENV:
     logger.critical("CRITICAL: TELEGRAM_BOT_TOKEN was not found by os.getenv after attempting to load .env. Likely .env file not found/readable or key is missing/empty in .env. Exiting.")
     exit()
 elif TELEGRAM_BOT_TOKEN == "YOUR_TELEGRAM_BOT_TOKEN":
@@ -237,7 +265,12 @@ CONFIG = {
     "stop_loss": 5.0,
     "trading_enabled": False, # Default to False for safety
     "whale_detection": True,
-    "whale_threshold": 100,
+    "whale_threshold": 100, # Smallest whale, in BNB of notional
+    "whale_quantile": 0.999, # ...and it must be larger than this share of the pair's recent trade clusters
+    "whale_cluster_seconds": 2, # Same-side aggressive trades on a pair within this window count as one order
+    "whale_half_life": 3600, # Seconds after which a cluster counts half in its pair's size distribution
+    "whale_min_samples": 200, # Clusters a pair needs before its distribution is trusted
+    "whale_stream_pairs": 50, # BNB pairs, by volume, whose @aggTrade stream is watched
     "auto_trade_on_whale": False,
     "trading_strategy": "follow_whale",
     "safety_mode": True,
@@ -255,13 +288,61 @@ CONFIG = {
     "daily_profit_target": 2.5,
     "min_bnb_per_trade": 0.011,
     "ai_dynamic_mode": False, # NEW: AI Dynamic mode
-    "ai_advice_cache_duration": 300 # NEW: Cache AI advice for 5 minutes (in seconds)
+    "ai_advice_cache_duration": 300, # NEW: Cache AI advice for 5 minutes (in seconds)
+    "ai_advice_max_stale": 900, # Seconds past ai_advice_cache_duration that old advice is still used while a refresh runs
+    "ai_advice_max_wait": 0, # Seconds a new trade waits for advice that is not cached yet; 0 = use the mode settings, fetch in the background
+    "ai_advice_workers": 2, # Gemini advice requests running at once
+    "ai_advice_retry_seconds": 60, # Pause before a pair whose advice request failed is requested again
+    "ai_prefetch_pairs": 5, # Best-ranked pairs (get_best_trading_pairs) whose advice is kept fresh in AI dynamic mode
+    "ai_advice_batch_size": 5, # Pairs whose advice is asked for in one Gemini request when several are due; 1 = one request per pair
+    "ai_call_timeout": 20, # Latency budget of one Gemini call in seconds; slower calls are cut off and count as failures
+    "ai_breaker_window": 20, # Recent Gemini calls whose failure rate can open the circuit breaker
+    "ai_breaker_min_calls": 5, # Calls needed in that window before the breaker can open
+    "ai_breaker_failure_rate": 0.5, # Share of failed calls in the window that opens the breaker
+    "ai_breaker_open_seconds": 120, # Seconds Gemini is not called once the breaker opened; then one probe call decides
+    "ai_advisor": "gemini", # Advice in AI dynamic mode: "gemini", "local" (model from `python spotAI.py train-advisor`) or "ab" (each trade picks one)
+    "ai_advisor_ab_local_share": 0.5, # Share of trades advised by the local model when ai_advisor is "ab"
+    "ai_model_dir": "advisor_models", # Versioned local advice models (advisor_vNNNN.json)
+    "ai_local_model_version": 0, # Local model version to load; 0 = the newest
+    "ai_advice_cache_file": "ai_advice_cache.json", # Gemini answers kept across restarts; empty = memory only
+    "ai_advice_cache_size": 512, # Pair/market-condition combinations whose Gemini answer is kept
+    "ai_advice_cache_ttl": 1800, # Seconds a Gemini answer is reused for the same pair in the same conditions
+    "http_pool_size": 20, # Max keep-alive connections kept open to the Binance REST API
+    "http_max_retries": 3, # Retries (with backoff) on connection errors and 5xx for idempotent requests
+    "http_backoff_factor": 0.3, # Backoff between retries: factor * 2^(retry-1) seconds
+    "market_data_stream": True, # Use the !miniTicker@arr websocket instead of polling /ticker/24hr (real data only)
+    "binance_ws_url": "", # Override the websocket base URL (e.g. a local replay server); empty = derive from use_testnet
+    "stream_stale_timeout": 15, # Reconnect a stream that has been silent for this many seconds
+    "stream_gap_resync_seconds": 5, # After a reconnect, resync over REST if the stream missed more than this
+    "price_feed_stream": True, # Watch open real trades through @bookTicker streams instead of polling /ticker/price
+    "exchange_info_ttl": 3600, # Seconds before the cached exchangeInfo (symbols + filters) is refreshed
+    "exchange_info_snapshot_file": "exchange_info_snapshot.json", # On-disk copy of the parsed index for fast startup; empty = off
+    "rate_limit_weight_per_minute": 6000, # REQUEST_WEIGHT budget per minute; lower it to leave room for other tools on the same IP
+    "rate_limit_orders_per_10s": 100, # ORDERS budget per 10 seconds
+    "rate_limit_max_wait": 10, # Longest a request waits for budget before failing with BinanceRateLimitError (seconds)
+    "account_stream": True, # Keep balances current through the user data stream while real trading
+    "account_cache_ttl": 30, # Seconds a REST account snapshot is reused when the user data stream is not connected
+    "trade_db_file": "trades.db", # SQLite file holding every trade; open trades are reloaded from it at startup
+    "completed_trades_in_memory": 500, # Recent completed trades kept in memory for /trades and /status
+    "handler_workers": 4, # Threads running blocking Binance/analyzer work for Telegram handlers
+    "handler_latency_budget": 3, # Seconds before a slow handler shows "still working"
+    "handler_max_wait": 60, # Seconds before a handler stops waiting for its blocking work
+    "notification_critical_latency_target": 5, # Seconds; slower delivery of a critical notification is logged
+    "entry_evaluation_interval": 5, # Minimum seconds between auto-trade entry evaluations; market events in between are merged
+    "kline_store_dir": "klines", # Local candle files, one per symbol and interval
+    "kline_backfill_candles": 1000, # History downloaded the first time a symbol/interval is used
+    "record_streams_file": "", # Append every public market stream message to this JSON-lines file for replay; empty = off
+    "replay_file": "", # Feed the bot from a recorded stream file instead of Binance (simulated trades only); empty = live
+    "replay_speed": 1, # Replay pace: 1 = real time, up to 1000; 0 = as fast as the bot keeps up
+    "replay_seed": 0, # Seed of the replay's random generator, for repeatable runs
+    "strategies": { # Auto-trade entry strategies, run side by side; earlier ones get free slots first
+        "momentum": {"enabled": True, "max_open_trades": 3}, # min_volume / min_price_change default to the trading mode's
+        "rsi_reversion": {"enabled": False, "max_open_trades": 1, "oversold": 30, "overbought": 70}
+    },
+    "strategy_indicator_interval": "15m", # Candle interval of the indicators strategies see, computed for every snapshot symbol
+    "strategy_indicator_max_age": 1800, # Seconds after which a symbol's strategy indicators are ignored as stale; keep above one interval
 }
 
-# Active trades
-ACTIVE_TRADES = []
-COMPLETED_TRADES = []
-
 # Daily statistics
 DAILY_STATS = {
     "date": datetime.now().strftime("%Y-%m-%d"),
@@ -274,8 +355,8 @@ DAILY_STATS = {
     "current_balance": 0.0
 }
 
-# Mock whale transactions
-MOCK_WHALE_TRANSACTIONS = []
+# Recent whale transactions (detected or mock), oldest first
+WHALE_TRANSACTIONS = collections.deque(maxlen=200)
 
 # Initial mock market data
 INITIAL_MARKET_DATA = [
@@ -291,18 +372,429 @@ ADDITIONAL_PAIRS = [
     {"pair": "ADABNB", "volume": 0, "quote_volume": 0, "price_change": 0, "last_price": 0.00095},
 ]
 
-# --- NEW: AI Advice Cache ---
-ai_advice_cache = {} # { "PAIR": {"timestamp": time.time(), "advice": {...}} }
-# --- END NEW: AI Advice Cache ---
+BINANCE_WEIGHT_LIMIT_1M = 6000 # Spot REQUEST_WEIGHT limit per minute per IP
+KLINE_INTERVAL_MS = {"1m": 60_000, "3m": 180_000, "5m": 300_000, "15m": 900_000, "30m": 1_800_000, "1h": 3_600_000,
+                     "2h": 7_200_000, "4h": 14_400_000, "6h": 21_600_000, "8h": 28_800_000, "12h": 43_200_000, "1d": 86_400_000}
+
+class ExchangeInfoCache:
+    """Parsed /api/v3/exchangeInfo shared by all BinanceAPI instances on the same base URL.
+
+    Keeps only what the bot uses (status, base/quote asset and the LOT_SIZE, PRICE_FILTER and
+    (MIN_)NOTIONAL filters) indexed by symbol, base asset and quote asset. Stale data keeps being
+    served while a single background refresh runs; refreshes are postponed while the IP's used
+    request weight is high.
+    """
+    _instances = {}
+    _instances_lock = threading.Lock()
+
+    def __init__(self, base_url, config):
+        self.base_url = base_url
+        self.config = config
+        self.lock = threading.Lock()
+        self.symbols = {} # symbol -> {'base', 'quote', 'status', 'step_size', 'min_qty', 'tick_size', 'min_notional'}
+        self.by_base = {} # asset -> set of symbols
+        self.by_quote = {} # asset -> set of symbols
+        self.fetched_at = 0
+        self._refreshing = False
+        self._load_snapshot()
+
+    @classmethod
+    def for_base_url(cls, base_url, config):
+        with cls._instances_lock:
+            if base_url not in cls._instances:
+                cls._instances[base_url] = cls(base_url, config)
+            return cls._instances[base_url]
+
+    def is_stale(self):
+        return time.time() - self.fetched_at > self.config.get("exchange_info_ttl", 3600)
+
+    def ensure_fresh(self, binance_api):
+        """Loads the index on first use (blocking) and refreshes stale data in the background."""
+        if not self.symbols:
+            self.refresh(binance_api)
+        elif self.is_stale():
+            with self.lock: # check-and-set, so threads that see stale data together start one refresh
+                if self._refreshing: return
+                self._refreshing = True
+            refresh_thread = threading.Thread(target=self.refresh, args=(binance_api,))
+            refresh_thread.daemon = True
+            refresh_thread.start()
+
+    def refresh(self, binance_api):
+        try:
+            if self.symbols and binance_api.used_weight_1m() > binance_api.scheduler.weight_limit * 0.5:
+                logger.info("Postponing exchangeInfo refresh: request weight usage is high.")
+                return
+            exchange_info = binance_api.get_exchange_info()
+            if exchange_info and 'symbols' in exchange_info:
+                self._index(exchange_info['symbols'], time.time())
+                self._save_snapshot()
+        finally:
+            with self.lock:
+                self._refreshing = False
+
+    def _index(self, raw_symbols, fetched_at):
+        symbols, by_base, by_quote = {}, {}, {}
+        for raw in raw_symbols:
+            info = raw if 'base' in raw else self._parse_symbol(raw)
+            symbols[raw['symbol']] = info
+            by_base.setdefault(info['base'], set()).add(raw['symbol'])
+            by_quote.setdefault(info['quote'], set()).add(raw['symbol'])
+        with self.lock:
+            self.symbols, self.by_base, self.by_quote, self.fetched_at = symbols, by_base, by_quote, fetched_at
+
+    @staticmethod
+    def _parse_symbol(raw):
+        info = {'symbol': raw['symbol'], 'base': raw.get('baseAsset', ''), 'quote': raw.get('quoteAsset', ''),
+                'status': raw.get('status', ''), 'step_size': None, 'min_qty': None, 'tick_size': None, 'min_notional': None}
+        for symbol_filter in raw.get('filters', []):
+            filter_type = symbol_filter.get('filterType')
+            if filter_type == 'LOT_SIZE':
+                info['step_size'], info['min_qty'] = symbol_filter.get('stepSize'), symbol_filter.get('minQty')
+            elif filter_type == 'PRICE_FILTER':
+                info['tick_size'] = symbol_filter.get('tickSize')
+            elif filter_type in ('MIN_NOTIONAL', 'NOTIONAL'):
+                info['min_notional'] = symbol_filter.get('minNotional')
+        return info
+
+    def get_symbol(self, symbol):
+        return self.symbols.get(symbol)
+
+    def trading_symbols_for_asset(self, asset):
+        """Symbols with `asset` as base or quote that are currently TRADING."""
+        with self.lock:
+            candidates = self.by_base.get(asset, set()) | self.by_quote.get(asset, set())
+            return {sym for sym in candidates if self.symbols[sym]['status'] == 'TRADING'}
+
+    def format_quantity(self, symbol, quantity):
+        """Quantity rounded down to the symbol's LOT_SIZE step, or None if the filters are unknown."""
+        info = self.symbols.get(symbol)
+        if not info or not info['step_size'] or Decimal(info['step_size']) == 0:
+            return None
+        step = Decimal(info['step_size'])
+        rounded = (Decimal(str(quantity)) / step).to_integral_value(rounding=ROUND_DOWN) * step
+        return format(rounded.normalize(), 'f')
+
+    def format_price(self, symbol, price):
+        info = self.symbols.get(symbol)
+        if not info or not info['tick_size'] or Decimal(info['tick_size']) == 0:
+            return None
+        tick = Decimal(info['tick_size'])
+        rounded = (Decimal(str(price)) / tick).to_integral_value(rounding=ROUND_HALF_UP) * tick
+        return format(rounded.normalize(), 'f')
+
+    def check_order(self, symbol, quantity, price):
+        """Returns a reason string if the order would break LOT_SIZE minQty or the minimum notional, else None."""
+        info = self.symbols.get(symbol)
+        if not info: return None
+        formatted_quantity = self.format_quantity(symbol, quantity)
+        effective_quantity = float(formatted_quantity) if formatted_quantity is not None else quantity
+        if info['min_qty'] and effective_quantity < float(info['min_qty']):
+            return f"quantity {effective_quantity} below minQty {info['min_qty']}"
+        if info['min_notional'] and price and effective_quantity * price < float(info['min_notional']):
+            return f"notional {effective_quantity * price:.8f} below minNotional {info['min_notional']}"
+        return None
+
+    def _snapshot_path(self):
+        snapshot_file = self.config.get("exchange_info_snapshot_file")
+        if not snapshot_file: return None
+        suffix = "testnet" if self.base_url == BINANCE_TEST_API_URL else "mainnet"
+        root, ext = os.path.splitext(snapshot_file)
+        return f"{root}_{suffix}{ext or '.json'}"
+
+    def _load_snapshot(self):
+        path = self._snapshot_path()
+        if not path or not os.path.exists(path): return
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                snapshot = json.load(f)
+            self._index(snapshot['symbols'], snapshot.get('fetched_at', 0))
+            logger.info(f"Loaded exchangeInfo snapshot ({len(self.symbols)} symbols) from {path}")
+        except (OSError, ValueError, KeyError) as e:
+            logger.warning(f"Ignoring unreadable exchangeInfo snapshot {path}: {e}")
+
+    def _save_snapshot(self):
+        path = self._snapshot_path()
+        if not path: return
+        try:
+            tmp_path = path + ".tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump({'fetched_at': self.fetched_at, 'symbols': list(self.symbols.values())}, f)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            logger.warning(f"Could not write exchangeInfo snapshot {path}: {e}")
+
+# Per-endpoint HTTP timeouts in seconds, keyed by (method, path). Anything not listed uses the default.
+BINANCE_DEFAULT_TIMEOUT = 10
+BINANCE_ENDPOINT_TIMEOUTS = {
+    ("GET", "/api/v3/ticker/price"): 5,
+    ("POST", "/api/v3/order"): 15,
+    ("GET", "/api/v3/allOrders"): 15,
+}
+
+# REQUEST_WEIGHT of each REST endpoint (Binance spot docs). Callables get the request params because
+# some endpoints cost far more without a symbol. Unknown endpoints are charged BINANCE_DEFAULT_WEIGHT.
+BINANCE_DEFAULT_WEIGHT = 2
+BINANCE_ENDPOINT_WEIGHTS = {
+    ("GET", "/api/v3/ping"): 1,
+    ("GET", "/api/v3/time"): 1,
+    ("GET", "/api/v3/exchangeInfo"): 20,
+    ("GET", "/api/v3/account"): 20,
+    ("GET", "/api/v3/ticker/price"): lambda params: 2 if params and 'symbol' in params else 4,
+    ("GET", "/api/v3/ticker/24hr"): lambda params: 2 if params and 'symbol' in params else 80,
+    ("GET", "/api/v3/klines"): 2,
+    ("POST", "/api/v3/order"): 1,
+    ("DELETE", "/api/v3/order"): 1,
+    ("GET", "/api/v3/order"): 4,
+    ("GET", "/api/v3/openOrders"): lambda params: 6 if params and 'symbol' in params else 80,
+    ("GET", "/api/v3/allOrders"): 20,
+    ("POST", "/api/v3/userDataStream"): 2,
+    ("PUT", "/api/v3/userDataStream"): 2,
+    ("DELETE", "/api/v3/userDataStream"): 2,
+}
+
+# Scheduling priorities: lower value = more of the weight budget may be spent on it. Placing and
+# cancelling orders can use the whole minute, so market-data refreshes never starve an exit.
+PRIORITY_ORDER = 0
+PRIORITY_ACCOUNT = 1
+PRIORITY_MARKET_DATA = 2
+PRIORITY_WEIGHT_SHARE = {PRIORITY_ORDER: 1.0, PRIORITY_ACCOUNT: 0.9, PRIORITY_MARKET_DATA: 0.8}
+ORDER_ENDPOINTS = {("POST", "/api/v3/order"), ("DELETE", "/api/v3/order")}
+ORDER_RATE_ENDPOINTS = {("POST", "/api/v3/order")} # count toward the ORDERS limit; cancels do not
+ACCOUNT_PATHS = {"/api/v3/account", "/api/v3/order", "/api/v3/openOrders", "/api/v3/allOrders", "/api/v3/userDataStream"}
+
+# Notification priority classes, most urgent first. Each class has its own lane per chat: a bounded
+# queue (oldest dropped when full) whose messages are only merged with messages of the same class,
+# plus a maximum age after which a message is no longer worth sending.
+NOTIFY_CRITICAL = 0 # risk and limit events, rejected/failed real orders
+NOTIFY_FILL = 1 # closed trades
+NOTIFY_ENTRY = 2 # opened trades and failed entries
+NOTIFY_INFO = 3 # whale alerts, AI parameter updates
+NOTIFICATION_LANES = {
+    NOTIFY_CRITICAL: {"name": "critical", "capacity": 100, "max_age": None},
+    NOTIFY_FILL: {"name": "fill", "capacity": 200, "max_age": None},
+    NOTIFY_ENTRY: {"name": "entry", "capacity": 50, "max_age": 600},
+    NOTIFY_INFO: {"name": "info", "capacity": 20, "max_age": 120},
+}
+
+# Events published on TradingBot.event_bus. Subscribers receive (event_type, data) with the keyword
+# arguments given to publish as `data`.
+EVENT_MARKET_UPDATED = "market_updated" # MarketAnalyzer snapshot refreshed (REST download or stream frame)
+EVENT_PRICE_TICK = "price_tick" # PriceFeed book ticker for a held symbol; data: symbol
+EVENT_TRADE_OPENED = "trade_opened" # data: trade
+EVENT_TRADE_CLOSED = "trade_closed" # data: trade, reason
+EVENT_CONFIG_CHANGED = "config_changed" # data: param (None when several settings changed)
+EVENT_DAILY_LIMIT = "daily_limit" # data: limit ("profit_target" or "loss_limit"), profit_pct
+EVENT_TRADING_STOPPED = "trading_stopped"
+
+class BinanceRateLimitError(requests.exceptions.RequestException):
+    """Raised instead of sending a request that would have to wait longer than rate_limit_max_wait."""
+
+class RequestScheduler:
+    """Request-weight budget for one Binance base URL, shared by every (sync and async) client.
+
+    Each request reserves its endpoint weight in the current one-minute window before it is sent;
+    the X-MBX-USED-WEIGHT-1M / X-MBX-ORDER-COUNT-10S headers of every response then correct the
+    local estimate. Lower-priority requests stop at a share of the limit so orders keep headroom,
+    and 429/418 responses block all requests until their Retry-After has passed.
+    """
+    _instances = {}
+    _instances_lock = threading.Lock()
+
+    def __init__(self, base_url, config):
+        self.base_url = base_url
+        self.config = config
+        self.lock = threading.Lock()
+        self.window_start = 0 # start of the current one-minute weight window
+        self.used_weight = 0
+        self.order_window_start = 0 # start of the current ten-second order window
+        self.order_count = 0
+        self.banned_until = 0
+        self.metrics = {"requests": 0, "throttled": 0, "throttle_wait_seconds": 0.0, "rejected": 0,
+                        "http_429": 0, "http_418": 0, "peak_weight": 0}
+
+    @classmethod
+    def for_base_url(cls, base_url, config):
+        with cls._instances_lock:
+            if base_url not in cls._instances:
+                cls._instances[base_url] = cls(base_url, config)
+            return cls._instances[base_url]
+
+    @property
+    def weight_limit(self):
+        return int(self.config.get("rate_limit_weight_per_minute", BINANCE_WEIGHT_LIMIT_1M))
+
+    @property
+    def order_limit(self):
+        return int(self.config.get("rate_limit_orders_per_10s", 100))
+
+    @staticmethod
+    def endpoint_weight(method, path, params=None):
+        weight = BINANCE_ENDPOINT_WEIGHTS.get((method, path), BINANCE_DEFAULT_WEIGHT)
+        return weight(params) if callable(weight) else weight
+
+    @staticmethod
+    def endpoint_priority(method, path):
+        if (method, path) in ORDER_ENDPOINTS: return PRIORITY_ORDER
+        if path in ACCOUNT_PATHS: return PRIORITY_ACCOUNT
+        return PRIORITY_MARKET_DATA
+
+    def _roll_windows(self, now):
+        window_start = now - now % 60
+        if window_start != self.window_start:
+            self.window_start, self.used_weight = window_start, 0
+        order_window_start = now - now % 10
+        if order_window_start != self.order_window_start:
+            self.order_window_start, self.order_count = order_window_start, 0
+
+    def _try_reserve(self, method, path, params):
+        """Reserves the request's weight and returns 0, or returns how many seconds to wait before retrying."""
+        now = time.time()
+        weight = self.endpoint_weight(method, path, params)
+        is_order = (method, path) in ORDER_RATE_ENDPOINTS
+        with self.lock:
+            self._roll_windows(now)
+            if now < self.banned_until:
+                return self.banned_until - now
+            budget = self.weight_limit * PRIORITY_WEIGHT_SHARE[self.endpoint_priority(method, path)]
+            if self.used_weight + weight > budget and self.used_weight > 0:
+                return self.window_start + 60 - now
+            if is_order and self.order_count >= self.order_limit:
+                return self.order_window_start + 10 - now
+            self.used_weight += weight
+            if is_order: self.order_count += 1
+            self.metrics["requests"] += 1
+            self.metrics["peak_weight"] = max(self.metrics["peak_weight"], self.used_weight)
+            return 0
+
+    def _check_wait(self, method, path, wait, waited):
+        max_wait = float(self.config.get("rate_limit_max_wait", 10))
+        if waited + wait > max_wait:
+            with self.lock:
+                self.metrics["rejected"] += 1
+            raise BinanceRateLimitError(f"Rate limit budget exhausted for {method} {path}; retry in {wait:.1f}s")
+        if waited == 0:
+            logger.info(f"Throttling {method} {path} for up to {wait:.1f}s (used weight {self.used_weight}/{self.weight_limit})")
+            with self.lock:
+                self.metrics["throttled"] += 1
+
+    def acquire(self, method, path, params=None):
+        """Blocks until the request fits the budget; raises BinanceRateLimitError past rate_limit_max_wait."""
+        waited = 0.0
+        while True:
+            wait = self._try_reserve(method, path, params)
+            if not wait: break
+            self._check_wait(method, path, wait, waited)
+            step = min(wait, 1.0)
+            time.sleep(step)
+            waited += step
+        if waited:
+            with self.lock:
+                self.metrics["throttle_wait_seconds"] += waited
+
+    async def acquire_async(self, method, path, params=None):
+        waited = 0.0
+        while True:
+            wait = self._try_reserve(method, path, params)
+            if not wait: break
+            self._check_wait(method, path, wait, waited)
+            step = min(wait, 1.0)
+            await asyncio.sleep(step)
+            waited += step
+        if waited:
+            with self.lock:
+                self.metrics["throttle_wait_seconds"] += waited
+
+    def record_response(self, status_code, headers):
+        """Syncs the local counters with the usage Binance reports and honours 429/418 Retry-After."""
+        now = time.time()
+        used_weight = headers.get('X-MBX-USED-WEIGHT-1M') or headers.get('x-mbx-used-weight-1m')
+        order_count = headers.get('X-MBX-ORDER-COUNT-10S') or headers.get('x-mbx-order-count-10s')
+        with self.lock:
+            self._roll_windows(now)
+            try:
+                if used_weight is not None:
+                    # The server count is authoritative, but requests reserved and still in flight are not in it yet
+                    self.used_weight = max(self.used_weight, int(used_weight))
+                    self.metrics["peak_weight"] = max(self.metrics["peak_weight"], self.used_weight)
+                if order_count is not None:
+                    self.order_count = max(self.order_count, int(order_count))
+            except ValueError:
+                pass
+            if status_code in (429, 418):
+                self.metrics["http_429" if status_code == 429 else "http_418"] += 1
+                try:
+                    retry_after = float(headers.get('Retry-After') or headers.get('retry-after') or 60)
+                except ValueError:
+                    retry_after = 60
+                self.banned_until = max(self.banned_until, now + retry_after)
+                logger.warning(f"Binance returned HTTP {status_code}; pausing all requests to {self.base_url} for {retry_after:.0f}s")
+
+    def current_weight(self):
+        with self.lock:
+            self._roll_windows(time.time())
+            return self.used_weight
+
+    def get_metrics(self):
+        with self.lock:
+            self._roll_windows(time.time())
+            return dict(self.metrics, used_weight=self.used_weight, weight_limit=self.weight_limit,
+                        order_count=self.order_count, order_limit=self.order_limit,
+                        banned_for=max(0, round(self.banned_until - time.time())))
+
+class BinanceClientBase:
+    """Connection state, request signing and order parameter building shared by BinanceAPI and AsyncBinanceAPI.
+
+    It has no endpoint methods: each client implements them on top of its own `_send`, so neither can
+    inherit one written for the other's I/O model.
+    """
+    # Keep-alive sessions shared by every Binance client (TradingBot, MarketAnalyzer, WhaleDetector),
+    # keyed by pool/retry settings so a config change gets a fresh pool instead of mutating a live one.
+    _http_sessions = {}
+    _http_sessions_lock = threading.Lock()
 
-class BinanceAPI:
     def __init__(self, config, chat_id_for_translation=None): # chat_id for error messages
         self.config = config
         self.api_key = config["api_key"]
         self.api_secret = config["api_secret"]
         self.base_url = BINANCE_TEST_API_URL if config["use_testnet"] else BINANCE_API_URL
         self.chat_id = chat_id_for_translation if chat_id_for_translation else (ADMIN_USER_IDS[0] if ADMIN_USER_IDS else None)
-
+        self.session = self._get_shared_session(config)
+        self.exchange_info = ExchangeInfoCache.for_base_url(self.base_url, config)
+        self.scheduler = RequestScheduler.for_base_url(self.base_url, config)
+        self.account_state = AccountStateCache.for_account(self.base_url, self.api_key, config, self.chat_id)
+
+    @classmethod
+    def _get_shared_session(cls, config):
+        pool_size = int(config.get("http_pool_size", 20))
+        max_retries = int(config.get("http_max_retries", 3))
+        backoff_factor = float(config.get("http_backoff_factor", 0.3))
+        session_key = (pool_size, max_retries, backoff_factor)
+        with cls._http_sessions_lock:
+            session = cls._http_sessions.get(session_key)
+            if session is None:
+                # Only idempotent methods are retried; a retried POST /order could open a position twice.
+                retry = Retry(total=max_retries, read=max_retries, connect=max_retries, backoff_factor=backoff_factor,
+                              status_forcelist=(500, 502, 503, 504), allowed_methods=frozenset(["GET", "PUT", "DELETE"]),
+                              respect_retry_after_header=True, raise_on_status=False)
+                adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry)
+                session = requests.Session()
+                session.mount("https://", adapter)
+                session.mount("http://", adapter)
+                cls._http_sessions[session_key] = session
+            return session
+
+    def _send_blocking(self, method, path, params=None, headers=None):
+        """Sends a request through the shared keep-alive session once the rate-limit scheduler admits it."""
+        self.scheduler.acquire(method, path, params)
+        timeout = BINANCE_ENDPOINT_TIMEOUTS.get((method, path), BINANCE_DEFAULT_TIMEOUT)
+        response = self.session.request(method, f"{self.base_url}{path}", params=params, headers=headers, timeout=timeout)
+        self.scheduler.record_response(response.status_code, response.headers)
+        return response
+
+    def used_weight_1m(self):
+        """Request weight used by this IP in the current minute (server-reported, plus requests in flight)."""
+        return self.scheduler.current_weight()
 
     def _generate_signature(self, data):
         query_string = urllib.parse.urlencode(data)
@@ -311,10 +803,36 @@ class BinanceAPI:
     def _get_headers(self):
         return {'X-MBX-APIKEY': self.api_key}
 
+    def _signed_params(self, params):
+        params = dict(params, timestamp=int(time.time() * 1000))
+        params['signature'] = self._generate_signature(params)
+        return params
+
+    def _build_order_params(self, symbol, side, order_type, quantity=None, price=None, time_in_force=None):
+        timestamp = int(time.time() * 1000)
+        params = {'symbol': symbol, 'side': side, 'type': order_type, 'timestamp': timestamp}
+
+        if quantity is not None:
+            # Round to the symbol's LOT_SIZE step from the cached exchangeInfo; plain 8-decimal formatting if unknown
+            formatted_quantity = self.exchange_info.format_quantity(symbol, quantity) or f"{float(quantity):.8f}".rstrip('0').rstrip('.')
+            params['quantity'] = formatted_quantity
+
+        if order_type != 'MARKET':
+            if price is not None:
+                formatted_price = self.exchange_info.format_price(symbol, price) or f"{float(price):.8f}".rstrip('0').rstrip('.')
+                params['price'] = formatted_price
+            if time_in_force:
+                params['timeInForce'] = time_in_force
+        return params
+
+class BinanceAPI(BinanceClientBase):
+    """Blocking Binance REST client, used from the worker threads."""
+    def _send(self, method, path, params=None, headers=None):
+        return self._send_blocking(method, path, params, headers)
+
     def get_exchange_info(self):
         try:
-            url = f"{self.base_url}/api/v3/exchangeInfo"
-            response = requests.get(url, timeout=10)
+            response = self._send("GET", "/api/v3/exchangeInfo")
             response.raise_for_status()
             return response.json()
         except requests.exceptions.RequestException as e:
@@ -326,12 +844,11 @@ class BinanceAPI:
 
     def get_account_info(self):
         try:
-            url = f"{self.base_url}/api/v3/account"
             timestamp = int(time.time() * 1000)
             params = {'timestamp': timestamp}
             params['signature'] = self._generate_signature(params)
             headers = self._get_headers()
-            response = requests.get(url, params=params, headers=headers, timeout=10)
+            response = self._send("GET", "/api/v3/account", params=params, headers=headers)
             response.raise_for_status()
             return response.json()
         except requests.exceptions.HTTPError as http_err:
@@ -344,11 +861,38 @@ class BinanceAPI:
             logger.error(_t("error_failed_decode_json", self.chat_id, source="account info", response_text=response.text if 'response' in locals() else 'No response'))
             return None
 
+    def get_cached_account_info(self):
+        """Account info from the user-data-stream cache; only hits /api/v3/account when the cache is stale."""
+        return self.account_state.get_account_info(self)
+
+    def create_listen_key(self):
+        try:
+            response = self._send("POST", "/api/v3/userDataStream", headers=self._get_headers())
+            response.raise_for_status()
+            return response.json().get('listenKey')
+        except (requests.exceptions.RequestException, ValueError) as e:
+            logger.error(f"Error creating user data stream listenKey: {e}")
+            return None
+
+    def keepalive_listen_key(self, listen_key):
+        try:
+            response = self._send("PUT", "/api/v3/userDataStream", params={'listenKey': listen_key}, headers=self._get_headers())
+            response.raise_for_status()
+            return True
+        except requests.exceptions.RequestException as e:
+            logger.warning(f"Error keeping user data stream listenKey alive: {e}")
+            return False
+
+    def close_listen_key(self, listen_key):
+        try:
+            self._send("DELETE", "/api/v3/userDataStream", params={'listenKey': listen_key}, headers=self._get_headers())
+        except requests.exceptions.RequestException as e:
+            logger.warning(f"Error closing user data stream listenKey: {e}")
+
     def get_ticker_price(self, symbol):
         try:
-            url = f"{self.base_url}/api/v3/ticker/price"
             params = {'symbol': symbol}
-            response = requests.get(url, params=params, timeout=5)
+            response = self._send("GET", "/api/v3/ticker/price", params=params)
             response.raise_for_status()
             return float(response.json()['price'])
         except requests.exceptions.RequestException as e:
@@ -360,11 +904,10 @@ class BinanceAPI:
 
     def get_ticker_24hr(self, symbol=None):
         try:
-            url = f"{self.base_url}/api/v3/ticker/24hr"
             params = {}
             if symbol:
                 params['symbol'] = symbol
-            response = requests.get(url, params=params, timeout=10)
+            response = self._send("GET", "/api/v3/ticker/24hr", params=params)
             response.raise_for_status()
             return response.json()
         except requests.exceptions.RequestException as e:
@@ -378,26 +921,12 @@ class BinanceAPI:
         request_params_for_log = {}
         try:
             url = f"{self.base_url}/api/v3/order"
-            timestamp = int(time.time() * 1000)
-            params = {'symbol': symbol, 'side': side, 'type': order_type, 'timestamp': timestamp}
-
-            if quantity is not None:
-                # This formatting should be improved by fetching stepSize from exchangeInfo
-                formatted_quantity = f"{float(quantity):.8f}".rstrip('0').rstrip('.')
-                params['quantity'] = formatted_quantity
-
-            if order_type != 'MARKET':
-                if price is not None:
-                    formatted_price = f"{float(price):.8f}".rstrip('0').rstrip('.')
-                    params['price'] = formatted_price
-                if time_in_force:
-                    params['timeInForce'] = time_in_force
-            
+            params = self._build_order_params(symbol, side, order_type, quantity, price, time_in_force)
             request_params_for_log = params.copy()
             params['signature'] = self._generate_signature(params)
 
             logger.info(f"Sending order to Binance: URL={url}, Params (pre-signature)={request_params_for_log}")
-            response = requests.post(url, params=params, headers=self._get_headers(), timeout=15)
+            response = self._send("POST", "/api/v3/order", params=params, headers=self._get_headers())
             logger.info(f"Binance order response: Status={response.status_code}, Text={response.text}")
 
             if response.status_code == 200:
@@ -417,13 +946,12 @@ class BinanceAPI:
 
     def get_open_orders(self, symbol=None):
         try:
-            url = f"{self.base_url}/api/v3/openOrders"
             timestamp = int(time.time() * 1000)
             params = {'timestamp': timestamp}
             if symbol:
                 params['symbol'] = symbol
             params['signature'] = self._generate_signature(params)
-            response = requests.get(url, params=params, headers=self._get_headers(), timeout=10)
+            response = self._send("GET", "/api/v3/openOrders", params=params, headers=self._get_headers())
             response.raise_for_status()
             return response.json()
         except requests.exceptions.RequestException as e:
@@ -435,11 +963,10 @@ class BinanceAPI:
 
     def cancel_order(self, symbol, order_id):
         try:
-            url = f"{self.base_url}/api/v3/order"
             timestamp = int(time.time() * 1000)
             params = {'symbol': symbol, 'orderId': order_id, 'timestamp': timestamp}
             params['signature'] = self._generate_signature(params)
-            response = requests.delete(url, params=params, headers=self._get_headers(), timeout=10)
+            response = self._send("DELETE", "/api/v3/order", params=params, headers=self._get_headers())
             response.raise_for_status()
             return response.json()
         except requests.exceptions.RequestException as e:
@@ -451,11 +978,10 @@ class BinanceAPI:
 
     def get_order(self, symbol, order_id):
         try:
-            url = f"{self.base_url}/api/v3/order"
             timestamp = int(time.time() * 1000)
             params = {'symbol': symbol, 'orderId': order_id, 'timestamp': timestamp}
             params['signature'] = self._generate_signature(params)
-            response = requests.get(url, params=params, headers=self._get_headers(), timeout=10)
+            response = self._send("GET", "/api/v3/order", params=params, headers=self._get_headers())
             response.raise_for_status()
             return response.json()
         except requests.exceptions.RequestException as e:
@@ -467,11 +993,10 @@ class BinanceAPI:
 
     def get_all_orders(self, symbol, limit=500):
         try:
-            url = f"{self.base_url}/api/v3/allOrders"
             timestamp = int(time.time() * 1000)
             params = {'symbol': symbol, 'limit': limit, 'timestamp': timestamp}
             params['signature'] = self._generate_signature(params)
-            response = requests.get(url, params=params, headers=self._get_headers(), timeout=15)
+            response = self._send("GET", "/api/v3/allOrders", params=params, headers=self._get_headers())
             response.raise_for_status()
             return response.json()
         except requests.exceptions.RequestException as e:
@@ -483,16 +1008,16 @@ class BinanceAPI:
 
     def get_bnb_pairs(self):
         try:
-            exchange_info = self.get_exchange_info()
-            if not exchange_info: return []
-            return [sym['symbol'] for sym in exchange_info['symbols'] if 'BNB' in sym['symbol'] and sym['status'] == 'TRADING']
+            self.exchange_info.ensure_fresh(self)
+            return sorted(self.exchange_info.trading_symbols_for_asset('BNB'))
         except Exception as e:
             logger.error(_t("error_getting_bnb_pairs", self.chat_id, e=e))
             return []
 
     def get_market_data(self):
         try:
-            bnb_pairs_filter = self.get_bnb_pairs()
+            self.exchange_info.ensure_fresh(self)
+            bnb_pairs_filter = self.exchange_info.trading_symbols_for_asset('BNB')
             if not bnb_pairs_filter:
                 logger.warning(_t("warning_no_bnb_pairs_from_exchange", self.chat_id))
                 return []
@@ -518,12 +1043,12 @@ class BinanceAPI:
             return []
 
     # --- NEW: Get K-lines for AI ---
-    def get_klines(self, symbol, interval='15m', limit=100):
-        """Get K-line/candlestick data for a symbol."""
+    def get_klines(self, symbol, interval='15m', limit=100, start_time=None):
+        """Get K-line/candlestick data for a symbol, the latest `limit` or the first `limit` from `start_time` (ms)."""
         try:
-            url = f"{self.base_url}/api/v3/klines"
             params = {'symbol': symbol, 'interval': interval, 'limit': limit}
-            response = requests.get(url, params=params, timeout=10)
+            if start_time is not None: params['startTime'] = start_time
+            response = self._send("GET", "/api/v3/klines", params=params)
             response.raise_for_status()
             # K-line data format:
             # [
@@ -539,127 +1064,1002 @@ class BinanceAPI:
             return None
     # --- END NEW ---
 
-class MarketAnalyzer:
+class AsyncBinanceAPI(BinanceClientBase):
+    """Awaitable counterpart of BinanceAPI for use on the python-telegram-bot event loop.
+
+    Signing, headers and order parameter building come from BinanceClientBase, so both clients send
+    identical requests; BinanceAPI stays the client for the worker threads. Only the methods defined
+    here exist: the listen-key, market-data and cached-account helpers are BinanceAPI-only.
+    """
+    _aiohttp_session = None
+    _aiohttp_session_loop = None
+
+    def _get_aiohttp_session(self):
+        loop = asyncio.get_running_loop()
+        cls = AsyncBinanceAPI
+        if cls._aiohttp_session is None or cls._aiohttp_session.closed or cls._aiohttp_session_loop is not loop:
+            connector = aiohttp.TCPConnector(limit=int(self.config.get("http_pool_size", 20)), keepalive_timeout=60)
+            cls._aiohttp_session = aiohttp.ClientSession(connector=connector)
+            cls._aiohttp_session_loop = loop
+        return cls._aiohttp_session
+
+    @classmethod
+    async def close_shared_session(cls):
+        if cls._aiohttp_session is not None and not cls._aiohttp_session.closed:
+            await cls._aiohttp_session.close()
+        cls._aiohttp_session = None
+        cls._aiohttp_session_loop = None
+
+    async def _send(self, method, path, params=None, headers=None):
+        """Returns (status_code, response_text). Transport errors and timeouts are raised to the caller."""
+        if aiohttp is None:
+            loop = asyncio.get_running_loop()
+            response = await loop.run_in_executor(None, functools.partial(self._send_blocking, method, path, params, headers))
+            return response.status_code, response.text
+        await self.scheduler.acquire_async(method, path, params)
+        timeout = aiohttp.ClientTimeout(total=BINANCE_ENDPOINT_TIMEOUTS.get((method, path), BINANCE_DEFAULT_TIMEOUT))
+        session = self._get_aiohttp_session()
+        async with session.request(method, f"{self.base_url}{path}", params=params, headers=headers, timeout=timeout) as response:
+            self.scheduler.record_response(response.status, response.headers)
+            return response.status, await response.text()
+
+    async def _get_json(self, method, path, params=None, headers=None, source=""):
+        """Sends a request and decodes the JSON body; returns None (after logging) on HTTP or decode errors."""
+        status_code, response_text = await self._send(method, path, params=params, headers=headers)
+        if status_code != 200:
+            logger.error(f"Binance {source} request failed: HTTP {status_code}: {response_text}")
+            return None
+        try:
+            return json.loads(response_text)
+        except json.JSONDecodeError:
+            logger.error(_t("error_failed_decode_json", self.chat_id, source=source, response_text=response_text))
+            return None
+
+    async def ping(self):
+        return await self._send("GET", "/api/v3/ping")
+
+    async def get_server_time(self):
+        server_time_data = await self._get_json("GET", "/api/v3/time", source="server time")
+        return server_time_data.get('serverTime') if isinstance(server_time_data, dict) else None
+
+    async def get_exchange_info(self):
+        try:
+            return await self._get_json("GET", "/api/v3/exchangeInfo", source="exchange info")
+        except Exception as e:
+            logger.error(f"Error getting exchange info: {e}")
+            return None
+
+    async def get_account_info(self):
+        try:
+            status_code, response_text = await self._send("GET", "/api/v3/account", params=self._signed_params({}), headers=self._get_headers())
+            if status_code != 200:
+                logger.error(_t("error_http_getting_account_info", self.chat_id, http_err=status_code, response_text=response_text))
+                return None
+            return json.loads(response_text)
+        except json.JSONDecodeError:
+            logger.error(_t("error_failed_decode_json", self.chat_id, source="account info", response_text=response_text))
+            return None
+        except Exception as e:
+            logger.error(_t("error_getting_account_info_generic", self.chat_id, e=e))
+            return None
+
+    async def get_ticker_price(self, symbol):
+        try:
+            ticker = await self._get_json("GET", "/api/v3/ticker/price", params={'symbol': symbol}, source="ticker price")
+            return float(ticker['price']) if ticker else None
+        except (KeyError, ValueError, TypeError):
+            logger.error(_t("error_parse_ticker_price", self.chat_id, symbol=symbol, response_text=ticker))
+            return None
+        except Exception as e:
+            logger.error(_t("error_getting_ticker_price", self.chat_id, symbol=symbol, e=e))
+            return None
+
+    async def get_ticker_24hr(self, symbol=None):
+        try:
+            return await self._get_json("GET", "/api/v3/ticker/24hr", params={'symbol': symbol} if symbol else {}, source="24hr ticker")
+        except Exception as e:
+            logger.error(_t("error_getting_24hr_ticker", self.chat_id, e=e))
+            return None
+
+    async def get_klines(self, symbol, interval='15m', limit=100, start_time=None):
+        params = {'symbol': symbol, 'interval': interval, 'limit': limit}
+        if start_time is not None: params['startTime'] = start_time
+        try:
+            return await self._get_json("GET", "/api/v3/klines", params=params, source="klines")
+        except Exception as e:
+            logger.error(f"Error getting klines for {symbol} interval {interval}: {e}")
+            return None
+
+    async def create_order(self, symbol, side, order_type, quantity=None, price=None, time_in_force=None):
+        request_params_for_log = {}
+        try:
+            params = self._build_order_params(symbol, side, order_type, quantity, price, time_in_force)
+            request_params_for_log = params.copy()
+            params['signature'] = self._generate_signature(params)
+            logger.info(f"Sending order to Binance (async): Params (pre-signature)={request_params_for_log}")
+            status_code, response_text = await self._send("POST", "/api/v3/order", params=params, headers=self._get_headers())
+            logger.info(f"Binance order response: Status={status_code}, Text={response_text}")
+            if status_code != 200:
+                logger.error(_t("error_failed_create_order_binance", self.chat_id,
+                                symbol=symbol, status_code=status_code,
+                                response_text=response_text, sent_params=request_params_for_log))
+            try:
+                return json.loads(response_text)
+            except json.JSONDecodeError:
+                return {"error_message": response_text, "status_code": status_code}
+        except Exception as e:
+            logger.error(_t("error_exception_creating_order", self.chat_id,
+                            symbol=symbol, e=e, sent_params=request_params_for_log), exc_info=True)
+            return None
+
+    async def get_open_orders(self, symbol=None):
+        try:
+            return await self._get_json("GET", "/api/v3/openOrders", params=self._signed_params({'symbol': symbol} if symbol else {}),
+                                        headers=self._get_headers(), source="open orders")
+        except Exception as e:
+            logger.error(_t("error_getting_open_orders", self.chat_id, e=e))
+            return None
+
+    async def cancel_order(self, symbol, order_id):
+        try:
+            return await self._get_json("DELETE", "/api/v3/order", params=self._signed_params({'symbol': symbol, 'orderId': order_id}),
+                                        headers=self._get_headers(), source="cancel order")
+        except Exception as e:
+            logger.error(_t("error_canceling_order", self.chat_id, order_id=order_id, symbol=symbol, e=e))
+            return None
+
+    async def get_order(self, symbol, order_id):
+        try:
+            return await self._get_json("GET", "/api/v3/order", params=self._signed_params({'symbol': symbol, 'orderId': order_id}),
+                                        headers=self._get_headers(), source="get order")
+        except Exception as e:
+            logger.error(_t("error_getting_order", self.chat_id, order_id=order_id, symbol=symbol, e=e))
+            return None
+
+    async def get_all_orders(self, symbol, limit=500):
+        try:
+            return await self._get_json("GET", "/api/v3/allOrders", params=self._signed_params({'symbol': symbol, 'limit': limit}),
+                                        headers=self._get_headers(), source="all orders")
+        except Exception as e:
+            logger.error(_t("error_getting_all_orders", self.chat_id, symbol=symbol, e=e))
+            return None
+
+class StreamRecorder:
+    """Appends live market stream messages to a JSON-lines file that MarketReplay can play back.
+
+    Every recording stream writing to the same file shares one recorder (`for_path`). Each line is
+    {"t": receive time in ms, "stream": stream name, "data": message payload}.
+    """
+    _instances = {}
+    _instances_lock = threading.Lock()
+    FLUSH_INTERVAL = 1.0 # seconds of messages a crash can lose
+
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        self.file = open(path, "a", encoding="utf-8")
+        self.last_flush = time.time()
+        self.count = 0
+
+    @classmethod
+    def for_path(cls, path):
+        with cls._instances_lock:
+            if path not in cls._instances:
+                cls._instances[path] = cls(path)
+            return cls._instances[path]
+
+    def record(self, stream_name, data):
+        now = time.time()
+        line = json.dumps({"t": int(now * 1000), "stream": stream_name, "data": data}, separators=(",", ":"))
+        with self.lock:
+            self.file.write(line + "\n")
+            self.count += 1
+            if now - self.last_flush > self.FLUSH_INTERVAL:
+                self.file.flush()
+                self.last_flush = now
+
+    def flush(self):
+        with self.lock:
+            self.file.flush()
+            self.last_flush = time.time()
+
+class MarketReplay:
+    """Plays a StreamRecorder file back into the bot on a ReplayClock.
+
+    Each message is handed, on the replay thread, to the handler registered for its stream type
+    ("miniTicker", "bookTicker", "aggTrade", "kline"), just as BinanceStream delivers it live.
+    `speed` is virtual seconds per real second, from 1 (real time) to MAX_SPEED; 0 replays as fast as
+    the consumers keep up, and other values raise ValueError. After the last message the clock runs on for `drain_seconds`, so trades
+    still open can reach their time limit.
+    """
+    MAX_SPEED = 1000
+
+    def __init__(self, path, speed=1.0, seed=0, drain_seconds=0):
+        self.path = path
+        speed = float(speed)
+        if speed != 0 and not 1 <= speed <= self.MAX_SPEED:
+            raise ValueError(f"Replay speed must be 0 or from 1 to {self.MAX_SPEED}, not {speed:g}")
+        self.speed = speed
+        self.drain_seconds = drain_seconds
+        self.handlers = {} # stream type -> callback(stream_name, data)
+        first_time = None
+        with open(path, encoding="utf-8") as f:
+            for line in f: # the first line `_run` can use; it skips the unparsable ones too
+                try:
+                    first_time = json.loads(line)["t"] / 1000
+                    break
+                except (ValueError, KeyError, TypeError):
+                    continue
+        self.clock = ReplayClock(time.time() if first_time is None else first_time, seed)
+        self.start_time = self.clock.time()
+        self.running = False
+        self.thread = None
+        self.finished = threading.Event()
+        self.event_count = 0
+        self.skipped_count = 0 # unparsable lines and stream types nobody handles
+        self.max_lag = 0.0 # real seconds the replay fell behind `speed`
+        self.elapsed = 0.0
+
+    @staticmethod
+    def stream_kind(stream_name):
+        """"!miniTicker@arr" -> "miniTicker", "bnbusdt@kline_1m" -> "kline", "bnbusdt@aggTrade" -> "aggTrade"."""
+        name, _, suffix = stream_name.lstrip("!").partition("@")
+        return (name if suffix == "arr" else suffix).split("_", 1)[0]
+
+    def on(self, kind, callback):
+        self.handlers[kind] = callback
+
+    def start(self, consumers=0):
+        """Starts replaying once `consumers` inboxes are registered with the clock (the bot's loops).
+        A replay runs once: its clock does not go back."""
+        if not self.running and self.thread is None:
+            self.running = True
+            self.thread = threading.Thread(target=self._run, args=(consumers,), name="market-replay")
+            self.thread.daemon = True
+            self.thread.start()
+            return True
+        return False
+
+    def stop(self):
+        if self.running:
+            self.running = False
+            self.clock.stop()
+            if self.thread and self.thread.is_alive() and self.thread is not threading.current_thread():
+                self.thread.join(timeout=5.0)
+            return True
+        return False
+
+    def _run(self, consumers):
+        started = time.perf_counter()
+        self.clock.settle(consumers)
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                for line in f:
+                    if not self.running: break
+                    try:
+                        message = json.loads(line)
+                        event_time, stream_name, data = message["t"] / 1000, message["stream"], message["data"]
+                    except (ValueError, KeyError, TypeError):
+                        self.skipped_count += 1
+                        continue
+                    handler = self.handlers.get(self.stream_kind(stream_name))
+                    if handler is None:
+                        self.skipped_count += 1
+                        continue
+                    self._advance(event_time, started)
+                    try:
+                        handler(stream_name, data)
+                    except Exception as e:
+                        logger.error(f"Replay handler for {stream_name} failed: {e}", exc_info=True)
+                    self.event_count += 1
+                    self.clock.settle()
+            if self.running and self.drain_seconds:
+                self._advance(self.clock.time() + self.drain_seconds, started)
+        except Exception as e:
+            logger.error(f"Replay of {self.path} failed: {e}", exc_info=True)
+        finally:
+            self.elapsed = time.perf_counter() - started
+            self.finished.set()
+            logger.info(f"Replay of {self.path} finished: {self.event_count} events ({self.skipped_count} skipped), "
+                        f"{self.clock.time() - self.start_time:.0f}s of market time in {self.elapsed:.1f}s, max lag {self.max_lag:.2f}s.")
+
+    def _advance(self, target, started):
+        """Moves the clock forward to `target`, stopping at every consumer deadline on the way."""
+        while self.running and self.clock.time() < target:
+            deadline = self.clock.next_deadline()
+            step = target if deadline is None or deadline > target else deadline
+            if self.speed:
+                behind = time.perf_counter() - started - (step - self.start_time) / self.speed
+                if behind < 0: time.sleep(-behind)
+                else: self.max_lag = max(self.max_lag, behind)
+            self.clock.advance(step)
+            self.clock.settle()
+
+class BinanceStream:
+    """Background websocket client for Binance combined streams.
+
+    Runs in a daemon thread, reconnects with exponential backoff, treats a silent connection as dead
+    after `stream_stale_timeout` seconds and reports how long the feed was down through `on_reconnect`.
+    Streams can be added or removed while connected. Streams that can stay quiet for long (the user
+    data stream) set `ping_interval`: a quiet connection is pinged that often and the pong counts as traffic.
+    """
+    def __init__(self, config, streams, on_message, on_reconnect=None, name="stream", chat_id_for_translation=None, stale_timeout=None, record=False,
+                 ping_interval=None):
+        self.config = config
+        self.name = name
+        self.on_message = on_message # on_message(stream_name, data)
+        self.on_reconnect = on_reconnect # on_reconnect(gap_seconds)
+        self.chat_id = chat_id_for_translation if chat_id_for_translation else (ADMIN_USER_IDS[0] if ADMIN_USER_IDS else None)
+        self.streams = set(streams)
+        self.base_url = config.get("binance_ws_url") or (BINANCE_TEST_WS_URL if config.get("use_testnet") else BINANCE_WS_URL)
+        self.stale_timeout = stale_timeout if stale_timeout is not None else config.get("stream_stale_timeout", 15)
+        self.ping_interval = ping_interval
+        self.last_ping_time = 0
+        self.running = False
+        self.thread = None
+        self.ws = None
+        self.lock = threading.Lock()
+        self.last_message_time = 0
+        self.connected_since = 0
+        self.reconnect_count = 0
+        self.message_count = 0
+        self._request_id = 0
+        # Public market streams are copied to `record_streams_file` for MarketReplay; private ones never are
+        self.recorder = StreamRecorder.for_path(config["record_streams_file"]) if record and config.get("record_streams_file") else None
+
+    def is_healthy(self):
+        return self.ws is not None and time.time() - self.last_message_time < self.stale_timeout
+
+    def start(self):
+        if websocket is None:
+            logger.warning(f"websocket-client is not installed; {self.name} stream disabled.")
+            return False
+        if not self.running:
+            self.running = True
+            self.thread = threading.Thread(target=self._run, name=f"{self.name}-ws")
+            self.thread.daemon = True
+            self.thread.start()
+            return True
+        return False
+
+    def stop(self):
+        if self.running:
+            self.running = False
+            self._close()
+            if self.thread and self.thread.is_alive():
+                self.thread.join(timeout=5.0)
+            if self.recorder is not None:
+                self.recorder.flush()
+            return True
+        return False
+
+    def subscribe(self, streams):
+        new_streams = set(streams) - self.streams
+        if new_streams:
+            self.streams |= new_streams
+            self._send_control("SUBSCRIBE", new_streams)
+
+    def unsubscribe(self, streams):
+        old_streams = set(streams) & self.streams
+        if old_streams:
+            self.streams -= old_streams
+            self._send_control("UNSUBSCRIBE", old_streams)
+
+    def _send_control(self, method, streams):
+        with self.lock:
+            if self.ws is None: return # Picked up from self.streams on the next connect
+            self._request_id += 1
+            try:
+                self.ws.send(json.dumps({"method": method, "params": sorted(streams), "id": self._request_id}))
+            except Exception as e:
+                logger.warning(f"{self.name} stream: failed to send {method} for {sorted(streams)}: {e}")
+
+    def _close(self):
+        with self.lock:
+            ws, self.ws = self.ws, None
+        if ws is not None:
+            try: ws.close()
+            except Exception: pass
+
+    def _run(self):
+        backoff = 1
+        disconnected_at = None
+        while self.running:
+            if not self.streams:
+                time.sleep(0.5)
+                continue
+            try:
+                url = f"{self.base_url}/stream?streams={'/'.join(sorted(self.streams))}"
+                ws = websocket.create_connection(url, timeout=10)
+                ws.settimeout(1.0)
+                with self.lock:
+                    self.ws = ws
+                self.connected_since = self.last_message_time = time.time()
+                logger.info(f"{self.name} stream connected ({len(self.streams)} streams).")
+                if disconnected_at is not None:
+                    self.reconnect_count += 1
+                    if self.on_reconnect:
+                        self.on_reconnect(self.connected_since - disconnected_at)
+                    disconnected_at = None
+                backoff = 1
+                self._receive_loop(ws)
+            except Exception as e:
+                if self.running:
+                    logger.warning(f"{self.name} stream error: {e}. Reconnecting in {backoff}s.")
+            finally:
+                self._close()
+            if disconnected_at is None and self.connected_since:
+                disconnected_at = self.last_message_time # Data is missing from the last frame received, not from the error
+            if self.running:
+                time.sleep(backoff)
+                backoff = min(backoff * 2, 60)
+
+    def _receive_loop(self, ws):
+        while self.running and self.ws is ws:
+            try:
+                opcode, raw = ws.recv_data(control_frame=True)
+            except websocket.WebSocketTimeoutException:
+                now = time.time()
+                if now - self.last_message_time > self.stale_timeout:
+                    logger.warning(f"{self.name} stream silent for {self.stale_timeout}s, reconnecting.")
+                    return
+                if self.ping_interval and now - max(self.last_message_time, self.last_ping_time) >= self.ping_interval:
+                    self.last_ping_time = now
+                    ws.ping()
+                continue
+            if opcode == websocket.ABNF.OPCODE_PONG:
+                self.last_message_time = time.time() # alive, even without events
+                continue
+            if opcode == websocket.ABNF.OPCODE_PING: continue # answered by websocket-client
+            if opcode == websocket.ABNF.OPCODE_CLOSE or not raw: return # Server closed the connection
+            self.last_message_time = time.time()
+            self.message_count += 1
+            try: # one bad frame is skipped, it does not cost the connection
+                message = json.loads(raw)
+                if not isinstance(message, dict) or "stream" not in message: continue # SUBSCRIBE/UNSUBSCRIBE acknowledgements
+                if self.recorder is not None:
+                    self.recorder.record(message["stream"], message["data"])
+                self.on_message(message["stream"], message["data"])
+            except Exception as e:
+                logger.error(f"{self.name} stream: error handling message {raw[:200]!r}: {e}", exc_info=True)
+
+class PriceFeed:
+    """Best bid/ask cache for the symbols we hold, fed by @bookTicker streams.
+
+    Every tick is published as EVENT_PRICE_TICK, so the trade monitor reacts to the crossing price
+    instead of its next polling round.
+    """
+    def __init__(self, config, chat_id_for_translation=None, event_bus=None, clock=None):
+        self.config = config
+        self.event_bus = event_bus
+        self.clock = clock or SYSTEM_CLOCK
+        self.prices = {} # symbol -> (bid, ask, received_at)
+        self.lock = threading.Lock()
+        self.stream = BinanceStream(config, [], self._on_book_ticker, name="price-feed", chat_id_for_translation=chat_id_for_translation, record=True)
+
+    def start(self):
+        return self.stream.start()
+
+    def stop(self):
+        return self.stream.stop()
+
+    def is_live(self):
+        return self.stream.running and self.stream.is_healthy()
+
+    def set_symbols(self, symbols):
+        """Subscribes to exactly `symbols`, dropping streams (and cached prices) for anything else."""
+        wanted = {f"{symbol.lower()}@bookTicker" for symbol in symbols}
+        self.stream.unsubscribe(self.stream.streams - wanted)
+        self.stream.subscribe(wanted)
+        with self.lock:
+            for symbol in [s for s in self.prices if s not in symbols]:
+                del self.prices[symbol]
+
+    def get_exit_price(self, symbol, trade_type):
+        """Price a position could be closed at right now: the bid for longs, the ask for shorts. None if unknown or stale."""
+        quote = self.prices.get(symbol)
+        if quote is None or self.clock.time() - quote[2] > self.config.get("stream_stale_timeout", 15):
+            return None
+        return quote[0] if trade_type == "BUY" else quote[1]
+
+    def _on_book_ticker(self, stream_name, data):
+        try:
+            symbol, bid, ask = data['s'], float(data['b']), float(data['a'])
+        except (KeyError, ValueError, TypeError):
+            return
+        with self.lock:
+            self.prices[symbol] = (bid, ask, self.clock.time())
+        if self.event_bus is not None:
+            self.event_bus.publish(EVENT_PRICE_TICK, symbol=symbol)
+
+class AccountStateCache:
+    """Balances of one Binance account, kept current by the user data stream.
+
+    outboundAccountPosition events patch the cached balances in place, so reads cost no request
+    while the stream is connected. Without the stream, or after an order whose fill has not been
+    reflected yet, a signed /api/v3/account refresh is made once the copy is `account_cache_ttl` old.
+    """
+    _instances = {}
+    _instances_lock = threading.Lock()
+    LISTEN_KEY_KEEPALIVE_SECONDS = 30 * 60 # listenKeys expire after 60 minutes without a keep-alive
+    STREAM_PING_SECONDS = 30 # the user data stream can be quiet for hours, so its liveness comes from ping/pong
+
     def __init__(self, config, chat_id_for_translation=None):
         self.config = config
-        self.market_data = INITIAL_MARKET_DATA.copy() if config["mock_mode"] else []
+        self.chat_id = chat_id_for_translation
+        self.lock = threading.Lock()
+        self.account_fields = None # /api/v3/account response without 'balances'
+        self.balances = {} # asset -> {'asset', 'free', 'locked'}
+        self.updated_at = 0
+        self.stream_updated_at = 0
+        self.needs_refresh = False # set by our own orders, fills and stream gaps until the balances catch up
+        self.binance_api = None
+        self.listen_key = None
+        self.stream = None
+        self.running = False
+        self.keepalive_thread = None
+
+    @classmethod
+    def for_account(cls, base_url, api_key, config, chat_id_for_translation=None):
+        with cls._instances_lock:
+            key = (base_url, api_key)
+            if key not in cls._instances:
+                cls._instances[key] = cls(config, chat_id_for_translation)
+            return cls._instances[key]
+
+    def is_live(self):
+        return self.running and self.stream is not None and self.stream.is_healthy()
+
+    def _is_fresh(self):
+        if self.account_fields is None or self.needs_refresh: return False
+        return self.is_live() or time.time() - self.updated_at < self.config.get("account_cache_ttl", 30)
+
+    def _account_info(self):
+        return dict(self.account_fields, balances=[dict(balance) for balance in self.balances.values()])
+
+    def cached_account_info(self):
+        """Cached account info if it is fresh, else None. Never makes a request."""
+        with self.lock:
+            return self._account_info() if self._is_fresh() else None
+
+    def get_account_info(self, binance_api):
+        account_info = self.cached_account_info()
+        return account_info if account_info is not None else self.refresh(binance_api)
+
+    def refresh(self, binance_api):
+        requested_at = time.time()
+        account_info = binance_api.get_account_info()
+        if not account_info or 'balances' not in account_info:
+            return account_info
+        with self.lock:
+            if self.stream_updated_at > requested_at and not self.needs_refresh:
+                return self._account_info() # A stream event is newer than this response
+            self.account_fields = {k: v for k, v in account_info.items() if k != 'balances'}
+            self.balances = {balance['asset']: dict(balance) for balance in account_info['balances']}
+            self.updated_at, self.needs_refresh = time.time(), False
+        return account_info
+
+    def invalidate(self):
+        """Forces the next read to refresh; called after we place an order."""
+        with self.lock:
+            self.needs_refresh = True
+
+    def start(self, binance_api):
+        self.binance_api = binance_api
+        if self.running or websocket is None or not self.config.get("account_stream", True):
+            return False
+        listen_key = binance_api.create_listen_key()
+        if not listen_key:
+            logger.warning("User data stream unavailable; account balances will be refreshed over REST.")
+            return False
+        self.listen_key, self.running = listen_key, True
+        self.stream = BinanceStream(self.config, [listen_key], self._on_user_event, on_reconnect=self._on_stream_reconnect,
+                                    name="user-data", chat_id_for_translation=self.chat_id,
+                                    stale_timeout=3 * self.STREAM_PING_SECONDS, ping_interval=self.STREAM_PING_SECONDS)
+        self.stream.start()
+        self.keepalive_thread = threading.Thread(target=self._keepalive_loop, name="listen-key-keepalive")
+        self.keepalive_thread.daemon = True
+        self.keepalive_thread.start()
+        self.refresh(binance_api)
+        return True
+
+    def stop(self):
+        if not self.running: return False
+        self.running = False
+        self.stream.stop()
+        if self.keepalive_thread and self.keepalive_thread.is_alive():
+            self.keepalive_thread.join(timeout=5.0)
+        if self.listen_key:
+            self.binance_api.close_listen_key(self.listen_key)
+            self.listen_key = None
+        return True
+
+    def _keepalive_loop(self):
+        last_keepalive = time.time()
+        while self.running:
+            time.sleep(1)
+            if time.time() - last_keepalive < self.LISTEN_KEY_KEEPALIVE_SECONDS: continue
+            last_keepalive = time.time()
+            if not self.binance_api.keepalive_listen_key(self.listen_key):
+                self._renew_listen_key()
+
+    def _renew_listen_key(self):
+        listen_key = self.binance_api.create_listen_key()
+        if not listen_key: return
+        old_listen_key, self.listen_key = self.listen_key, listen_key
+        self.stream.subscribe([listen_key])
+        self.stream.unsubscribe([old_listen_key])
+        self.invalidate() # Events may have been lost while the old key was dead
+        logger.info("User data stream listenKey renewed.")
+
+    def _on_stream_reconnect(self, gap_seconds):
+        self.invalidate()
+
+    def _on_user_event(self, stream_name, data):
+        event_type = data.get('e')
+        if event_type == 'outboundAccountPosition':
+            with self.lock:
+                for balance in data.get('B', []):
+                    self.balances[balance['a']] = {'asset': balance['a'], 'free': balance['f'], 'locked': balance['l']}
+                self.stream_updated_at = time.time()
+                self.needs_refresh = False
+        elif event_type == 'executionReport':
+            if data.get('x') == 'TRADE': # outboundAccountPosition for this fill follows
+                with self.lock:
+                    self.needs_refresh = True
+            logger.info(f"Order update {data.get('s')} #{data.get('i')}: {data.get('X')} (filled {data.get('z')})")
+        elif event_type == 'listenKeyExpired':
+            logger.warning("User data stream listenKey expired, renewing.")
+            self._renew_listen_key()
+
+class MarketSnapshot:
+    """Columnar 24h ticker table: one NumPy array per field plus a pair -> row index.
+
+    Filtering, scoring and top-k selection over thousands of symbols are single vectorized
+    passes; stream frames update a row in place through the index.
+    """
+    FIELDS = ('volume', 'quote_volume', 'price_change', 'last_price')
+
+    def __init__(self, rows=(), capacity=64):
+        self.pairs = []
+        self.index = {}
+        self.size = 0
+        self.columns = {field: np.zeros(capacity) for field in self.FIELDS}
+        self.bnb_base = np.zeros(capacity, dtype=bool)
+        self.bnb_quote = np.zeros(capacity, dtype=bool)
+        for row in rows:
+            self.upsert(row['pair'], row.get('volume', 0), row.get('quote_volume', 0), row.get('price_change', 0), row.get('last_price', 0))
+
+    def __len__(self):
+        return self.size
+
+    def _grow(self):
+        capacity = max(64, len(self.bnb_base) * 2)
+        for field in self.FIELDS:
+            self.columns[field] = np.resize(self.columns[field], capacity)
+        self.bnb_base = np.resize(self.bnb_base, capacity)
+        self.bnb_quote = np.resize(self.bnb_quote, capacity)
+
+    def upsert(self, pair, volume, quote_volume, price_change, last_price):
+        i = self.index.get(pair)
+        if i is None:
+            if self.size == len(self.bnb_base): self._grow()
+            i = self.size
+            self.index[pair] = i
+            self.pairs.append(pair)
+            self.bnb_base[i] = pair.startswith("BNB")
+            self.bnb_quote[i] = pair.endswith("BNB")
+            self.size += 1
+        columns = self.columns
+        columns['volume'][i], columns['quote_volume'][i] = volume, quote_volume
+        columns['price_change'][i], columns['last_price'][i] = price_change, last_price
+
+    def remove(self, pair):
+        """Removes a pair by moving the last row into its slot."""
+        i = self.index.pop(pair)
+        last = self.size - 1
+        if i != last:
+            moved_pair = self.pairs[last]
+            self.pairs[i] = moved_pair
+            self.index[moved_pair] = i
+            for field in self.FIELDS:
+                self.columns[field][i] = self.columns[field][last]
+            self.bnb_base[i], self.bnb_quote[i] = self.bnb_base[last], self.bnb_quote[last]
+        self.pairs.pop()
+        self.size -= 1
+
+    def column(self, field):
+        return self.columns[field][:self.size]
+
+    def row(self, pair):
+        i = self.index.get(pair)
+        return self._row_at(i) if i is not None else None
+
+    def _row_at(self, i):
+        row = {'pair': self.pairs[i]}
+        for field in self.FIELDS:
+            row[field] = float(self.columns[field][i])
+        return row
+
+    def rows(self, positions=None):
+        return [self._row_at(i) for i in (range(self.size) if positions is None else positions)]
+
+    def top_k(self, scores, limit, mask=None):
+        """Row positions of the `limit` highest scores (optionally within `mask`), best first."""
+        candidates = np.flatnonzero(mask) if mask is not None else np.arange(len(scores))
+        if limit <= 0 or len(candidates) == 0: return []
+        candidate_scores = scores[candidates]
+        if len(candidates) > limit:
+            keep = np.argpartition(-candidate_scores, limit - 1)[:limit]
+            candidates, candidate_scores = candidates[keep], candidate_scores[keep]
+        return candidates[np.argsort(-candidate_scores, kind='stable')].tolist()
+
+class MarketAnalyzer:
+    def __init__(self, config, chat_id_for_translation=None, clock=None):
+        self.config = config
+        self.clock = clock or SYSTEM_CLOCK
+        self.replaying = bool(config.get("replay_file")) # fed only by MarketReplay: no REST, no mock data
+        self.snapshot = MarketSnapshot(INITIAL_MARKET_DATA if config["mock_mode"] and not self.replaying else [])
         self.last_update = 0
         self.update_interval = config["market_update_interval"]
         self.update_thread = None
         self.running = False
-        self.lock = threading.Lock()
+        self.lock = threading.RLock()
+        self._rng = np.random.default_rng()
         self.chat_id = chat_id_for_translation if chat_id_for_translation else (ADMIN_USER_IDS[0] if ADMIN_USER_IDS else None)
         self.binance_api = BinanceAPI(config, self.chat_id) if config["api_key"] and config["api_secret"] else None
+        self.market_stream = None
+        self._stream_symbols = set() # BNB symbols from the last REST snapshot; the stream ignores everything else
+        self._resync_requested = False
+        self._wake = threading.Event()
+        self.event_bus = None # set by TradingBot; receives EVENT_MARKET_UPDATED after every snapshot change
 
 
+    @property
+    def market_data(self):
+        """Row-dict copy of the snapshot, for callers that want plain dicts."""
+        with self.lock:
+            return self.snapshot.rows()
+
+    @market_data.setter
+    def market_data(self, rows):
+        with self.lock:
+            self.snapshot = MarketSnapshot(rows)
+
     def start_updating(self):
         if not self.running:
             self.running = True
+            if self.replaying: return True
             self.update_thread = threading.Thread(target=self.update_loop)
             self.update_thread.daemon = True
             self.update_thread.start()
+            self._start_market_stream()
             return True
         return False
 
     def stop_updating(self):
         if self.running:
             self.running = False
+            self._wake.set()
+            if self.market_stream: self.market_stream.stop()
             if self.update_thread and self.update_thread.is_alive():
                 self.update_thread.join(timeout=5.0)
             return True
         return False
 
+    def _start_market_stream(self):
+        if not (self.config.get("market_data_stream", True) and self.binance_api and not self.config.get("mock_mode", True)):
+            return
+        if self.market_stream is None:
+            self.market_stream = BinanceStream(self.config, ["!miniTicker@arr"], self._on_mini_ticker_frame,
+                                               on_reconnect=self._on_stream_reconnect, name="market-data",
+                                               chat_id_for_translation=self.chat_id, record=True)
+        self.market_stream.start()
+
+    def _stream_is_live(self):
+        return self.market_stream is not None and self.market_stream.is_healthy() and len(self.snapshot) > 0
+
+    def _on_stream_reconnect(self, gap_seconds):
+        if gap_seconds > self.config.get("stream_gap_resync_seconds", 5):
+            logger.warning(f"Market data stream was down for {gap_seconds:.1f}s; resyncing snapshot over REST.")
+            self._resync_requested = True
+            self._wake.set()
+
+    def _on_mini_ticker_frame(self, stream_name, tickers):
+        if self.config.get("mock_mode", True): return
+        if isinstance(tickers, dict): tickers = [tickers] # <symbol>@miniTicker instead of the all-market array
+        with self.lock:
+            for ticker in tickers:
+                symbol = ticker.get('s')
+                # A replay has no REST snapshot to take the symbol list from, so it keeps every BNB pair
+                if symbol not in self._stream_symbols and not (self.replaying and symbol and "BNB" in symbol): continue
+                try:
+                    last_price, open_price = float(ticker['c']), float(ticker['o'])
+                    volume, quote_volume = float(ticker['v']), float(ticker['q'])
+                except (KeyError, ValueError, TypeError):
+                    continue
+                self.snapshot.upsert(symbol, volume, quote_volume,
+                                     (last_price - open_price) / open_price * 100 if open_price else 0.0, last_price)
+            self.last_update = self.clock.time()
+        self._publish_update()
+
+    def _publish_update(self):
+        if self.event_bus is not None:
+            self.event_bus.publish(EVENT_MARKET_UPDATED)
+
     def update_loop(self):
         while self.running:
             try:
-                self.update_market_data()
-                time.sleep(self.update_interval)
+                # While the websocket is live it keeps market_data current; REST is only the seed and the gap filler.
+                if self._resync_requested or not self._stream_is_live():
+                    self._resync_requested = False
+                    self.update_market_data()
+                self._wake.wait(self.update_interval)
+                self._wake.clear()
             except Exception as e:
                 logger.error(_t("error_market_update_loop", self.chat_id, e=e), exc_info=True)
                 time.sleep(self.update_interval * 2)
 
     def update_market_data(self):
+        # Download outside the lock so readers of the current snapshot never wait on Binance
+        real_market_data = None
+        if self.binance_api and not self.config.get("mock_mode", True):
+            real_market_data = self.binance_api.get_market_data()
         with self.lock:
             self.last_update = time.time()
-            if self.binance_api and not self.config.get("mock_mode", True):
-                real_market_data = self.binance_api.get_market_data()
-                if real_market_data:
-                    self.market_data = real_market_data
-                    logger.info(_t("info_updated_market_data_binance", self.chat_id, count=len(real_market_data)))
-                    return
-            if self.config.get("mock_mode", True):
+            if real_market_data:
+                self.snapshot = MarketSnapshot(real_market_data)
+                self._stream_symbols = set(self.snapshot.index)
+                logger.info(_t("info_updated_market_data_binance", self.chat_id, count=len(real_market_data)))
+            elif self.config.get("mock_mode", True):
                 logger.info(_t("info_using_mock_market_data", self.chat_id))
-                for pair_data in self.market_data:
-                    pair_data["volume"] = max(0, pair_data["volume"] * (1 + random.uniform(-0.05, 0.15)))
-                    pair_data["price_change"] += random.uniform(-2, 3)
-                    pair_data["last_price"] = max(1e-8, pair_data["last_price"] * (1 + random.uniform(-0.01, 0.02)))
-                    pair_data["quote_volume"] = pair_data["volume"] * pair_data["last_price"]
-                if random.random() < 0.2 and len(ADDITIONAL_PAIRS) > 0 and len(self.market_data) < 20:
+                snapshot, n = self.snapshot, len(self.snapshot)
+                volume, quote_volume = snapshot.column('volume'), snapshot.column('quote_volume')
+                price_change, last_price = snapshot.column('price_change'), snapshot.column('last_price')
+                volume[:] = np.maximum(0, volume * (1 + self._rng.uniform(-0.05, 0.15, n)))
+                price_change += self._rng.uniform(-2, 3, n)
+                last_price[:] = np.maximum(1e-8, last_price * (1 + self._rng.uniform(-0.01, 0.02, n)))
+                quote_volume[:] = volume * last_price
+                if random.random() < 0.2 and len(ADDITIONAL_PAIRS) > 0 and n < 20:
                     new_pair = random.choice(ADDITIONAL_PAIRS).copy()
                     new_pair["volume"] = random.uniform(500, 2000)
                     new_pair["price_change"] = random.uniform(-20, 20)
                     new_pair["last_price"] *= (1 + random.uniform(-0.2, 0.2))
                     new_pair["quote_volume"] = new_pair["volume"] * new_pair["last_price"]
-                    if not any(p["pair"] == new_pair["pair"] for p in self.market_data):
-                        self.market_data.append(new_pair)
+                    if new_pair["pair"] not in snapshot.index:
+                        snapshot.upsert(new_pair["pair"], new_pair["volume"], new_pair["quote_volume"], new_pair["price_change"], new_pair["last_price"])
                         logger.info(_t("info_added_mock_trending_pair", self.chat_id, pair_name=new_pair['pair']))
-                if len(self.market_data) > 10 and random.random() < 0.3:
-                    removed_pair = self.market_data.pop(random.randrange(len(self.market_data)))
-                    logger.info(_t("info_removed_mock_low_volume_pair", self.chat_id, pair_name=removed_pair['pair']))
+                if len(snapshot) > 10 and random.random() < 0.3:
+                    removed_pair = snapshot.pairs[random.randrange(len(snapshot))]
+                    snapshot.remove(removed_pair)
+                    logger.info(_t("info_removed_mock_low_volume_pair", self.chat_id, pair_name=removed_pair))
+            else:
+                return
+        self._publish_update()
 
     def get_best_trading_pairs(self, min_volume=None, min_price_change=None, limit=5):
         with self.lock:
             min_vol_val = min_volume if min_volume is not None else self.config.get("min_volume", 100)
             min_price_chg_val = min_price_change if min_price_change is not None else self.config.get("min_price_change", 1.0)
-            filtered_pairs = [
-                p for p in self.market_data
-                if (p['pair'].endswith("BNB") and p.get('quote_volume', 0) >= min_vol_val) or
-                   (p['pair'].startswith("BNB") and p.get('volume', 0) >= min_vol_val)
-                   and abs(p.get("price_change", 0)) >= min_price_chg_val
-            ]
-            scored_pairs = []
-            for pair_data in filtered_pairs:
-                vol_score = pair_data.get('quote_volume', pair_data['volume']) / (1000 if pair_data.get('quote_volume') else 100)
-                price_change_score = abs(pair_data.get("price_change", 0)) * 2
-                scored_pairs.append((pair_data, vol_score + price_change_score))
-            scored_pairs.sort(key=lambda x: x[1], reverse=True)
-            return [p for p, _ in scored_pairs[:limit]]
+            snapshot = self.snapshot
+            volume, quote_volume = snapshot.column('volume'), snapshot.column('quote_volume')
+            abs_price_change = np.abs(snapshot.column('price_change'))
+            n = len(snapshot)
+            eligible = (((snapshot.bnb_quote[:n] & (quote_volume >= min_vol_val)) |
+                         (snapshot.bnb_base[:n] & (volume >= min_vol_val))) &
+                        (abs_price_change >= min_price_chg_val))
+            scores = quote_volume / 1000 + abs_price_change * 2
+            return snapshot.rows(snapshot.top_k(scores, limit, eligible))
 
     def get_trending_pairs(self, limit=5):
         with self.lock:
-            return sorted([p for p in self.market_data if p.get("price_change") is not None],
-                          key=lambda x: abs(x["price_change"]), reverse=True)[:limit]
+            return self.snapshot.rows(self.snapshot.top_k(np.abs(self.snapshot.column('price_change')), limit))
 
     def get_high_volume_pairs(self, limit=5):
         with self.lock:
-            return sorted([p for p in self.market_data if p.get("volume") is not None],
-                          key=lambda x: x.get('quote_volume', x['volume']), reverse=True)[:limit]
+            return self.snapshot.rows(self.snapshot.top_k(self.snapshot.column('quote_volume'), limit))
 
     def get_pair_data(self, pair_name):
+        # Fetch outside the lock, as update_market_data does, so snapshot readers never wait on Binance
+        if self.binance_api and not self.config.get("mock_mode", True) and not self._stream_is_live():
+            ticker_info = self.binance_api.get_ticker_24hr(symbol=pair_name)
+            if ticker_info and isinstance(ticker_info, dict):
+                try:
+                    return {'pair': ticker_info['symbol'], 'volume': float(ticker_info['volume']),
+                            'quote_volume': float(ticker_info.get('quoteVolume',0)),
+                            'price_change': float(ticker_info['priceChangePercent']),
+                            'last_price': float(ticker_info['lastPrice'])}
+                except (ValueError, TypeError, KeyError) as e:
+                    logger.warning(_t("warning_could_not_parse_ticker_data", self.chat_id, symbol=pair_name, e=e, ticker_data=ticker_info))
         with self.lock:
-            if self.binance_api and not self.config.get("mock_mode", True):
-                ticker_info = self.binance_api.get_ticker_24hr(symbol=pair_name)
-                if ticker_info and isinstance(ticker_info, dict):
-                    try:
-                        return {'pair': ticker_info['symbol'], 'volume': float(ticker_info['volume']),
-                                'quote_volume': float(ticker_info.get('quoteVolume',0)),
-                                'price_change': float(ticker_info['priceChangePercent']),
-                                'last_price': float(ticker_info['lastPrice'])}
-                    except (ValueError, TypeError, KeyError) as e:
-                        logger.warning(_t("warning_could_not_parse_ticker_data", self.chat_id, symbol=pair_name, e=e, ticker_data=ticker_info))
-            for p in self.market_data:
-                if p["pair"].lower() == pair_name.lower(): return p.copy()
-            return None
+            return self.snapshot.row(pair_name.upper())
+
+class NotionalDistribution:
+    """Time-decayed histogram of one pair's trade-cluster sizes (BNB), in log-spaced bins.
+
+    Newer clusters weigh more: weights double every `half_life` seconds and are rescaled before they
+    overflow, so quantiles follow the pair's recent activity. `add` is O(1); a quantile is recomputed
+    from the bins only every REFRESH_EVERY additions and is at most one bin (~12%) too high.
+    """
+    __slots__ = ("half_life_ms", "counts", "total", "samples", "origin_ms", "quantiles", "added_since_refresh")
+    BINS_PER_DECADE = 20
+    MIN_EXPONENT, MAX_EXPONENT = -6, 6 # 10**-6 to 10**6 BNB; anything outside lands in the end bins
+    REFRESH_EVERY = 16
+
+    def __init__(self, half_life):
+        self.half_life_ms = half_life * 1000
+        self.counts = [0.0] * ((self.MAX_EXPONENT - self.MIN_EXPONENT) * self.BINS_PER_DECADE)
+        self.total = 0.0
+        self.samples = 0
+        self.origin_ms = None
+        self.quantiles = {} # q -> cached value
+        self.added_since_refresh = 0
+
+    def add(self, value, time_ms):
+        if value <= 0: return
+        if self.origin_ms is None: self.origin_ms = time_ms
+        weight = 2.0 ** ((time_ms - self.origin_ms) / self.half_life_ms)
+        if weight > 1e100:
+            self.counts = [count / weight for count in self.counts]
+            self.total /= weight
+            self.origin_ms, weight = time_ms, 1.0
+        index = int((math.log10(value) - self.MIN_EXPONENT) * self.BINS_PER_DECADE)
+        self.counts[min(max(index, 0), len(self.counts) - 1)] += weight
+        self.total += weight
+        self.samples += 1
+        self.added_since_refresh += 1
+
+    def quantile(self, q):
+        """Upper edge of the bin holding the q-quantile; infinity while empty."""
+        if self.added_since_refresh >= self.REFRESH_EVERY:
+            self.quantiles.clear()
+            self.added_since_refresh = 0
+        value = self.quantiles.get(q)
+        if value is None:
+            value, target, cumulative = math.inf, q * self.total, 0.0
+            if self.total > 0:
+                for i, count in enumerate(self.counts):
+                    cumulative += count
+                    if cumulative >= target: break
+                value = 10 ** (self.MIN_EXPONENT + (i + 1) / self.BINS_PER_DECADE)
+            self.quantiles[q] = value
+        return value
+
+class TradeCluster:
+    """Same-side aggressive trades on one pair in a short window: one order swept through the book or sliced by an algo."""
+    __slots__ = ("sell", "start_ms", "last_ms", "quantity", "notional", "count", "reported")
+
+    def __init__(self, sell, start_ms):
+        self.sell = sell
+        self.start_ms = self.last_ms = start_ms
+        self.quantity = self.notional = 0.0
+        self.count = 0
+        self.reported = False
 
 class WhaleDetector:
+    """Spots whales in the @aggTrade streams of the most traded BNB pairs (in mock mode it invents them).
+
+    Trades arrive on the stream thread, which only clusters them and compares each cluster with its
+    pair's NotionalDistribution; alerts and trading run on the detection thread.
+    """
+    STREAM_REFRESH_SECONDS = 10
+
     def __init__(self, config, trading_bot=None, chat_id_for_translation=None):
         self.config = config
         self.trading_bot = trading_bot
+        self.clock = trading_bot.clock if trading_bot else SYSTEM_CLOCK
         self.running = False
         self.detection_thread = None
         self.last_notification_time = 0
         self.chat_id = chat_id_for_translation if chat_id_for_translation else (ADMIN_USER_IDS[0] if ADMIN_USER_IDS else None)
         self.binance_api = BinanceAPI(config, self.chat_id) if config["api_key"] and config["api_secret"] else None
+        self.stream = None
+        self.whale_queue = queue.Queue() # detected whales waiting for the detection thread
+        self.clusters = {} # symbol -> TradeCluster being built
+        self.distributions = {} # symbol -> NotionalDistribution of completed clusters
+        self.last_whale_id = 0
+        self.trades_seen = 0
+        self.whales_detected = 0
 
     def start_detection(self):
         if not self.running:
@@ -673,42 +2073,124 @@ class WhaleDetector:
     def stop_detection(self):
         if self.running:
             self.running = False
+            if self.stream: self.stream.stop()
             if self.detection_thread and self.detection_thread.is_alive():
                 self.detection_thread.join(timeout=5.0)
             return True
         return False
 
     def detection_loop(self):
+        next_stream_refresh = 0
         while self.running:
             try:
-                if self.config.get("mock_mode", True) and self.config["whale_detection"]:
-                    if random.random() < 0.1:
+                if self.config.get("mock_mode", True):
+                    if self.config["whale_detection"] and random.random() < 0.1:
                         whale_transaction = self.generate_mock_whale_transaction()
                         if whale_transaction:
-                            MOCK_WHALE_TRANSACTIONS.append(whale_transaction)
-                            if time.time() - self.last_notification_time > 30 and self.trading_bot:
-                                self.last_notification_time = time.time()
-                                whale_message = (
-                                    f"{_t('whale_alert_notification_title', self.chat_id)}\n\n"
-                                    f"{_t('whale_alert_token', self.chat_id, token=whale_transaction['token'])}\n"
-                                    f"{_t('whale_alert_amount', self.chat_id, amount=whale_transaction['amount'], asset_name=whale_transaction['token'].replace('USDT','').replace('BNB',''))}\n"
-                                    f"{_t('whale_alert_value', self.chat_id, value=whale_transaction['value'])}\n"
-                                    f"{_t('whale_alert_type', self.chat_id, type=whale_transaction['type'])}\n"
-                                    f"{_t('whale_alert_time', self.chat_id, time=whale_transaction['time'])}\n\n"
-                                    f"{_t('whale_alert_potential_impact', self.chat_id, impact=whale_transaction['impact'])}"
-                                )
-                                keyboard = [
-                                    [InlineKeyboardButton(_t('whale_alert_button_follow', self.chat_id), callback_data=f"follow_whale_{whale_transaction['id']}")],
-                                    [InlineKeyboardButton(_t('whale_alert_button_ignore', self.chat_id), callback_data=f"ignore_whale_{whale_transaction['id']}")]
-                                ]
-                                self.trading_bot.send_notification(whale_message, keyboard, self.chat_id)
-                                if self.config["auto_trade_on_whale"]:
-                                    self.process_whale_for_trading(whale_transaction)
-                time.sleep(10)
+                            self.report_whale(whale_transaction)
+                    time.sleep(10)
+                    continue
+                if time.time() >= next_stream_refresh:
+                    self._refresh_streams()
+                    next_stream_refresh = time.time() + self.STREAM_REFRESH_SECONDS
+                try:
+                    whale_transaction = self.whale_queue.get(timeout=1.0)
+                except queue.Empty:
+                    continue
+                self.report_whale(whale_transaction)
             except Exception as e:
                 logger.error(_t("error_whale_detection_loop", self.chat_id, e=e), exc_info=True)
                 time.sleep(20)
 
+    def _refresh_streams(self):
+        """Follows the `whale_stream_pairs` BNB pairs with the most BNB volume in the current market snapshot."""
+        pairs = []
+        analyzer = self.trading_bot.market_analyzer if self.trading_bot else None
+        if self.config["whale_detection"] and analyzer and websocket is not None:
+            with analyzer.lock:
+                snapshot = analyzer.snapshot
+                n = len(snapshot)
+                bnb_volume = np.where(snapshot.bnb_quote[:n], snapshot.column('quote_volume'), snapshot.column('volume'))
+                pairs = [snapshot.pairs[i] for i in snapshot.top_k(bnb_volume, self.config.get("whale_stream_pairs", 50),
+                                                                    snapshot.bnb_quote[:n] | snapshot.bnb_base[:n])]
+        wanted = {f"{pair.lower()}@aggTrade" for pair in pairs}
+        if self.stream is None:
+            if not wanted: return
+            self.stream = BinanceStream(self.config, wanted, self.on_agg_trade, name="whale-trades", chat_id_for_translation=self.chat_id, record=True)
+        self.stream.unsubscribe(self.stream.streams - wanted)
+        self.stream.subscribe(wanted)
+        if not self.stream.running: self.stream.start()
+
+    def report_whale(self, whale_transaction):
+        """Records a whale transaction, alerts the admins (at most every 30s) and trades on it if configured."""
+        WHALE_TRANSACTIONS.append(whale_transaction)
+        self.whales_detected += 1
+        if self.clock.time() - self.last_notification_time > 30 and self.trading_bot:
+            self.last_notification_time = self.clock.time()
+            whale_message = (
+                f"{_t('whale_alert_notification_title', self.chat_id)}\n\n"
+                f"{_t('whale_alert_token', self.chat_id, token=whale_transaction['token'])}\n"
+                f"{_t('whale_alert_amount', self.chat_id, amount=whale_transaction['amount'], asset_name=whale_transaction['token'].replace('USDT','').replace('BNB',''))}\n"
+                f"{_t('whale_alert_value', self.chat_id, value=whale_transaction['value'])}\n"
+                f"{_t('whale_alert_type', self.chat_id, type=whale_transaction['type'])}\n"
+                f"{_t('whale_alert_time', self.chat_id, time=whale_transaction['time'])}\n\n"
+                f"{_t('whale_alert_potential_impact', self.chat_id, impact=whale_transaction['impact'])}"
+            )
+            keyboard = [
+                [InlineKeyboardButton(_t('whale_alert_button_follow', self.chat_id), callback_data=f"follow_whale_{whale_transaction['id']}")],
+                [InlineKeyboardButton(_t('whale_alert_button_ignore', self.chat_id), callback_data=f"ignore_whale_{whale_transaction['id']}")]
+            ]
+            self.trading_bot.send_notification(whale_message, keyboard, self.chat_id)
+        if self.config["auto_trade_on_whale"]: # every whale may trade, not only the ones that got a notification
+            self.process_whale_for_trading(whale_transaction)
+
+    @staticmethod
+    def _impact(value, high=1000000, medium=500000):
+        if value > high: return "HIGH - Likely significant price movement"
+        if value > medium: return "MEDIUM - Possible price impact"
+        return "LOW"
+
+    def on_agg_trade(self, stream_name, data):
+        """@aggTrade handler, run for every trade: extends the pair's TradeCluster and reports the cluster,
+        once, when its BNB notional reaches both `whale_threshold` and the pair's `whale_quantile`."""
+        if not self.config["whale_detection"]: return
+        try:
+            symbol, price, quantity, trade_time, sell = data['s'], float(data['p']), float(data['q']), data['T'], data['m'] # m: the buyer was the maker, so the aggressor sold
+        except (KeyError, ValueError, TypeError):
+            return
+        if symbol.endswith("BNB"): notional = price * quantity
+        elif symbol.startswith("BNB"): notional = quantity
+        else: return
+        self.trades_seen += 1
+        distribution = self.distributions.get(symbol)
+        if distribution is None:
+            distribution = self.distributions[symbol] = NotionalDistribution(self.config.get("whale_half_life", 3600))
+        cluster = self.clusters.get(symbol)
+        if cluster is None or cluster.sell != sell or trade_time - cluster.start_ms > self.config.get("whale_cluster_seconds", 2) * 1000:
+            if cluster is not None: distribution.add(cluster.notional, cluster.last_ms)
+            cluster = self.clusters[symbol] = TradeCluster(sell, trade_time)
+        cluster.last_ms = trade_time
+        cluster.quantity += quantity
+        cluster.notional += notional
+        cluster.count += 1
+        if cluster.reported or cluster.notional < self.config.get("whale_threshold", 100) or \
+           distribution.samples < self.config.get("whale_min_samples", 200):
+            return
+        threshold = distribution.quantile(self.config.get("whale_quantile", 0.999))
+        if cluster.notional < threshold: return
+        cluster.reported = True
+        self.last_whale_id = max(int(self.clock.time() * 1000), self.last_whale_id + 1)
+        cutoff = max(threshold, self.config.get("whale_threshold", 100))
+        whale_transaction = {'id': self.last_whale_id, 'token': symbol, 'type': "SELL" if sell else "BUY",
+                             'amount': cluster.quantity, 'price': price, 'value': cluster.quantity * price,
+                             'value_bnb': cluster.notional, 'trade_count': cluster.count,
+                             'time': datetime.fromtimestamp(cluster.start_ms / 1000).strftime("%Y-%m-%d %H:%M:%S"),
+                             'impact': self._impact(cluster.notional, high=10 * cutoff, medium=3 * cutoff)}
+        if self.detection_thread is not None and self.running:
+            self.whale_queue.put(whale_transaction)
+        else: # a replay, which reports on its own thread so runs repeat exactly
+            self.report_whale(whale_transaction)
+
     def generate_mock_whale_transaction(self):
         if not (self.trading_bot and self.trading_bot.market_analyzer and self.trading_bot.market_analyzer.market_data):
             logger.warning(_t("warning_cannot_generate_mock_whale_no_bot_analyzer" if not (self.trading_bot and self.trading_bot.market_analyzer) else "warning_cannot_generate_mock_whale_empty_market_data", self.chat_id))
@@ -718,12 +2200,9 @@ class WhaleDetector:
         if price == 0: price = (300 + random.uniform(-20, 20)) if "BNB" in token else random.uniform(0.001, 10)
         amount = self.config.get("whale_threshold", 100) * random.uniform(1.0, 10.0)
         value = amount * price
-        impact = "LOW"
-        if value > 1000000: impact = "HIGH - Likely significant price movement"
-        elif value > 500000: impact = "MEDIUM - Possible price impact"
         return {'id': int(time.time()), 'token': token, 'type': random.choice(["BUY", "SELL"]),
                 'amount': amount, 'price': price, 'value': value,
-                'time': datetime.now().strftime("%Y-%m-%d %H:%M:%S"), 'impact': impact}
+                'time': datetime.now().strftime("%Y-%m-%d %H:%M:%S"), 'impact': self._impact(value)}
 
     def process_whale_for_trading(self, whale_transaction):
         if not self.config["trading_enabled"] or "BNB" not in whale_transaction['token']: return
@@ -735,30 +2214,1500 @@ class WhaleDetector:
                                 (whale_transaction['type'] == "SELL" and strategy == "follow_whale") else "BUY"
         self.trading_bot.create_trade_from_whale(whale_transaction, trade_type, is_auto_trade=True, chat_id_for_trade=self.chat_id)
 
+class TradeRecord:
+    """A single trade stored in slots rather than a per-instance dict.
+
+    Item access (`trade['pair']`, `get`, `update`, `in`) works as it did on the plain trade dicts;
+    keys outside the known fields go to a small `extra` dict.
+    """
+    __slots__ = ('id', 'timestamp', 'pair', 'base_asset', 'quote_asset', 'type', 'entry_price', 'amount',
+                 'bnb_value_of_trade', 'take_profit', 'stop_loss', 'max_time_seconds', 'entry_time', 'completed',
+                 'mode', 'order_id', 'real_trade_opened', 'real_trade_filled', 'strategy', 'percentage_based',
+                 'ai_rationale', 'whale_id', 'close_order_id', 'exit_price', 'exit_time', 'result', 'close_reason',
+                 'profit_in_bnb', 'extra')
+    FIELDS = frozenset(__slots__) - {'extra'}
+
+    def __init__(self, fields=None):
+        self.extra = None
+        if fields: self.update(fields)
+
+    def __getitem__(self, key):
+        if key in self.FIELDS:
+            try: return getattr(self, key)
+            except AttributeError: raise KeyError(key) from None
+        if self.extra and key in self.extra:
+            return self.extra[key]
+        raise KeyError(key)
+
+    def __setitem__(self, key, value):
+        if key in self.FIELDS:
+            setattr(self, key, value)
+        else:
+            if self.extra is None: self.extra = {}
+            self.extra[key] = value
+
+    def __contains__(self, key):
+        return hasattr(self, key) if key in self.FIELDS else bool(self.extra and key in self.extra)
+
+    def get(self, key, default=None):
+        try: return self[key]
+        except KeyError: return default
+
+    def update(self, fields):
+        for key, value in fields.items():
+            self[key] = value
+
+    def keys(self):
+        return [key for key in self.__slots__[:-1] if hasattr(self, key)] + list(self.extra or ())
+
+    def to_dict(self):
+        return {key: self[key] for key in self.keys()}
+
+class TradeRegistry:
+    """In-memory trade index: open trades by id and by pair, plus a ring buffer of recent completed trades.
+
+    Lookups are O(1) and listing the k most recent trades is O(k), whatever the uptime.
+    """
+    def __init__(self, completed_capacity=500):
+        self.lock = threading.RLock()
+        self.active = {} # trade id -> TradeRecord, in opening order
+        self.active_by_pair = {} # pair -> {trade id: TradeRecord}
+        self.completed = collections.deque(maxlen=completed_capacity)
+        self.completed_count = 0 # completed this session
+
+    def add(self, trade):
+        with self.lock:
+            self.active[trade['id']] = trade
+            self.active_by_pair.setdefault(trade['pair'], {})[trade['id']] = trade
+
+    def complete(self, trade):
+        """Moves a trade from the open set into the ring buffer; False if it was not open."""
+        with self.lock:
+            if self.active.pop(trade['id'], None) is None: return False
+            pair_trades = self.active_by_pair.get(trade['pair'], {})
+            pair_trades.pop(trade['id'], None)
+            if not pair_trades: self.active_by_pair.pop(trade['pair'], None)
+            self.completed.append(trade)
+            self.completed_count += 1
+            return True
+
+    def get(self, trade_id):
+        return self.active.get(trade_id)
+
+    def active_trades(self):
+        with self.lock:
+            return list(self.active.values())
+
+    def active_count(self):
+        return len(self.active)
+
+    def has_open_trade(self, pair):
+        return bool(self.active_by_pair.get(pair))
+
+    def recent(self, limit=10):
+        """Up to `limit` of the newest open and completed trades, newest first."""
+        with self.lock:
+            candidates = list(itertools.islice(reversed(self.active.values()), limit)) + \
+                         list(itertools.islice(reversed(self.completed), limit))
+        return sorted(candidates, key=lambda x: x.get('timestamp', 0), reverse=True)[:limit]
+
+class TradeStore:
+    """Trade repository backed by SQLite in WAL mode.
+
+    Open and recently completed trades are served from a TradeRegistry. Every add/update/complete
+    is queued and written by a background thread in batched transactions, so the trading threads
+    never wait on disk. Open trades found in the database at startup are reloaded so positions
+    survive a restart.
+    """
+    WRITE_BATCH_SIZE = 100
+
+    def __init__(self, path, completed_in_memory=500, chat_id_for_translation=None, clock=None):
+        self.path = path
+        self.chat_id = chat_id_for_translation
+        self.clock = clock or SYSTEM_CLOCK
+        self.lock = threading.Lock()
+        self.registry = TradeRegistry(completed_in_memory)
+        self.last_trade_id = 0
+        self.write_queue = queue.Queue()
+        self._init_db()
+        self.recovered_count = self._load_open_trades()
+        self.writer_thread = threading.Thread(target=self._writer_loop, name="trade-store-writer")
+        self.writer_thread.daemon = True
+        self.writer_thread.start()
+
+    def _connect(self):
+        connection = sqlite3.connect(self.path, timeout=30)
+        connection.execute("PRAGMA journal_mode=WAL")
+        connection.execute("PRAGMA synchronous=NORMAL")
+        return connection
+
+    def _init_db(self):
+        with self._connect() as connection:
+            connection.execute("CREATE TABLE IF NOT EXISTS trades (id INTEGER PRIMARY KEY, pair TEXT NOT NULL, status TEXT NOT NULL, "
+                               "opened_at REAL, closed_at REAL, data TEXT NOT NULL)")
+            connection.execute("CREATE INDEX IF NOT EXISTS idx_trades_status_pair ON trades (status, pair)")
+            connection.execute("CREATE INDEX IF NOT EXISTS idx_trades_pair_opened ON trades (pair, opened_at)")
+        connection.close()
+
+    def _load_open_trades(self):
+        connection = self._connect()
+        try:
+            rows = connection.execute("SELECT data FROM trades WHERE status = 'open' ORDER BY opened_at").fetchall()
+        finally:
+            connection.close()
+        for (data,) in rows:
+            self.registry.add(TradeRecord(json.loads(data)))
+        with self._connect() as connection:
+            self.last_trade_id = connection.execute("SELECT COALESCE(MAX(id), 0) FROM trades").fetchone()[0]
+        connection.close()
+        if rows:
+            logger.warning(f"Recovered {len(rows)} open trade(s) from {self.path}; they are monitored again.")
+        return len(rows)
+
+    def _queue_write(self, trade):
+        status = 'closed' if trade.get('completed') else 'open'
+        closed_at = self.clock.time() if status == 'closed' else None
+        self.write_queue.put((trade['id'], trade['pair'], status, trade.get('timestamp'), closed_at, json.dumps(trade.to_dict(), default=str)))
+
+    def _writer_loop(self):
+        connection = self._connect()
+        while True:
+            item = self.write_queue.get()
+            batch, flush_events, stop = {}, [], False
+            while True:
+                if item is None: stop = True
+                elif isinstance(item, threading.Event): flush_events.append(item)
+                else: batch[item[0]] = item # Later snapshots of the same trade replace earlier ones
+                if len(batch) >= self.WRITE_BATCH_SIZE: break
+                try: item = self.write_queue.get_nowait()
+                except queue.Empty: break
+            if batch:
+                try:
+                    with connection:
+                        connection.executemany("INSERT OR REPLACE INTO trades (id, pair, status, opened_at, closed_at, data) "
+                                               "VALUES (?, ?, ?, ?, ?, ?)", list(batch.values()))
+                except sqlite3.Error as e:
+                    logger.error(f"Failed to persist {len(batch)} trade(s) to {self.path}: {e}")
+            for event in flush_events: event.set()
+            if stop: break
+        connection.close()
+
+    def flush(self, timeout=5.0):
+        """Waits until everything queued so far is on disk."""
+        event = threading.Event()
+        self.write_queue.put(event)
+        return event.wait(timeout)
+
+    def close(self):
+        self.write_queue.put(None)
+        self.writer_thread.join(timeout=5.0)
+
+    def next_trade_id(self):
+        """Millisecond timestamp id, bumped when several trades open within the same millisecond."""
+        with self.lock:
+            self.last_trade_id = max(int(self.clock.time() * 1000), self.last_trade_id + 1)
+            return self.last_trade_id
+
+    def add(self, trade):
+        self.registry.add(trade)
+        self._queue_write(trade)
+
+    def update(self, trade):
+        """Persists changes made to an open trade in place."""
+        self._queue_write(trade)
+
+    def complete(self, trade):
+        """Moves a trade from the open set to the completed ones; False if it was not open."""
+        if not self.registry.complete(trade): return False
+        self._queue_write(trade)
+        return True
+
+    def get(self, trade_id):
+        return self.registry.get(trade_id)
+
+    def active_trades(self):
+        return self.registry.active_trades()
+
+    def active_count(self):
+        return self.registry.active_count()
+
+    def has_open_trade(self, pair):
+        return self.registry.has_open_trade(pair)
+
+    @property
+    def completed_count(self):
+        return self.registry.completed_count
+
+    def recent_trades(self, limit=10):
+        """Most recent trades, open ones included; older history is read from the database."""
+        trades = self.registry.recent(limit)
+        if len(trades) < limit:
+            self.flush()
+            known_ids = {trade['id'] for trade in trades}
+            connection = self._connect()
+            try:
+                rows = connection.execute("SELECT data FROM trades WHERE status = 'closed' ORDER BY opened_at DESC LIMIT ?", (limit,)).fetchall()
+            finally:
+                connection.close()
+            trades += [trade for trade in (TradeRecord(json.loads(data)) for (data,) in rows) if trade['id'] not in known_ids]
+        return sorted(trades, key=lambda x: x.get('timestamp', 0), reverse=True)[:limit]
+
+class SystemClock:
+    """Wall-clock time, the clock every component uses outside a replay.
+
+    Components read time, dates and randomness through their clock, so a ReplayClock can substitute
+    recorded time and a seeded generator.
+    """
+    random = random # the module's functions have random.Random's interface
+
+    def time(self):
+        return time.time()
+
+    def now(self):
+        return datetime.now()
+
+    def register(self, inbox):
+        return threading.Condition()
+
+    def unregister(self, inbox):
+        pass
+
+    def wait(self, inbox, timeout):
+        inbox.condition.wait(timeout)
+
+SYSTEM_CLOCK = SystemClock()
+
+class ReplayClock(SystemClock):
+    """Virtual time for MarketReplay, moved forward only by the replay thread.
+
+    EventInboxes created with this clock share its condition, and their wait timeouts become virtual
+    deadlines. Before the replay thread delivers the next message or moves time on, `settle` waits
+    until every registered inbox is idle (blocked, nothing pending, deadline still ahead), so each
+    message is fully handled at its recorded time and a replay makes the same trades at any speed.
+    """
+    SETTLE_TIMEOUT = 30 # real seconds a busy consumer may hold the replay before it moves on regardless
+
+    def __init__(self, start_time, seed=0):
+        self.current_time = start_time
+        self.random = random.Random(seed)
+        self.condition = threading.Condition()
+        self.inboxes = set()
+        self.stopped = False
+
+    def time(self):
+        return self.current_time
+
+    def now(self):
+        return datetime.fromtimestamp(self.current_time)
+
+    def register(self, inbox):
+        with self.condition:
+            self.inboxes.add(inbox)
+            self.condition.notify_all()
+        return self.condition
+
+    def unregister(self, inbox):
+        with self.condition:
+            self.inboxes.discard(inbox)
+            self.condition.notify_all()
+
+    def wait(self, inbox, timeout):
+        inbox.deadline = None if timeout is None else self.current_time + timeout
+        inbox.waiting = True
+        self.condition.notify_all()
+        try:
+            while not inbox.events and (inbox.deadline is None or self.current_time < inbox.deadline):
+                self.condition.wait()
+        finally:
+            inbox.waiting, inbox.deadline = False, None
+
+    def _idle(self):
+        return all(inbox.waiting and not inbox.events and (inbox.deadline is None or inbox.deadline > self.current_time)
+                   for inbox in self.inboxes)
+
+    def settle(self, consumers=0):
+        """Blocks until at least `consumers` inboxes are registered and all of them are idle."""
+        with self.condition:
+            if not self.condition.wait_for(lambda: self.stopped or (len(self.inboxes) >= consumers and self._idle()), self.SETTLE_TIMEOUT):
+                logger.warning(f"Replay clock: consumers still busy after {self.SETTLE_TIMEOUT}s at {self.now()}, moving on.")
+
+    def next_deadline(self):
+        with self.condition:
+            return min((inbox.deadline for inbox in self.inboxes if inbox.deadline is not None), default=None)
+
+    def advance(self, target):
+        with self.condition:
+            self.current_time = max(self.current_time, target)
+            self.condition.notify_all()
+
+    def stop(self):
+        with self.condition:
+            self.stopped = True
+            self.condition.notify_all()
+
+class EventBus:
+    """In-process publish/subscribe between TradingBot's components.
+
+    Callbacks run on the publishing thread (a websocket reader, the market updater, a handler), so
+    they must only hand the event over; the trading threads subscribe an EventInbox for that.
+    """
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.subscribers = {} # event_type -> tuple of callbacks, replaced on change so publish needs no lock
+        self.published = collections.Counter()
+
+    def subscribe(self, event_types, callback):
+        with self.lock:
+            for event_type in event_types:
+                self.subscribers[event_type] = self.subscribers.get(event_type, ()) + (callback,)
+
+    def unsubscribe(self, callback):
+        with self.lock:
+            for event_type, callbacks in list(self.subscribers.items()):
+                self.subscribers[event_type] = tuple(c for c in callbacks if c != callback)
+
+    def publish(self, event_type, **data):
+        self.published[event_type] += 1
+        for callback in self.subscribers.get(event_type, ()):
+            try:
+                callback(event_type, data)
+            except Exception as e:
+                logger.error(f"Event subscriber for {event_type} failed: {e}", exc_info=True)
+
+class EventInbox:
+    """Collects bus events for one consumer thread, which blocks in `wait` until something arrives.
+
+    Events of one type that arrive before the consumer wakes are delivered together, so a burst of
+    ticks or snapshot updates costs a single evaluation.
+    """
+    def __init__(self, clock=None):
+        self.clock = clock or SYSTEM_CLOCK
+        self.events = {} # event_type -> list of data dicts since the last wait
+        self.waiting, self.deadline = False, None # maintained by a ReplayClock
+        self.condition = self.clock.register(self)
+
+    def close(self):
+        self.clock.unregister(self)
+
+    def post(self, event_type, data):
+        with self.condition:
+            self.events.setdefault(event_type, []).append(data)
+            self.condition.notify_all()
+
+    def wait(self, timeout=None):
+        """Returns {event_type: [data, ...]} for everything posted since the last call; {} on timeout.
+        The timeout is in the clock's seconds."""
+        with self.condition:
+            if not self.events:
+                self.clock.wait(self, timeout)
+            events, self.events = self.events, {}
+        return events
+
+class IndicatorState:
+    """RSI(14), EMA(20) and Bollinger Bands(20, 2) of one symbol and interval, advanced in O(1) per closed candle.
+
+    Follows pandas_ta's definitions: RSI smooths gains and losses with its rma, an adjusted EWM with
+    alpha 1/14 (only the ratio of the two running sums matters, so the shared denominator is not
+    kept); the EMA is seeded with the SMA of its first 20 closes; the bands use the population
+    standard deviation of the last 20 closes.
+    """
+    RSI_LENGTH, EMA_LENGTH, BB_LENGTH, BB_STD = 14, 20, 20, 2.0
+    RSI_DECAY = 1 - 1 / RSI_LENGTH
+    EMA_ALPHA = 2 / (EMA_LENGTH + 1)
+    CANDLE_HISTORY = 5 # closed candles kept for the AI prompt
+    __slots__ = ('count', 'last_open_time', 'last_close', 'rsi_gain', 'rsi_loss', 'ema', 'ema_seed_sum',
+                 'window', 'window_sum', 'window_sumsq', 'candles', 'forming')
+
+    def __init__(self):
+        self.count = 0 # closed candles applied
+        self.last_open_time = None
+        self.last_close = None
+        self.rsi_gain = self.rsi_loss = 0.0
+        self.ema = None
+        self.ema_seed_sum = 0.0
+        self.window = collections.deque() # last BB_LENGTH closes
+        self.window_sum = self.window_sumsq = 0.0
+        self.candles = collections.deque(maxlen=self.CANDLE_HISTORY) # (open_time, open, high, low, close, volume)
+        self.forming = None # the candle still open at the last update, if it was included
+
+    def _advanced(self, close):
+        """(count, rsi_gain, rsi_loss, ema, ema_seed_sum) after one more close, without changing the state."""
+        count, gain, loss, ema, seed_sum = self.count + 1, self.rsi_gain, self.rsi_loss, self.ema, self.ema_seed_sum
+        if self.last_close is not None:
+            diff = close - self.last_close
+            gain = gain * self.RSI_DECAY + max(diff, 0.0)
+            loss = loss * self.RSI_DECAY + max(-diff, 0.0)
+        if ema is not None:
+            ema += self.EMA_ALPHA * (close - ema)
+        else:
+            seed_sum += close
+            if count == self.EMA_LENGTH: ema = seed_sum / self.EMA_LENGTH
+        return count, gain, loss, ema, seed_sum
+
+    def add_candle(self, candle):
+        close = candle[4]
+        self.count, self.rsi_gain, self.rsi_loss, self.ema, self.ema_seed_sum = self._advanced(close)
+        self.window.append(close)
+        self.window_sum += close
+        self.window_sumsq += close * close
+        if len(self.window) > self.BB_LENGTH:
+            oldest = self.window.popleft()
+            self.window_sum -= oldest
+            self.window_sumsq -= oldest * oldest
+        if self.count % self.BB_LENGTH == 0: # re-sum once per window so rounding errors cannot accumulate
+            self.window_sum = sum(self.window)
+            self.window_sumsq = sum(c * c for c in self.window)
+        self.last_close, self.last_open_time = close, candle[0]
+        self.candles.append(candle)
+
+    def values(self, forming=None):
+        """Indicators in the `_calculate_indicators` format, as of the last closed candle or, given the
+        forming candle, as if it closed at its current price. Values without enough history are left out."""
+        count, gain, loss, ema = self.count, self.rsi_gain, self.rsi_loss, self.ema
+        window_len, total, total_sq = len(self.window), self.window_sum, self.window_sumsq
+        if forming is not None:
+            close = forming[4]
+            count, gain, loss, ema, _ = self._advanced(close)
+            window_len, total, total_sq = window_len + 1, total + close, total_sq + close * close
+            if window_len > self.BB_LENGTH:
+                window_len, total, total_sq = window_len - 1, total - self.window[0], total_sq - self.window[0] ** 2
+        indicators = {}
+        if count > self.RSI_LENGTH and gain + loss > 0:
+            indicators['rsi'] = 100 * gain / (gain + loss)
+        if ema is not None:
+            indicators['ema20'] = ema
+        if window_len == self.BB_LENGTH:
+            middle = total / window_len
+            std = max(total_sq / window_len - middle * middle, 0.0) ** 0.5
+            indicators.update(bb_lower=middle - self.BB_STD * std, bb_middle=middle, bb_upper=middle + self.BB_STD * std,
+                              bb_width=(2 * self.BB_STD * std) / middle * 100 if middle else 0)
+        return indicators
+
+class IndicatorEngine:
+    """Streaming indicator state per (symbol, interval).
+
+    The first request for a symbol warms up from `warmup_candles` klines. After that, `klines_needed`
+    asks only for the candles closed since the previous update (plus the forming one), and `update`
+    applies each of them in O(1) instead of recomputing the whole series.
+    """
+    def __init__(self, warmup_candles=100):
+        self.warmup_candles = warmup_candles
+        self.lock = threading.Lock()
+        self.states = {} # (symbol, interval) -> IndicatorState
+
+    def klines_needed(self, symbol, interval, now_ms=None):
+        state = self.states.get((symbol, interval))
+        if state is None or state.last_open_time is None:
+            return self.warmup_candles
+        now_ms = now_ms or int(time.time() * 1000)
+        # The last applied candle is fetched again so `update` can tell the downloaded rows connect to it
+        return int(min(self.warmup_candles, max(2, (now_ms - state.last_open_time) // KLINE_INTERVAL_MS[interval] + 1)))
+
+    def update(self, symbol, interval, klines, now_ms=None):
+        """Applies Binance kline rows (oldest first) and returns the number of candles the state covers."""
+        now_ms = now_ms or int(time.time() * 1000)
+        rows = [(int(k[0]), float(k[1]), float(k[2]), float(k[3]), float(k[4]), float(k[5]), int(k[6])) for k in klines]
+        closed = [row[:6] for row in rows if row[6] < now_ms]
+        forming = rows[-1][:6] if rows and rows[-1][6] >= now_ms else None
+        with self.lock:
+            state = self.states.get((symbol, interval))
+            if state is None or (closed and state.last_open_time is not None and
+                                 closed[0][0] > state.last_open_time + KLINE_INTERVAL_MS[interval]):
+                state = self.states[(symbol, interval)] = IndicatorState() # first use, or a gap these rows cannot bridge
+            for candle in closed:
+                if state.last_open_time is None or candle[0] > state.last_open_time:
+                    state.add_candle(candle)
+            state.forming = forming
+            return state.count + (1 if forming else 0)
+
+    def indicators(self, symbol, interval, forming=True):
+        with self.lock:
+            state = self.states.get((symbol, interval))
+            return state.values(state.forming if forming else None) if state else {}
+
+    def recent_candles(self, symbol, interval, forming=True):
+        """Up to CANDLE_HISTORY latest candles as (open, high, low, close, volume), oldest first, forming one included unless `forming` is False."""
+        with self.lock:
+            state = self.states.get((symbol, interval))
+            if state is None: return []
+            candles = list(state.candles) + ([state.forming] if state.forming and forming else [])
+            return [candle[1:] for candle in candles[-IndicatorState.CANDLE_HISTORY:]]
+
+class KlineStore:
+    """Closed candles per (symbol, interval) in append-only files of fixed-size records, read through np.memmap.
+
+    `sync` backfills `backfill_candles` of history once and afterwards downloads only what follows the
+    last stored candle (startTime), so history survives restarts and `candles` range queries need no
+    network I/O. The candle that is still forming is only kept in memory.
+    """
+    DTYPE = np.dtype([('open_time', '<i8'), ('open', '<f8'), ('high', '<f8'), ('low', '<f8'), ('close', '<f8'),
+                      ('volume', '<f8'), ('close_time', '<i8'), ('quote_volume', '<f8'), ('trades', '<i8'),
+                      ('taker_buy_base_volume', '<f8'), ('taker_buy_quote_volume', '<f8')])
+    PAGE_LIMIT = 1000 # klines per request, Binance's maximum
+
+    def __init__(self, directory, backfill_candles=1000):
+        self.directory = directory
+        self.backfill_candles = backfill_candles
+        self.lock = threading.Lock()
+        self.sync_locks = collections.defaultdict(threading.Lock) # one download at a time per (symbol, interval)
+        self.maps = {} # (symbol, interval) -> memmap of the file, dropped when the file grows
+        self.forming = {} # (symbol, interval) -> raw kline row of the open candle from the last sync
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, symbol, interval):
+        return os.path.join(self.directory, f"{symbol}_{interval}.bin")
+
+    def _map(self, key):
+        with self.lock:
+            data = self.maps.get(key)
+            if data is None:
+                path = self._path(*key)
+                size = os.path.getsize(path) if os.path.exists(path) else 0
+                count = size // self.DTYPE.itemsize
+                if size % self.DTYPE.itemsize: # a record torn by a crash mid-append
+                    with open(path, 'r+b') as f: f.truncate(count * self.DTYPE.itemsize)
+                data = np.memmap(path, dtype=self.DTYPE, mode='r', shape=(count,)) if count else np.zeros(0, dtype=self.DTYPE)
+                self.maps[key] = data
+            return data
+
+    def _append(self, key, rows):
+        records = np.array([(int(r[0]), float(r[1]), float(r[2]), float(r[3]), float(r[4]), float(r[5]), int(r[6]),
+                             float(r[7]), int(r[8]), float(r[9]), float(r[10])) for r in rows], dtype=self.DTYPE)
+        with self.lock:
+            with open(self._path(*key), 'ab') as f:
+                f.write(records.tobytes())
+            self.maps.pop(key, None)
+
+    def sync(self, binance_api, symbol, interval, now_ms=None):
+        """Downloads the candles closed since the last stored one (or the backfill window) plus the forming
+        one. Returns how many candles were appended; on API errors the stored data is left as it was."""
+        key, interval_ms = (symbol, interval), KLINE_INTERVAL_MS[interval]
+        now_ms = now_ms or int(time.time() * 1000)
+        appended = 0
+        with self.sync_locks[key]:
+            data = self._map(key)
+            start_ms = int(data['open_time'][-1]) + interval_ms if len(data) else now_ms - self.backfill_candles * interval_ms
+            while True:
+                rows = binance_api.get_klines(symbol=symbol, interval=interval, limit=self.PAGE_LIMIT, start_time=start_ms)
+                if not rows: break
+                closed = [row for row in rows if int(row[6]) < now_ms]
+                if closed:
+                    self._append(key, closed)
+                    appended += len(closed)
+                    start_ms = int(closed[-1][0]) + interval_ms
+                if len(closed) < len(rows):
+                    self.forming[key] = rows[-1]
+                    break
+                if len(rows) < self.PAGE_LIMIT: break
+        return appended
+
+    def candles(self, symbol, interval, start_ms=None, end_ms=None):
+        """Stored candles with start_ms <= open_time < end_ms, as a read-only structured array."""
+        data = self._map((symbol, interval))
+        open_times = data['open_time']
+        lo = 0 if start_ms is None else int(np.searchsorted(open_times, start_ms, 'left'))
+        hi = len(data) if end_ms is None else int(np.searchsorted(open_times, end_ms, 'left'))
+        return data[lo:hi]
+
+    def latest(self, symbol, interval, limit, now_ms=None):
+        """The last `limit` candles as Binance kline rows, ending with the forming candle if it is still open."""
+        now_ms = now_ms or int(time.time() * 1000)
+        forming = self.forming.get((symbol, interval))
+        if forming is not None and int(forming[6]) < now_ms: forming = None
+        closed_limit = max(0, limit - (1 if forming is not None else 0))
+        data = self._map((symbol, interval))
+        rows = [tuple(record) for record in data[max(0, len(data) - closed_limit):]] if closed_limit else []
+        return rows + ([forming] if forming is not None else [])
+
+class Backtester:
+    """Replays stored klines through the auto-trade rules of create_trade and monitor_trades_loop.
+
+    Entries follow MomentumStrategy on rolling 24h figures rebuilt from the candles: at a candle
+    close a pair is eligible when its 24h volume (quote volume for *BNB pairs, base volume for BNB*
+    pairs) reaches `volume_threshold` and its absolute 24h change reaches `price_change_threshold`,
+    and it is traded in the direction of the change, one position per pair. A position exits on the
+    first later candle whose high/low crosses TP or SL (SL when both do) or at the close of the
+    candle in which `max_trade_time` runs out. `max_trades` then caps concurrent positions across
+    pairs in entry order; a skipped entry does not free its pair earlier.
+
+    Everything per pair is NumPy over all entry candidates at once. Parameter sets are plain dicts
+    with the TRADING_MODES keys, so a mode can be run directly.
+    """
+    EXCURSION_CACHE_SIZE = 16
+
+    def __init__(self, kline_store, symbols, interval='1m', start_ms=None, end_ms=None, stake_bnb=0.01):
+        self.interval_ms = KLINE_INTERVAL_MS[interval]
+        self.stake_bnb = stake_bnb
+        self.window = max(1, 86_400_000 // self.interval_ms) # candles in the rolling 24h
+        self.data = {}
+        for symbol in symbols:
+            candles = kline_store.candles(symbol, interval, start_ms, end_ms)
+            if len(candles) <= self.window: continue
+            close, open_price = np.array(candles['close']), np.array(candles['open'])
+            volume = np.array(candles['quote_volume'] if symbol.endswith("BNB") else candles['volume'])
+            cumulative_volume = np.concatenate(([0.0], np.cumsum(volume)))
+            change_24h, volume_24h = np.full(len(close), np.nan), np.zeros(len(close))
+            change_24h[self.window - 1:] = (close[self.window - 1:] / open_price[:len(close) - self.window + 1] - 1) * 100
+            volume_24h[self.window - 1:] = cumulative_volume[self.window:] - cumulative_volume[:len(close) - self.window + 1]
+            self.data[symbol] = {'open_time': np.array(candles['open_time']), 'high': np.array(candles['high']),
+                                 'low': np.array(candles['low']), 'close': close,
+                                 'change_24h': change_24h, 'volume_24h': volume_24h}
+        self._excursions = collections.OrderedDict() # LRU of per-pair entry candidates and their price paths
+
+    def _entry_excursions(self, symbol, volume_threshold, price_change_threshold, horizon):
+        """Entry candle positions, sides and the favourable/adverse excursions (fractions of the entry
+        price) over the next `horizon` candles. Shared by every TP/SL combination with these inputs."""
+        key = (symbol, volume_threshold, price_change_threshold, horizon)
+        cached = self._excursions.get(key)
+        if cached is not None:
+            self._excursions.move_to_end(key)
+            return cached
+        d = self.data[symbol]
+        n = len(d['close'])
+        with np.errstate(invalid='ignore'):
+            signal = (d['volume_24h'] >= volume_threshold) & (np.abs(d['change_24h']) >= price_change_threshold)
+        entries = np.flatnonzero(signal[:max(0, n - horizon)])
+        side = np.where(d['change_24h'][entries] > 0, 1.0, -1.0)
+        entry_price = d['close'][entries]
+        path = entries[:, None] + np.arange(1, horizon + 1)
+        high_move, low_move = d['high'][path] / entry_price[:, None] - 1, d['low'][path] / entry_price[:, None] - 1
+        favourable = np.where(side[:, None] > 0, high_move, -low_move)
+        adverse = np.where(side[:, None] > 0, -low_move, high_move)
+        time_exit_return = side * (d['close'][entries + horizon] / entry_price - 1)
+        cached = (entries, favourable, adverse, time_exit_return)
+        self._excursions[key] = cached
+        if len(self._excursions) > self.EXCURSION_CACHE_SIZE: self._excursions.popitem(last=False)
+        return cached
+
+    def _pair_trades(self, symbol, params):
+        """(entry_time, exit_time, return fraction) arrays of the trades one pair takes on its own."""
+        horizon = max(1, math.ceil(params['max_trade_time'] * 1000 / self.interval_ms))
+        entries, favourable, adverse, time_exit_return = self._entry_excursions(
+            symbol, params['volume_threshold'], params['price_change_threshold'], horizon)
+        if len(entries) == 0: return np.zeros(0, np.int64), np.zeros(0, np.int64), np.zeros(0)
+        take_profit, stop_loss = params['take_profit'] / 100, params['stop_loss'] / 100
+        tp_hit, sl_hit = favourable >= take_profit, adverse >= stop_loss
+        first_tp = np.where(tp_hit.any(axis=1), tp_hit.argmax(axis=1), horizon)
+        first_sl = np.where(sl_hit.any(axis=1), sl_hit.argmax(axis=1), horizon)
+        stopped, took_profit = (first_sl < horizon) & (first_sl <= first_tp), (first_tp < horizon) & (first_tp < first_sl)
+        exit_offset = np.minimum(np.minimum(first_tp, first_sl) + 1, horizon)
+        returns = np.where(stopped, -stop_loss, np.where(took_profit, take_profit, time_exit_return))
+        exits = entries + exit_offset
+        # One position per pair: the next entry is the first candidate after the previous exit
+        next_candidate = np.searchsorted(entries, exits, 'right').tolist()
+        taken, position = [], 0
+        while position < len(next_candidate):
+            taken.append(position)
+            position = next_candidate[position]
+        open_time = self.data[symbol]['open_time']
+        return open_time[entries[taken]], open_time[exits[taken]], returns[taken]
+
+    def run(self, params):
+        """Win rate, PnL and max drawdown (BNB, on `stake_bnb` per trade) of one parameter set."""
+        if not self.data:
+            return {'trades': 0, 'win_rate': 0.0, 'pnl_pct': 0.0, 'pnl_bnb': 0.0, 'max_drawdown_bnb': 0.0}
+        entry_times, exit_times, returns = (np.concatenate(columns) for columns in zip(*(self._pair_trades(symbol, params) for symbol in self.data)))
+        order = np.argsort(entry_times, kind='stable')
+        accepted, open_exits = [], []
+        max_trades = params.get('max_trades', 3)
+        for position, entry_time, exit_time in zip(order.tolist(), entry_times[order].tolist(), exit_times[order].tolist()):
+            while open_exits and open_exits[0] <= entry_time: heapq.heappop(open_exits)
+            if len(open_exits) >= max_trades: continue
+            heapq.heappush(open_exits, exit_time)
+            accepted.append(position)
+        accepted = np.array(accepted, dtype=np.int64)
+        returns = returns[accepted[np.argsort(exit_times[accepted], kind='stable')]]
+        equity = np.cumsum(returns) * self.stake_bnb
+        drawdown = float(np.max(np.maximum.accumulate(np.concatenate(([0.0], equity)))[1:] - equity)) if len(equity) else 0.0
+        return {'trades': len(returns), 'win_rate': float(np.mean(returns > 0) * 100) if len(returns) else 0.0,
+                'pnl_pct': float(returns.sum() * 100), 'pnl_bnb': float(equity[-1]) if len(equity) else 0.0,
+                'max_drawdown_bnb': drawdown}
+
+    def sweep(self, param_sets, workers=None, store_directory=None, symbols=None, interval='1m', start_ms=None, end_ms=None):
+        """Runs every parameter set, across a process pool when `workers` > 1 (each worker loads its own
+        copy of the klines from `store_directory`). Returns the results in input order."""
+        if not workers or workers <= 1:
+            return [self.run(params) for params in param_sets]
+        chunk_size = max(1, len(param_sets) // (workers * 4))
+        chunks = [param_sets[i:i + chunk_size] for i in range(0, len(param_sets), chunk_size)]
+        with concurrent.futures.ProcessPoolExecutor(max_workers=workers, initializer=_init_backtest_worker,
+                                                    initargs=(store_directory, symbols or list(self.data), interval, start_ms, end_ms, self.stake_bnb)) as pool:
+            return [result for chunk_results in pool.map(_run_backtest_chunk, chunks) for result in chunk_results]
+
+_backtest_worker = None # Backtester of a sweep worker process
+
+def _init_backtest_worker(store_directory, symbols, interval, start_ms, end_ms, stake_bnb):
+    global _backtest_worker
+    _backtest_worker = Backtester(KlineStore(store_directory), symbols, interval, start_ms, end_ms, stake_bnb)
+
+def _run_backtest_chunk(param_sets):
+    return [_backtest_worker.run(params) for params in param_sets]
+
+def run_backtest_cli(argv):
+    """`python spotAI.py backtest SYMBOL [SYMBOL ...]`: evaluates TRADING_MODES, or a parameter grid, on stored klines."""
+    parser = argparse.ArgumentParser(prog="spotAI.py backtest", description="Backtest TRADING_MODES on locally stored klines.")
+    parser.add_argument("symbols", nargs="+")
+    parser.add_argument("--interval", default="1m", choices=sorted(KLINE_INTERVAL_MS))
+    parser.add_argument("--days", type=float, default=30, help="history to test, ending now")
+    parser.add_argument("--sync", action="store_true", help="download missing klines first")
+    parser.add_argument("--mode", action="append", choices=sorted(TRADING_MODES), help="modes to run (default: all)")
+    parser.add_argument("--grid", action="append", default=[], metavar="KEY=V1,V2,...",
+                        help="sweep a mode parameter (take_profit, stop_loss, max_trade_time, volume_threshold, price_change_threshold, max_trades)")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--top", type=int, default=20, help="grid results to print, best PnL first")
+    args = parser.parse_args(argv)
+
+    _load_translations()
+    store = KlineStore(CONFIG.get("kline_store_dir", "klines"), CONFIG.get("kline_backfill_candles", 1000))
+    end_ms = int(time.time() * 1000)
+    start_ms = end_ms - int(args.days * 86_400_000)
+    if args.sync:
+        store.backfill_candles = max(store.backfill_candles, int(args.days * 86_400_000 // KLINE_INTERVAL_MS[args.interval]) + 1440)
+        binance_api = BinanceAPI(CONFIG)
+        for symbol in args.symbols:
+            print(f"{symbol}: {store.sync(binance_api, symbol, args.interval)} new {args.interval} candles")
+    stake_bnb = max(CONFIG.get('min_bnb_per_trade', 0.01), CONFIG.get('amount', 0.01))
+    backtester = Backtester(store, args.symbols, args.interval, start_ms - 86_400_000, end_ms, stake_bnb)
+    if not backtester.data:
+        print("No symbol has more than 24h of stored klines in that range; run with --sync first.")
+        return
+
+    modes = args.mode or list(TRADING_MODES)
+    if args.grid:
+        grid = {}
+        for item in args.grid:
+            key, _, values = item.partition("=")
+            grid[key] = [float(v) for v in values.split(",") if v]
+        base = TRADING_MODES[modes[0]]
+        param_sets = [dict(base, **dict(zip(grid, combination))) for combination in itertools.product(*grid.values())]
+        labels = [" ".join(f"{key}={params[key]:g}" for key in grid) for params in param_sets]
+    else:
+        param_sets, labels = [TRADING_MODES[mode] for mode in modes], modes
+
+    started = time.perf_counter()
+    results = backtester.sweep(param_sets, args.workers if len(param_sets) > 1 else 1, store.directory,
+                               list(backtester.data), args.interval, start_ms - 86_400_000, end_ms)
+    elapsed = time.perf_counter() - started
+    ranked = sorted(zip(labels, results), key=lambda item: -item[1]['pnl_bnb'])[:args.top]
+    print(f"{len(param_sets)} parameter set(s) on {len(backtester.data)} pair(s) in {elapsed:.1f}s "
+          f"({len(param_sets) / elapsed * 60:,.0f}/min), stake {stake_bnb} BNB per trade")
+    for label, result in ranked:
+        print(f"{label:<48} trades {result['trades']:>6}  win {result['win_rate']:5.1f}%  "
+              f"PnL {result['pnl_bnb']:+.6f} BNB ({result['pnl_pct']:+.2f}%)  max DD {result['max_drawdown_bnb']:.6f} BNB")
+
+def run_replay_cli(argv):
+    """`python spotAI.py replay FILE`: runs the trading pipeline without Telegram on a recorded stream file."""
+    parser = argparse.ArgumentParser(prog="spotAI.py replay", description="Replay recorded market streams through the bot with simulated trades.")
+    parser.add_argument("file", help="JSON-lines file written through record_streams_file")
+    parser.add_argument("--speed", type=float, default=CONFIG.get("replay_speed", 1),
+                        help=f"market seconds per real second, 1 to {MarketReplay.MAX_SPEED}; 0 = as fast as the bot keeps up")
+    parser.add_argument("--seed", type=int, default=CONFIG.get("replay_seed", 0))
+    parser.add_argument("--mode", choices=sorted(TRADING_MODES), default=CONFIG.get("trading_mode", "balanced_growth"))
+    parser.add_argument("--whales", action="store_true", help="alert and auto-trade on whales in recorded @aggTrade streams")
+    parser.add_argument("--verbose", action="store_true", help="keep the bot's info and warning logs")
+    args = parser.parse_args(argv)
+    if args.speed != 0 and not 1 <= args.speed <= MarketReplay.MAX_SPEED:
+        parser.error(f"--speed must be 0 or from 1 to {MarketReplay.MAX_SPEED}")
+
+    _load_translations()
+    if not args.verbose: logger.setLevel(logging.ERROR) # every notification would warn that there is no Telegram bot
+    config = dict(CONFIG, api_key="", api_secret="", replay_file=args.file, replay_speed=args.speed, replay_seed=args.seed,
+                  trading_mode=args.mode, trading_enabled=True, ai_dynamic_mode=False,
+                  whale_detection=args.whales, auto_trade_on_whale=args.whales)
+    trading_bot = TradingBot(config)
+    trading_bot.set_whale_detector(WhaleDetector(config, trading_bot))
+    trading_bot.start_trading()
+    try:
+        trading_bot.replay.finished.wait()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        trading_bot.stop_trading()
+
+    replay, trade_store = trading_bot.replay, trading_bot.trade_store
+    trades = trade_store.recent_trades(DAILY_STATS["total_trades"] + trade_store.active_count())
+    closed = sorted((t for t in trades if t.get('completed')), key=lambda t: t['id'])
+    digest = hashlib.sha256(json.dumps([[t['id'], t['pair'], t['type'], t['entry_price'], t['exit_price'], t['close_reason']]
+                                        for t in closed]).encode()).hexdigest()[:16]
+    print(f"Replayed {replay.event_count:,} messages ({replay.skipped_count:,} skipped): {(replay.clock.time() - replay.start_time) / 3600:.2f}h "
+          f"of market time in {replay.elapsed:.1f}s ({replay.event_count / max(replay.elapsed, 1e-9):,.0f} msg/s, max lag {replay.max_lag:.2f}s)")
+    print(f"Trades: {len(closed)} closed ({DAILY_STATS['winning_trades']} won, {DAILY_STATS['losing_trades']} lost), "
+          f"{trade_store.active_count()} still open, PnL {DAILY_STATS['total_profit_bnb']:+.6f} BNB ({DAILY_STATS['total_profit_pct']:+.2f}%)")
+    print(f"Trade log digest {digest} (seed {args.seed}); trades saved in {config['trade_db_file']}")
+    trade_store.close()
+
+def run_train_advisor_cli(argv):
+    """`python spotAI.py train-advisor`: fits a new version of the local advice model on the trade journal."""
+    parser = argparse.ArgumentParser(prog="spotAI.py train-advisor", description="Train the local TP/max-time model on completed trades.")
+    parser.add_argument("--db", default=CONFIG.get("trade_db_file", "trades.db"), help="trade journal (SQLite)")
+    parser.add_argument("--model-dir", default=CONFIG.get("ai_model_dir", "advisor_models"))
+    parser.add_argument("--ridge", type=float, default=1.0, help="L2 penalty on the standardized weights")
+    parser.add_argument("--min-samples", type=int, default=30, help="profitable trades needed to save a model")
+    parser.add_argument("--list", action="store_true", help="list the saved model versions and exit")
+    args = parser.parse_args(argv)
+
+    if args.list:
+        for version in LocalAdvisor.versions(args.model_dir):
+            with open(os.path.join(args.model_dir, f"advisor_v{version:04d}.json"), encoding="utf-8") as f:
+                model = json.load(f)
+            holdout = ", ".join(f"{target} {error:.3f}" for target, error in (model.get('holdout_mae') or {}).items())
+            print(f"v{version:<5} trained {model.get('trained_at')} on {model['samples']} trades" + (f", holdout MAE {holdout}" if holdout else ""))
+        return
+    if not os.path.exists(args.db):
+        print(f"No trade journal at {args.db}.")
+        return
+    connection = sqlite3.connect(f"file:{args.db}?mode=ro", uri=True)
+    try:
+        trades = [TradeRecord(json.loads(data)) for (data,) in connection.execute("SELECT data FROM trades WHERE status = 'closed' ORDER BY opened_at")]
+    finally:
+        connection.close()
+
+    by_source = collections.defaultdict(list)
+    for trade in trades:
+        by_source[trade.get('advice_source', 'untracked')].append(trade.get('result') or 0.0)
+    for source, results in sorted(by_source.items()):
+        wins = sum(1 for result in results if result > 0)
+        print(f"{source:<10} {len(results):>6} trades  win {wins / len(results) * 100:5.1f}%  avg {sum(results) / len(results):+.3f}%")
+
+    samples, skipped = LocalAdvisor.training_samples(trades, KlineStore(CONFIG.get("kline_store_dir", "klines"), CONFIG.get("kline_backfill_candles", 1000)))
+    print(f"{len(samples)} training samples from {len(trades)} closed trades" + "".join(f", {count} {reason}" for reason, count in skipped.items()))
+    if len(samples) < args.min_samples:
+        print(f"Not enough profitable trades with features to train (need {args.min_samples}); nothing saved.")
+        return
+    started = time.perf_counter()
+    model = LocalAdvisor.train(samples, args.ridge)
+    path = LocalAdvisor.save(model, args.model_dir)
+    print(f"Saved {path} in {time.perf_counter() - started:.2f}s")
+    for target in LocalAdvisor.TARGETS if "holdout_mae" in model else ():
+        print(f"  {target:<24} holdout MAE {model['holdout_mae'][target]:.3f} (always the mean: {model['baseline_mae'][target]:.3f})")
+
+Signal = collections.namedtuple("Signal", "strategy pair side score price") # one scored entry candidate
+
+class Strategy:
+    """Entry strategy run by StrategyEngine.
+
+    `evaluate` receives the MarketSnapshot (the analyzer lock is held for the call) and the current
+    indicator values per symbol (closed candles of the engine's interval), and returns Signals best
+    first. It must be deterministic, the same inputs always giving the same signals; budgets and
+    already-open pairs are the engine's concern.
+    """
+    name = None
+    uses_indicators = False # True makes TradingBot keep indicators current for every snapshot symbol
+
+    def __init__(self, config, settings):
+        self.config = config # bot config, for the thresholds set by the trading mode
+        self.settings = settings # this strategy's entry in config["strategies"]
+
+    def setting(self, key, default=None):
+        return self.settings.get(key, self.config.get(key, default))
+
+    def evaluate(self, snapshot, indicators):
+        raise NotImplementedError
+
+class MomentumStrategy(Strategy):
+    """Liquid BNB pairs with the biggest 24h move, traded in the direction of the move."""
+    name = "momentum"
+
+    def evaluate(self, snapshot, indicators):
+        n = len(snapshot)
+        min_volume = self.setting("min_volume", 100)
+        volume, quote_volume = snapshot.column('volume'), snapshot.column('quote_volume')
+        price_change, last_price = snapshot.column('price_change'), snapshot.column('last_price')
+        abs_price_change = np.abs(price_change)
+        eligible = (((snapshot.bnb_quote[:n] & (quote_volume >= min_volume)) | (snapshot.bnb_base[:n] & (volume >= min_volume))) &
+                    (abs_price_change >= self.setting("min_price_change", 1.0)) & (last_price > 0))
+        scores = quote_volume / 1000 + abs_price_change * 2
+        return [Signal(self.name, snapshot.pairs[i], "BUY" if price_change[i] > 0 else "SELL", float(scores[i]), float(last_price[i]))
+                for i in snapshot.top_k(scores, self.settings.get("max_signals", 10), eligible)]
+
+class RsiReversionStrategy(Strategy):
+    """Fades stretched moves: buys oversold and sells overbought RSI, the further out the better."""
+    name = "rsi_reversion"
+    uses_indicators = True
+
+    def evaluate(self, snapshot, indicators):
+        oversold, overbought = self.settings.get("oversold", 30), self.settings.get("overbought", 70)
+        last_price = snapshot.column('last_price')
+        signals = []
+        for pair, values in indicators.items():
+            i, rsi = snapshot.index.get(pair), values.get('rsi')
+            if i is None or rsi is None or last_price[i] <= 0: continue
+            if rsi <= oversold: signals.append(Signal(self.name, pair, "BUY", float(oversold - rsi), float(last_price[i])))
+            elif rsi >= overbought: signals.append(Signal(self.name, pair, "SELL", float(rsi - overbought), float(last_price[i])))
+        signals.sort(key=lambda signal: (-signal.score, signal.pair))
+        return signals[:self.settings.get("max_signals", 10)]
+
+STRATEGY_CLASSES = {cls.name: cls for cls in (MomentumStrategy, RsiReversionStrategy)}
+
+class StrategyEngine:
+    """Runs the strategies enabled in config["strategies"] side by side.
+
+    Every strategy has its own budget (`max_open_trades`, counted from the open trades it owns) and
+    its own counters for throughput and PnL. When free slots are scarce, strategies earlier in the
+    config get them first; two strategies never open the same pair.
+
+    Indicators are kept for one interval (`strategy_indicator_interval`), stamped with the clock time
+    they were computed at, and only those younger than `strategy_indicator_max_age` reach the strategies.
+    """
+    def __init__(self, config, event_bus, clock=None):
+        self.config = config
+        self.clock = clock or SYSTEM_CLOCK
+        self.lock = threading.Lock()
+        self.strategies = {}
+        self.stats = {} # strategy name -> counters, kept across reloads
+        self.indicators = {} # pair -> (indicator values ({'rsi': ..., 'ema20': ...}), clock time computed); guarded by lock
+        self.interval = config.get("strategy_indicator_interval", "15m")
+        self.reload()
+        event_bus.subscribe((EVENT_CONFIG_CHANGED,), lambda event_type, data: self.reload())
+        event_bus.subscribe((EVENT_TRADE_CLOSED,), self._on_trade_closed)
+
+    def reload(self):
+        strategies = {}
+        for name, settings in self.config.get("strategies", {}).items():
+            strategy_class = STRATEGY_CLASSES.get(name)
+            if strategy_class is None:
+                logger.warning(f"Unknown strategy '{name}' in config; skipped.")
+                continue
+            if settings.get("enabled", True):
+                strategies[name] = strategy_class(self.config, settings)
+                with self.lock:
+                    self.stats.setdefault(name, {"evaluations": 0, "symbols_evaluated": 0, "eval_seconds": 0.0, "signals": 0,
+                                                 "trades_opened": 0, "trades_closed": 0, "wins": 0, "pnl_pct": 0.0, "pnl_bnb": 0.0})
+        self.strategies = strategies
+        interval = self.config.get("strategy_indicator_interval", "15m")
+        with self.lock:
+            if interval != self.interval: # values of the old interval must not mix with the new one
+                self.interval, self.indicators = interval, {}
+
+    def uses_indicators(self):
+        return any(strategy.uses_indicators for strategy in self.strategies.values())
+
+    def update_indicators(self, pair, interval, values):
+        """Stores `pair`'s indicator values if they are for the engine's interval; others are ignored."""
+        if not values: return
+        with self.lock:
+            if interval == self.interval:
+                self.indicators[pair] = (dict(values), self.clock.time())
+
+    def current_indicators(self):
+        """Copy of the indicator values that are not stale, pair -> values."""
+        max_age = self.config.get("strategy_indicator_max_age", 1800)
+        now = self.clock.time()
+        with self.lock:
+            return {pair: values for pair, (values, computed_at) in self.indicators.items() if now - computed_at <= max_age}
+
+    def select_entries(self, snapshot, open_trades, slots):
+        """Signals to trade now, at most `slots` of them. Call with the snapshot's lock held."""
+        open_pairs = {trade['pair'] for trade in open_trades}
+        open_by_strategy = collections.Counter(trade.get('strategy') for trade in open_trades)
+        entries = []
+        indicators = self.current_indicators() if self.uses_indicators() else {}
+        for name, strategy in self.strategies.items():
+            if len(entries) >= slots: break
+            started = time.perf_counter()
+            signals = strategy.evaluate(snapshot, indicators)
+            with self.lock:
+                stats = self.stats[name]
+                stats["evaluations"] += 1
+                stats["symbols_evaluated"] += len(snapshot)
+                stats["eval_seconds"] += time.perf_counter() - started
+                stats["signals"] += len(signals)
+            budget = strategy.settings.get("max_open_trades", 1) - open_by_strategy[name]
+            for signal in signals:
+                if budget <= 0 or len(entries) >= slots: break
+                if signal.pair in open_pairs: continue
+                entries.append(signal)
+                open_pairs.add(signal.pair)
+                budget -= 1
+        return entries
+
+    def record_entry(self, signal):
+        with self.lock:
+            self.stats[signal.strategy]["trades_opened"] += 1
+
+    def _on_trade_closed(self, event_type, data):
+        trade = data['trade']
+        with self.lock:
+            stats = self.stats.get(trade.get('strategy'))
+            if stats is None: return
+            result = trade.get('result') or 0.0
+            stats["trades_closed"] += 1
+            stats["wins"] += result > 0
+            stats["pnl_pct"] += result
+            stats["pnl_bnb"] += trade.get('profit_in_bnb') or 0.0
+
+    def get_metrics(self):
+        """Per-strategy counters plus symbols evaluated per second of strategy time."""
+        with self.lock:
+            return {name: dict(stats, enabled=name in self.strategies,
+                               symbols_per_second=stats["symbols_evaluated"] / stats["eval_seconds"] if stats["eval_seconds"] else 0.0)
+                    for name, stats in self.stats.items()}
+
+class AIUnavailableError(Exception):
+    """Raised instead of calling the AI model while its circuit breaker is open."""
+
+class CircuitBreaker:
+    """Circuit breaker around calls to a slow or failing dependency (the Gemini model).
+
+    Closed: calls go through and the outcome of the last `window` is kept. Once `min_calls` are
+    recorded and the share of failures (errors, or answers over the latency budget) reaches
+    `failure_rate`, the breaker opens and `allow` refuses calls for `open_seconds`. Then one probe call
+    is let through (half-open): its success closes the breaker, its failure opens it again.
+    """
+    CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+
+    def __init__(self, name, window=20, min_calls=5, failure_rate=0.5, open_seconds=120, clock=None, on_open=None):
+        self.name = name
+        self.min_calls = min_calls
+        self.failure_rate = failure_rate
+        self.open_seconds = open_seconds
+        self.clock = clock or SYSTEM_CLOCK
+        self.on_open = on_open # on_open(failures, calls) after the closed breaker opened; called without the lock
+        self.lock = threading.Lock()
+        self.state = self.CLOSED
+        self.opened_at = 0
+        self.probe_running = False
+        self.outcomes = collections.deque(maxlen=window) # True = failed, most recent last
+        self.latencies = collections.deque(maxlen=200)
+        self.metrics = {"calls": 0, "failures": 0, "slow": 0, "rejected": 0, "opened": 0}
+
+    def allow(self):
+        """Whether a call may be made now; a refused call is counted as rejected."""
+        with self.lock:
+            if self.state == self.OPEN and self.clock.time() - self.opened_at >= self.open_seconds:
+                self.state = self.HALF_OPEN
+            if self.state == self.CLOSED:
+                return True
+            if self.state == self.HALF_OPEN and not self.probe_running:
+                self.probe_running = True
+                return True
+            self.metrics["rejected"] += 1
+            return False
+
+    def is_open(self):
+        """True while calls are refused and no probe is due yet."""
+        with self.lock:
+            return self.state == self.OPEN and self.clock.time() - self.opened_at < self.open_seconds
+
+    def record(self, latency, failed=False, slow=False):
+        """Outcome of a call that `allow` let through."""
+        opened = None
+        with self.lock:
+            self.metrics["calls"] += 1
+            self.metrics["failures"] += failed or slow
+            self.metrics["slow"] += slow
+            self.latencies.append(latency)
+            self.outcomes.append(failed or slow)
+            if self.state == self.HALF_OPEN and self.probe_running:
+                self.probe_running = False
+                if failed or slow:
+                    self._open() # still failing: no new on_open notice
+                else:
+                    self.state = self.CLOSED
+                    self.outcomes.clear()
+                    logger.info(f"{self.name} circuit breaker closed after a successful probe call")
+            elif self.state == self.CLOSED and len(self.outcomes) >= self.min_calls and \
+                    sum(self.outcomes) / len(self.outcomes) >= self.failure_rate:
+                opened = self._open()
+        if opened and self.on_open:
+            self.on_open(*opened)
+
+    def _open(self):
+        """Opens the breaker; (failures, calls) in the window. Lock held."""
+        self.state = self.OPEN
+        self.opened_at = self.clock.time()
+        self.metrics["opened"] += 1
+        logger.warning(f"{self.name} circuit breaker opened: {sum(self.outcomes)} of the last {len(self.outcomes)} calls failed; "
+                       f"pausing calls for {self.open_seconds}s")
+        return sum(self.outcomes), len(self.outcomes)
+
+    def get_metrics(self):
+        with self.lock:
+            latencies = sorted(self.latencies)
+            return dict(self.metrics, state=self.state,
+                        failure_rate=self.metrics["failures"] / self.metrics["calls"] if self.metrics["calls"] else 0.0,
+                        latency_p95=latencies[min(len(latencies) - 1, int(0.95 * len(latencies)))] if latencies else 0.0)
+
+class AdviceCache:
+    """LRU cache of Gemini advice keyed by pair and quantized market conditions, persisted as JSON.
+
+    A key is the pair plus its RSI bucket, Bollinger width bucket and side of EMA20, so advice is reused
+    while the pair stays in the same conditions and requested again as soon as they change. Entries
+    expire `ttl` seconds after they were stored; beyond `capacity` the least recently used one goes.
+    Every store rewrites `path` (empty = memory only), which is read back at startup.
+    """
+    RSI_BUCKET = 10 # RSI points per bucket
+    BB_WIDTH_BUCKET = 0.5 # Bollinger width (% of the middle band) per bucket
+    BB_WIDTH_MAX_BUCKET = 20 # wider bands all share the last bucket
+
+    def __init__(self, path, capacity=512, ttl=1800, clock=None):
+        self.path = path
+        self.capacity = capacity
+        self.ttl = ttl
+        self.clock = clock or SYSTEM_CLOCK
+        self.lock = threading.Lock()
+        self.entries = collections.OrderedDict() # key -> (advice, stored_at), least recently used first
+        self.metrics = {"hits": 0, "misses": 0, "evictions": 0, "expired": 0, "loaded": 0}
+        self._load()
+
+    @classmethod
+    def feature_key(cls, pair, indicators, price):
+        rsi, bb_width, ema20 = indicators.get('rsi'), indicators.get('bb_width'), indicators.get('ema20')
+        rsi_bucket = int(rsi // cls.RSI_BUCKET) if rsi is not None else "-"
+        bb_bucket = min(int(bb_width // cls.BB_WIDTH_BUCKET), cls.BB_WIDTH_MAX_BUCKET) if bb_width is not None else "-"
+        trend = "-" if ema20 is None else "up" if price > ema20 else "down" if price < ema20 else "flat"
+        return f"{pair}|rsi{rsi_bucket}|bbw{bb_bucket}|{trend}"
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None and self.clock.time() - entry[1] >= self.ttl:
+                del self.entries[key]
+                self.metrics["expired"] += 1
+                entry = None
+            if entry is None:
+                self.metrics["misses"] += 1
+                return None
+            self.entries.move_to_end(key)
+            self.metrics["hits"] += 1
+            return entry[0]
+
+    def put(self, key, advice):
+        with self.lock:
+            self.entries[key] = (advice, self.clock.time())
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.capacity:
+                self.entries.popitem(last=False)
+                self.metrics["evictions"] += 1
+            snapshot = list(self.entries.items())
+        self._save(snapshot)
+
+    def _save(self, entries):
+        if not self.path: return
+        try:
+            temp_path = f"{self.path}.tmp"
+            with open(temp_path, "w", encoding="utf-8") as f:
+                json.dump([[key, advice, stored_at] for key, (advice, stored_at) in entries], f)
+            os.replace(temp_path, self.path)
+        except OSError as e:
+            logger.warning(f"Could not save the AI advice cache to {self.path}: {e}")
+
+    def _load(self):
+        if not self.path or not os.path.exists(self.path): return
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                rows = json.load(f)
+            now = self.clock.time()
+            for key, advice, stored_at in rows[-self.capacity:]:
+                if now - stored_at < self.ttl:
+                    self.entries[key] = (advice, stored_at)
+            self.metrics["loaded"] = len(self.entries)
+        except (OSError, ValueError, TypeError) as e:
+            logger.warning(f"Ignoring unreadable AI advice cache {self.path}: {e}")
+
+    def get_metrics(self):
+        with self.lock:
+            return dict(self.metrics, size=len(self.entries))
+
+class AdviceService:
+    """AI trade advice served from memory and refreshed in the background (stale-while-revalidate).
+
+    `get` answers at once: fresh advice (younger than `ai_advice_cache_duration`), or stale advice (up
+    to `ai_advice_max_stale` seconds older) while a refresh is scheduled. Missing advice is scheduled
+    as well, and the caller gets None unless it chose to wait. `prefetch` keeps the best-ranked pairs
+    warm so that entries rarely find nothing, asking for up to `ai_advice_batch_size` of them in one
+    request. At most `ai_advice_workers` requests run at a time, a pair is never requested twice at
+    once, and a pair whose request failed is left alone for `ai_advice_retry_seconds`.
+    """
+    def __init__(self, config, fetch, clock=None, fetch_batch=None):
+        self.config = config
+        self.fetch = fetch # fetch(pair) -> advice dict or None; blocking (klines + Gemini)
+        self.fetch_batch = fetch_batch # fetch_batch(pairs) -> {pair: advice}; one request for several pairs
+        self.clock = clock or SYSTEM_CLOCK
+        self.lock = threading.Lock()
+        self.entries = {} # pair -> (advice, produced_at)
+        self.in_flight = {} # pair -> Future of the running request's advice for that pair
+        self.retry_after = {} # pair -> time before which a failed pair is not requested again
+        self.executor = concurrent.futures.ThreadPoolExecutor(max_workers=max(1, config.get("ai_advice_workers", 2)), thread_name_prefix="ai-advice")
+        self.latencies = collections.deque(maxlen=200)
+        self.metrics = {"fresh_hits": 0, "stale_hits": 0, "misses": 0, "requests": 0, "failures": 0, "prefetched": 0,
+                        "batches": 0, "batched_pairs": 0}
+
+    def get(self, pair, max_wait=0):
+        """Advice for `pair` without requesting it on this thread. None if there is none yet, after waiting
+        up to `max_wait` seconds for the request that is running or started now."""
+        ttl = self.config.get("ai_advice_cache_duration", 300)
+        with self.lock:
+            entry = self.entries.get(pair)
+            age = self.clock.time() - entry[1] if entry else None
+            if entry and age < ttl:
+                self.metrics["fresh_hits"] += 1
+                return entry[0]
+            future = self._schedule(pair)
+            if entry and age < ttl + self.config.get("ai_advice_max_stale", 900):
+                self.metrics["stale_hits"] += 1
+                return entry[0]
+            self.metrics["misses"] += 1
+        if max_wait and future is not None:
+            try:
+                return future.result(timeout=max_wait)
+            except concurrent.futures.TimeoutError:
+                return None
+        return None
+
+    def prefetch(self, pairs):
+        """Requests advice for every pair in `pairs` whose advice is missing or no longer fresh, in batches."""
+        ttl = self.config.get("ai_advice_cache_duration", 300)
+        batch_size = max(1, self.config.get("ai_advice_batch_size", 5)) if self.fetch_batch else 1
+        now = self.clock.time()
+        with self.lock:
+            due = [pair for pair in dict.fromkeys(pairs)
+                   if (pair not in self.entries or now - self.entries[pair][1] >= ttl)
+                   and pair not in self.in_flight and now >= self.retry_after.get(pair, 0)]
+            for i in range(0, len(due), batch_size):
+                self._submit(due[i:i + batch_size])
+            self.metrics["prefetched"] += len(due)
+
+    def _schedule(self, pair):
+        """The pair's running request, started now if there is none and the pair is not backing off. Lock held."""
+        future = self.in_flight.get(pair)
+        if future is None and self.clock.time() >= self.retry_after.get(pair, 0):
+            future = self._submit([pair])[pair]
+        return future
+
+    def _submit(self, pairs):
+        """Starts one request for `pairs` and marks them in flight. Lock held."""
+        futures = {pair: concurrent.futures.Future() for pair in pairs}
+        self.in_flight.update(futures)
+        self.executor.submit(self._refresh, pairs, futures)
+        return futures
+
+    def _refresh(self, pairs, futures):
+        started = time.perf_counter()
+        results = {}
+        try:
+            results = self.fetch_batch(pairs) if len(pairs) > 1 else {pairs[0]: self.fetch(pairs[0])}
+        except Exception as e:
+            logger.error(f"AI advice request for {', '.join(pairs)} failed: {e}", exc_info=True)
+        with self.lock:
+            self.metrics["requests"] += 1
+            if len(pairs) > 1:
+                self.metrics["batches"] += 1
+                self.metrics["batched_pairs"] += len(pairs)
+            self.latencies.append(time.perf_counter() - started)
+            now = self.clock.time()
+            for pair in pairs:
+                del self.in_flight[pair]
+                if results.get(pair):
+                    self.entries[pair] = (results[pair], now)
+                    self.retry_after.pop(pair, None)
+                else:
+                    self.metrics["failures"] += 1
+                    self.retry_after[pair] = now + self.config.get("ai_advice_retry_seconds", 60)
+        for pair, future in futures.items():
+            future.set_result(results.get(pair))
+
+    def get_metrics(self):
+        with self.lock:
+            latencies = sorted(self.latencies)
+            return dict(self.metrics, cached=len(self.entries), in_flight=len(self.in_flight),
+                        latency_p95=latencies[min(len(latencies) - 1, int(0.95 * len(latencies)))] if latencies else 0.0)
+
+class LocalAdvisor:
+    """Linear model for TP/SL/max-time advice from indicator features, trained on the trade journal.
+
+    `train` fits a ridge regression per advice value on the completed trades that made a profit: the
+    gain the trade realized and the time it took to reach its take profit (or the time it was allowed).
+    The stop loss is not learned, since a winning trade only shows the stop loss it was given; local
+    advice keeps the mode's. Features use closed candles only, live and in training alike. `save` writes the model as `advisor_vNNNN.json`, one version higher
+    each time, and `load` reads the newest or a chosen version. `predict` is a few multiply-adds with
+    the same clamping as Gemini advice, so it answers in microseconds.
+    """
+    INTERVAL = '15m' # candles the features are computed on, as for the Gemini prompt
+    FEATURES = ("rsi", "ema20_distance_pct", "bb_width_pct", "bb_position", "return_pct", "range_pct", "volume_ratio", "side")
+    TARGETS = ("tp_percentage", "max_trade_time_seconds")
+    FILE_PATTERN = re.compile(r"^advisor_v(\d+)\.json$")
+
+    def __init__(self, model):
+        self.model = model
+        self.version = model["version"]
+        self.samples = model["samples"]
+        # Standardization folded into the weights: value = intercept + sum(coef * feature)
+        mean, std, weights = np.array(model["mean"]), np.array(model["std"]), np.array(model["weights"])
+        coefs = weights[1:] / std[:, None]
+        self.intercepts = (weights[0] - mean @ coefs).tolist()
+        self.coefs = coefs.T.tolist()
+
+    @staticmethod
+    def features(indicators, candles, side):
+        """Feature vector (FEATURES order) from `_calculate_indicators`-format indicators and the recent
+        (open, high, low, close, volume) candles, oldest first."""
+        price, first_close = candles[-1][3], candles[0][3]
+        ema, lower, upper = indicators.get('ema20', price), indicators.get('bb_lower'), indicators.get('bb_upper')
+        volumes = [candle[4] for candle in candles]
+        mean_volume = sum(volumes) / len(volumes)
+        return [indicators.get('rsi', 50.0),
+                (price - ema) / ema * 100 if ema else 0.0,
+                indicators.get('bb_width', 0.0),
+                (price - lower) / (upper - lower) if lower is not None and upper > lower else 0.5,
+                (price - first_close) / first_close * 100 if first_close else 0.0,
+                sum((high - low) / close for _, high, low, close, _ in candles if close) / len(candles) * 100,
+                volumes[-1] / mean_volume if mean_volume else 1.0,
+                1.0 if side == "BUY" else -1.0]
+
+    @classmethod
+    def features_at(cls, kline_store, pair, side, timestamp):
+        """Features as of `timestamp` rebuilt from the candles that had closed by then, or None without enough of them."""
+        interval_ms = KLINE_INTERVAL_MS[cls.INTERVAL]
+        entry_ms = int(timestamp * 1000)
+        state = IndicatorState()
+        for row in kline_store.candles(pair, cls.INTERVAL, entry_ms - 100 * interval_ms, entry_ms - interval_ms + 1):
+            state.add_candle((int(row['open_time']), float(row['open']), float(row['high']), float(row['low']),
+                              float(row['close']), float(row['volume'])))
+        indicators = state.values()
+        if 'rsi' not in indicators or 'bb_middle' not in indicators: return None
+        return cls.features(indicators, [candle[1:] for candle in state.candles], side)
+
+    @classmethod
+    def training_samples(cls, trades, kline_store):
+        """(features, targets) of the profitable completed trades, oldest first, and a Counter of skipped ones."""
+        samples, skipped = [], collections.Counter()
+        for trade in sorted(trades, key=lambda t: t.get('timestamp', 0)):
+            if not trade.get('completed') or not trade.get('result') or trade['result'] <= 0 or not trade.get('entry_price'):
+                skipped["not profitable"] += 1
+                continue
+            features = trade.get('entry_features') or cls.features_at(kline_store, trade['pair'], trade['type'], trade['timestamp'])
+            if not features:
+                skipped["no candles before entry"] += 1
+                continue
+            if trade.get('close_reason') == "take_profit":
+                held = datetime.strptime(trade['exit_time'], "%Y-%m-%d %H:%M:%S") - datetime.strptime(trade['entry_time'], "%Y-%m-%d %H:%M:%S")
+                time_target = held.total_seconds()
+            else:
+                time_target = trade['max_time_seconds']
+            samples.append((features, [trade['result'], time_target]))
+        return samples, skipped
+
+    @classmethod
+    def train(cls, samples, ridge=1.0, holdout=0.2):
+        """Model dict fitted on all samples. The error on the newest `holdout` share, when fitted on the rest,
+        is reported next to that of always answering the mean."""
+        x, y = np.array([f for f, _ in samples], dtype=float), np.array([t for _, t in samples], dtype=float)
+
+        def fit(x, y):
+            mean, std = x.mean(axis=0), x.std(axis=0)
+            std[std == 0] = 1.0
+            z = np.hstack([np.ones((len(x), 1)), (x - mean) / std])
+            penalty = ridge * np.eye(z.shape[1])
+            penalty[0, 0] = 0 # the intercept is not shrunk
+            return mean, std, np.linalg.solve(z.T @ z + penalty, z.T @ y)
+
+        model = {"features": list(cls.FEATURES), "targets": list(cls.TARGETS), "ridge": ridge, "samples": len(samples)}
+        split = int(len(samples) * (1 - holdout))
+        if 0 < split < len(samples):
+            mean, std, weights = fit(x[:split], y[:split])
+            predicted = np.hstack([np.ones((len(x) - split, 1)), (x[split:] - mean) / std]) @ weights
+            model["holdout_mae"] = dict(zip(cls.TARGETS, np.abs(predicted - y[split:]).mean(axis=0).tolist()))
+            model["baseline_mae"] = dict(zip(cls.TARGETS, np.abs(y[:split].mean(axis=0) - y[split:]).mean(axis=0).tolist()))
+        mean, std, weights = fit(x, y)
+        model.update(mean=mean.tolist(), std=std.tolist(), weights=weights.tolist())
+        return model
+
+    @classmethod
+    def versions(cls, directory):
+        if not os.path.isdir(directory): return []
+        return sorted(int(match.group(1)) for match in map(cls.FILE_PATTERN.match, os.listdir(directory)) if match)
+
+    @classmethod
+    def save(cls, model, directory):
+        """Writes `model` as the next version in `directory`; returns the file path."""
+        os.makedirs(directory, exist_ok=True)
+        model = dict(model, version=(cls.versions(directory) or [0])[-1] + 1, trained_at=datetime.now().isoformat(timespec="seconds"))
+        path = os.path.join(directory, f"advisor_v{model['version']:04d}.json")
+        with open(f"{path}.tmp", "w", encoding="utf-8") as f:
+            json.dump(model, f, indent=1)
+        os.replace(f"{path}.tmp", path)
+        return path
+
+    @classmethod
+    def load(cls, directory, version=0):
+        """The model of `version` (0 = the newest) in `directory`, or None if there is none."""
+        versions = cls.versions(directory)
+        if version: versions = [v for v in versions if v == version]
+        if not versions: return None
+        path = os.path.join(directory, f"advisor_v{versions[-1]:04d}.json")
+        try:
+            with open(path, encoding="utf-8") as f:
+                model = json.load(f)
+            if model.get("features") != list(cls.FEATURES) or model.get("targets") != list(cls.TARGETS):
+                raise ValueError("features or targets differ from this version of the bot")
+            return cls(model)
+        except (OSError, ValueError, KeyError) as e:
+            logger.error(f"Could not load the local advice model {path}: {e}")
+            return None
+
+    def predict(self, features):
+        """TP and max-time advice for a feature vector, clamped like Gemini advice; the caller adds the stop loss and rationale."""
+        tp, max_time = (intercept + sum(c * x for c, x in zip(coefs, features)) for intercept, coefs in zip(self.intercepts, self.coefs))
+        return {"tp_percentage": max(0.1, min(10.0, tp)), "max_trade_time_seconds": max(60, min(3600, int(max_time)))}
+
 class TradingBot:
-    def __init__(self, config, telegram_bot=None):
+    def __init__(self, config, telegram_bot=None, ai_model=None):
         self.config = config
         self.telegram_bot = telegram_bot # Instance of TelegramBotHandler
+        self.ai_model = ai_model or gemini_model # Anything with Gemini's generate_content(); None disables AI advice
         self.running = False
         self.trading_thread = None
+        self.indicator_feed_thread = None
         self.whale_detector = None
         # Use a default admin chat_id for internal API/MarketAnalyzer error reporting if telegram_bot not fully up.
         self.default_chat_id_for_internal_errors = ADMIN_USER_IDS[0] if ADMIN_USER_IDS else None
-        self.market_analyzer = MarketAnalyzer(config, self.default_chat_id_for_internal_errors)
+        self.replay = None
+        if config.get("replay_file"):
+            # A replay never touches the exchange or the real trade journal, and starts from an empty one each run
+            config.update({"use_real_trading": False, "mock_mode": False, "trade_db_file": config["replay_file"] + ".trades.db"})
+            for path in (config["trade_db_file"], config["trade_db_file"] + "-wal", config["trade_db_file"] + "-shm"):
+                if os.path.exists(path): os.remove(path) # a stale WAL would be replayed into the fresh journal
+            drain_seconds = max([config.get("max_trade_time", 300)] + [mode["max_trade_time"] for mode in TRADING_MODES.values()])
+            self.replay = MarketReplay(config["replay_file"], config.get("replay_speed", 1), config.get("replay_seed", 0), drain_seconds)
+        self.clock = self.replay.clock if self.replay else SYSTEM_CLOCK
+        self.event_bus = EventBus()
+        self.strategy_engine = StrategyEngine(config, self.event_bus, self.clock)
+        self.indicator_engine = IndicatorEngine()
+        self.kline_store = KlineStore(config.get("kline_store_dir", "klines"), config.get("kline_backfill_candles", 1000))
+        self.market_analyzer = MarketAnalyzer(config, self.default_chat_id_for_internal_errors, self.clock)
+        self.market_analyzer.event_bus = self.event_bus
         self.trade_monitor_thread = None
-        self.notification_queue = queue.Queue()
-        self.notification_thread = None
         self.binance_api = BinanceAPI(config, self.default_chat_id_for_internal_errors) if config["api_key"] and config["api_secret"] else None
+        self.trade_store = TradeStore(config.get("trade_db_file", "trades.db"), config.get("completed_trades_in_memory", 500),
+                                      self.default_chat_id_for_internal_errors, self.clock)
         self.reset_daily_stats()
-        self.ai_advice_cache = {} # { "PAIR": {"timestamp": time.time(), "advice": {...}} }
+        self.advice_cache = AdviceCache(config.get("ai_advice_cache_file", "ai_advice_cache.json"), config.get("ai_advice_cache_size", 512),
+                                        config.get("ai_advice_cache_ttl", 1800), self.clock)
+        self.ai_metrics = {"calls": 0, "batch_calls": 0, "batch_pairs": 0, "fallback_pairs": 0, "mode_fallbacks": 0, # Gemini requests sent, trades without advice
+                           "local_predictions": 0, "local_seconds": 0.0}
+        self.ai_metrics_lock = threading.Lock()
+        self.ai_breaker = CircuitBreaker("Gemini", config.get("ai_breaker_window", 20), config.get("ai_breaker_min_calls", 5),
+                                         config.get("ai_breaker_failure_rate", 0.5), config.get("ai_breaker_open_seconds", 120),
+                                         self.clock, self._on_ai_breaker_open)
+        self.advice_service = AdviceService(config, self._request_ai_advice, self.clock, self._request_ai_advice_batch)
+        self.local_advisor = None
+        if config.get("ai_advisor", "gemini") != "gemini":
+            self.local_advisor = LocalAdvisor.load(config.get("ai_model_dir", "advisor_models"), config.get("ai_local_model_version", 0))
+            if self.local_advisor is None:
+                logger.warning(f"ai_advisor is {config['ai_advisor']} but no local advice model was found in {config.get('ai_model_dir', 'advisor_models')}; "
+                               f"using Gemini. Train one with `python spotAI.py train-advisor`.")
+        self.price_feed = PriceFeed(config, self.default_chat_id_for_internal_errors, self.event_bus, self.clock) if websocket is not None or self.replay else None
+        self.account_state = None # AccountStateCache whose user data stream was started by start_trading
+        self.event_bus.subscribe((EVENT_DAILY_LIMIT,), self._on_daily_limit)
 
     def reset_daily_stats(self):
-        DAILY_STATS.update({"date": datetime.now().strftime("%Y-%m-%d"), "total_trades": 0, "winning_trades": 0,
+        DAILY_STATS.update({"date": self.clock.now().strftime("%Y-%m-%d"), "total_trades": 0, "winning_trades": 0,
                             "losing_trades": 0, "total_profit_pct": 0.0, "total_profit_bnb": 0.0,
                             "starting_balance": 0.0, "current_balance": 0.0})
         if self.binance_api and self.config.get("use_real_trading"):
             try:
-                account_info = self.binance_api.get_account_info()
+                account_info = self.binance_api.get_cached_account_info()
                 if account_info and 'balances' in account_info:
                     bnb_balance = next((float(a['free']) + float(a['locked']) for a in account_info['balances'] if a['asset'] == 'BNB'), 0.0)
                     DAILY_STATS.update({"starting_balance": bnb_balance, "current_balance": bnb_balance})
@@ -769,7 +3718,55 @@ class TradingBot:
     def set_whale_detector(self, detector):
         self.whale_detector = detector
 
-    def send_notification(self, message, keyboard=None, target_chat_id=None): # target_chat_id for specific user context
+    def _start_replay(self):
+        """Routes the recorded streams to the components their live counterparts feed and starts the
+        replay once both trading loops are waiting on it."""
+        self.replay.on("miniTicker", self.market_analyzer._on_mini_ticker_frame)
+        self.replay.on("kline", self._on_replay_kline)
+        if self.price_feed: self.replay.on("bookTicker", self.price_feed._on_book_ticker)
+        if self.whale_detector: self.replay.on("aggTrade", self.whale_detector.on_agg_trade)
+        if not self.replay.start(consumers=2):
+            logger.warning(f"Replay of {self.replay.path} already ran; restart the bot to replay it again.")
+
+    def _on_replay_kline(self, stream_name, data):
+        kline = data['k']
+        row = [kline['t'], kline['o'], kline['h'], kline['l'], kline['c'], kline['v'], kline['T']]
+        now_ms = kline['T'] + 1 if kline.get('x') else int(self.clock.time() * 1000) # a closed candle is applied, an open one is the forming one
+        self.indicator_engine.update(kline['s'], kline['i'], [row], now_ms)
+        if kline.get('x'):
+            self.strategy_engine.update_indicators(kline['s'], kline['i'], self.indicator_engine.indicators(kline['s'], kline['i'], forming=False))
+
+    def indicator_feed_loop(self):
+        """Keeps the strategy indicators current for every snapshot symbol while an enabled strategy uses
+        them: each symbol is refreshed once per candle of the strategy interval, after that candle opens."""
+        refreshed = {} # pair -> open time of the candle that was forming at its last refresh
+        while self.running:
+            try:
+                binance_api = (self.market_analyzer.binance_api if self.market_analyzer else None) or self.binance_api
+                if binance_api is not None and not self.config.get("mock_mode", True) and self.strategy_engine.uses_indicators():
+                    with self.market_analyzer.lock:
+                        pairs = list(self.market_analyzer.snapshot.pairs)
+                    for pair in pairs:
+                        if not self.running: break
+                        now_ms = int(self.clock.time() * 1000)
+                        candle_open = now_ms - now_ms % KLINE_INTERVAL_MS[self.strategy_engine.interval]
+                        if refreshed.get(pair) == candle_open: continue
+                        self.refresh_strategy_indicators(pair, binance_api, now_ms)
+                        refreshed[pair] = candle_open
+            except Exception as e:
+                logger.error(f"Strategy indicator feed error: {e}", exc_info=True)
+            time.sleep(1)
+
+    def refresh_strategy_indicators(self, pair, binance_api, now_ms=None):
+        """Syncs `pair`'s closed candles of the strategy interval and hands their indicators to the strategy engine."""
+        interval = self.strategy_engine.interval
+        now_ms = now_ms or int(self.clock.time() * 1000)
+        self.kline_store.sync(binance_api, pair, interval, now_ms)
+        klines = self.kline_store.latest(pair, interval, self.indicator_engine.klines_needed(pair, interval, now_ms), now_ms)
+        if klines and self.indicator_engine.update(pair, interval, klines, now_ms) >= 20: # enough candles for the indicators
+            self.strategy_engine.update_indicators(pair, interval, self.indicator_engine.indicators(pair, interval, forming=False))
+
+    def send_notification(self, message, keyboard=None, target_chat_id=None, priority=NOTIFY_INFO): # target_chat_id for specific user context
         if not self.telegram_bot:
             logger.warning(_t("warning_cannot_send_notification_no_bot", self.default_chat_id_for_internal_errors))
             return
@@ -783,85 +3780,10 @@ class TradingBot:
              logger.warning(_t("warning_cannot_send_notification_no_admin_ids", self.default_chat_id_for_internal_errors))
              return
         try:
-            # Queue tuple: (message, keyboard, list_of_chat_ids_to_send_to)
-            self.notification_queue.put((message, keyboard, admin_chats_to_notify))
+            self.telegram_bot.notification_dispatcher.submit(message, keyboard, admin_chats_to_notify, priority)
         except Exception as e:
             logger.error(_t("error_queueing_notification", self.default_chat_id_for_internal_errors, e=e))
 
-    def process_notification_queue(self):
-        logger.info(_t("info_notification_queue_processor_start", self.default_chat_id_for_internal_errors))
-        ptb_event_loop = None
-        if self.telegram_bot and hasattr(self.telegram_bot, 'application') and \
-           self.telegram_bot.application and hasattr(self.telegram_bot.application, 'bot') and \
-           self.telegram_bot.application.bot and hasattr(self.telegram_bot.application.bot, '_loop'): # Note: _loop is internal
-            ptb_event_loop = self.telegram_bot.application.bot._loop
-        else:
-            logger.info(_t("info_ptb_event_loop_not_accessible_notif", self.default_chat_id_for_internal_errors))
-
-        while True:
-            try:
-                item = self.notification_queue.get(block=True)
-                if item is None:
-                    logger.info(_t("info_notification_queue_processor_stop_signal", self.default_chat_id_for_internal_errors))
-                    self.notification_queue.task_done()
-                    break
-                message, keyboard, chat_ids_to_notify = item
-                logger.debug(f"Processing notification from queue: {message[:30]}... for chat_ids: {chat_ids_to_notify}")
-
-                if not (self.telegram_bot and hasattr(self.telegram_bot, 'application') and
-                        self.telegram_bot.application and hasattr(self.telegram_bot.application, 'bot') and
-                        self.telegram_bot.application.bot):
-                    logger.error(_t("error_notification_telegram_send_init", self.default_chat_id_for_internal_errors))
-                    self.notification_queue.task_done()
-                    time.sleep(1)
-                    continue
-                
-                if ptb_event_loop is None and hasattr(self.telegram_bot.application.bot, '_loop'):
-                    ptb_event_loop = self.telegram_bot.application.bot._loop
-                    if ptb_event_loop: logger.info(_t("info_ptb_event_loop_acquired_notification", self.default_chat_id_for_internal_errors))
-
-                for chat_id in chat_ids_to_notify:
-                    coro_sent_async = False
-                    if ptb_event_loop:
-                        try:
-                            coro = self.telegram_bot.application.bot.send_message(
-                                chat_id=chat_id, text=message,
-                                reply_markup=InlineKeyboardMarkup(keyboard) if keyboard else None,
-                                parse_mode=ParseMode.HTML # Assuming messages might contain HTML
-                            )
-                            future = asyncio.run_coroutine_threadsafe(coro, ptb_event_loop)
-                            future.result(timeout=20)
-                            coro_sent_async = True
-                        except asyncio.TimeoutError:
-                            logger.error(_t("error_notification_timeout_async", chat_id, chat_id=chat_id))
-                        except Exception as e_async:
-                            logger.error(_t("error_notification_failed_async", chat_id, chat_id=chat_id, type_name=type(e_async).__name__, e=e_async))
-                    
-                    if not coro_sent_async:
-                        try:
-                            logger.info(_t("info_using_fallback_notification", chat_id, chat_id=chat_id))
-                            token = self.telegram_bot.token
-                            url = f"https://api.telegram.org/bot{token}/sendMessage"
-                            payload = {'chat_id': chat_id, 'text': message, 'parse_mode': ParseMode.HTML}
-                            if keyboard:
-                                payload['reply_markup'] = json.dumps({'inline_keyboard': keyboard})
-                            response = requests.post(url, json=payload, timeout=15)
-                            if response.status_code == 200:
-                                logger.info(_t("info_sent_notification_fallback_success", chat_id, chat_id=chat_id))
-                            else:
-                                logger.error(_t("error_notification_fallback_failed", chat_id, chat_id=chat_id, status_code=response.status_code, response_text=response.text))
-                        except Exception as e_fallback:
-                            logger.error(_t("error_notification_fallback_exception", chat_id, chat_id=chat_id, e_fallback=e_fallback))
-                self.notification_queue.task_done()
-                time.sleep(0.25)
-            except Exception as e_outer:
-                logger.error(_t("error_notification_queue_outer_loop", self.default_chat_id_for_internal_errors, e=e_outer), exc_info=True)
-                if 'item' in locals() and item is not None:
-                    try: self.notification_queue.task_done()
-                    except ValueError: pass
-                time.sleep(5)
-        logger.info(_t("info_notification_queue_processor_finished", self.default_chat_id_for_internal_errors))
-
     def start_trading(self, chat_id_context=None): # chat_id for notifications related to starting
         if not self.running:
             if self.config.get("use_real_trading", False):
@@ -880,15 +3802,22 @@ class TradingBot:
             self.trade_monitor_thread = threading.Thread(target=self.monitor_trades_loop, args=(chat_id_context,))
             self.trade_monitor_thread.daemon = True
             self.trade_monitor_thread.start()
-            
-            if self.notification_thread is None or not self.notification_thread.is_alive():
-                self.notification_thread = threading.Thread(target=self.process_notification_queue)
-                self.notification_thread.daemon = True
-                self.notification_thread.start()
 
-            if self.config.get("whale_detection", False) and self.whale_detector:
+            if not self.replay: # replayed indicators come from the recorded @kline streams
+                self.indicator_feed_thread = threading.Thread(target=self.indicator_feed_loop, name="indicator-feed")
+                self.indicator_feed_thread.daemon = True
+                self.indicator_feed_thread.start()
+
+            if self.config.get("whale_detection", False) and self.whale_detector and not self.replay: # replayed whales come from @aggTrade
                 self.whale_detector.start_detection()
+            if self.price_feed and self.config.get("price_feed_stream", True) and self.config.get("use_real_trading"):
+                self.price_feed.start()
+            if self.binance_api and self.config.get("use_real_trading"):
+                self.account_state = self.binance_api.account_state
+                self.account_state.start(self.binance_api)
             self.reset_daily_stats()
+            if self.replay:
+                self._start_replay()
             logger.info(_t("info_trading_bot_started", chat_id_context or self.default_chat_id_for_internal_errors,
                             real_trading=self.config.get('use_real_trading'), mock_mode=self.config.get('mock_mode')))
             return True
@@ -898,16 +3827,17 @@ class TradingBot:
     def stop_trading(self, chat_id_context=None):
         if self.running:
             self.running = False
+            self.event_bus.publish(EVENT_TRADING_STOPPED)
+            if self.replay: self.replay.stop()
             if self.market_analyzer: self.market_analyzer.stop_updating()
             if self.whale_detector: self.whale_detector.stop_detection()
+            if self.price_feed: self.price_feed.stop()
+            if self.account_state:
+                self.account_state.stop()
+                self.account_state = None
             if self.trading_thread and self.trading_thread.is_alive(): self.trading_thread.join(timeout=5.0)
             if self.trade_monitor_thread and self.trade_monitor_thread.is_alive(): self.trade_monitor_thread.join(timeout=5.0)
-            if self.notification_thread and self.notification_thread.is_alive():
-                try:
-                    self.notification_queue.put(None)
-                    self.notification_thread.join(timeout=5.0)
-                except Exception as e:
-                    logger.error(_t("error_stopping_notification_thread", chat_id_context or self.default_chat_id_for_internal_errors, e=e))
+            if self.indicator_feed_thread and self.indicator_feed_thread.is_alive(): self.indicator_feed_thread.join(timeout=5.0)
             logger.info(_t("info_trading_bot_stopped", chat_id_context or self.default_chat_id_for_internal_errors))
             return True
         logger.info(_t("info_trading_bot_already_stopped", chat_id_context or self.default_chat_id_for_internal_errors))
@@ -930,6 +3860,7 @@ class TradingBot:
             logger.info(_t("info_applied_trading_mode", chat_id_context or self.default_chat_id_for_internal_errors, mode=mode))
         else:
             logger.warning(_t("warning_trading_mode_not_found_using_default", chat_id_context or self.default_chat_id_for_internal_errors, mode=mode))
+        self.event_bus.publish(EVENT_CONFIG_CHANGED, param=None)
 
     def _format_trade_notification(self, trade, selection_detail_text, notification_type_key, chat_id):
         real_trade_status_key = "trade_status_real_no_sim"
@@ -968,241 +3899,429 @@ class TradingBot:
             loss_limit = self.config.get("daily_loss_limit", 5.0)
             if current_profit_pct >= profit_target:
                 logger.info(_t("info_daily_profit_target_reached", chat_id_context or self.default_chat_id_for_internal_errors, current_profit_pct=current_profit_pct, profit_target=profit_target))
-                self.send_notification(_t("daily_stats_notification_profit_target_reached", chat_id_context or self.default_chat_id_for_internal_errors, current_profit_pct=current_profit_pct, profit_target=profit_target), target_chat_id=chat_id_context)
+                self.send_notification(_t("daily_stats_notification_profit_target_reached", chat_id_context or self.default_chat_id_for_internal_errors, current_profit_pct=current_profit_pct, profit_target=profit_target), target_chat_id=chat_id_context, priority=NOTIFY_CRITICAL)
+                self.event_bus.publish(EVENT_DAILY_LIMIT, limit="profit_target", profit_pct=current_profit_pct)
                 return False
             if current_profit_pct <= -loss_limit:
                 logger.info(_t("info_daily_loss_limit_reached", chat_id_context or self.default_chat_id_for_internal_errors, current_profit_pct=current_profit_pct, loss_limit=loss_limit))
-                self.send_notification(_t("daily_stats_notification_loss_limit_reached", chat_id_context or self.default_chat_id_for_internal_errors, current_loss_pct=current_profit_pct, loss_limit=loss_limit), target_chat_id=chat_id_context)
+                self.send_notification(_t("daily_stats_notification_loss_limit_reached", chat_id_context or self.default_chat_id_for_internal_errors, current_loss_pct=current_profit_pct, loss_limit=loss_limit), target_chat_id=chat_id_context, priority=NOTIFY_CRITICAL)
+                self.event_bus.publish(EVENT_DAILY_LIMIT, limit="loss_limit", profit_pct=current_profit_pct)
                 return False
         return True
 
-    def trading_loop(self, chat_id_context=None): # Pass chat_id for context specific notifications
-        while self.running:
-            try:
-                if not self.config.get("trading_enabled", False):
-                    time.sleep(5)
-                    continue
-                if not self.check_daily_limits(chat_id_context):
-                    logger.info(_t("info_daily_limits_reached_pausing", chat_id_context or self.default_chat_id_for_internal_errors))
-                    self.config["trading_enabled"] = False
-                    time.sleep(3600)
-                    continue
-                
-                active_trades_count = sum(1 for t in ACTIVE_TRADES if not t.get('completed', False))
-                if active_trades_count >= self.config.get("max_concurrent_trades", 3):
-                    time.sleep(3)
-                    continue
+    def _on_daily_limit(self, event_type, data):
+        # A daily limit pauses new entries until an admin turns trading back on; open trades keep being monitored
+        logger.info(_t("info_daily_limits_reached_pausing", self.default_chat_id_for_internal_errors))
+        self.config["trading_enabled"] = False
 
-                if self.config.get("auto_select_pairs", True) and self.market_analyzer:
-                    best_pairs = self.market_analyzer.get_best_trading_pairs(
-                        min_volume=self.config.get("min_volume"),
-                        min_price_change=self.config.get("min_price_change"), limit=3)
-                    if best_pairs:
-                        selected_pair_data = random.choice(best_pairs)
-                        pair_name = selected_pair_data["pair"]
-                        if any(t['pair'] == pair_name and not t.get('completed', False) for t in ACTIVE_TRADES):
-                            time.sleep(1)
-                            continue
-                        trade_type = "BUY" if selected_pair_data.get("price_change", 0) > 0 else "SELL"
-                        if random.random() < 0.3:
-                            logger.info(_t("info_attempt_auto_create_trade", chat_id_context or self.default_chat_id_for_internal_errors, pair_name=pair_name, trade_type=trade_type))
-                            trade = self.create_trade(pair_name, trade_type, selected_pair_data.get("last_price"), chat_id_for_trade=chat_id_context)
-                            if trade:
-                                selection_details = f"Vol: {selected_pair_data.get('quote_volume', selected_pair_data.get('volume',0)):.2f}, Chg: {selected_pair_data.get('price_change',0):.2f}%"
-                                entry_message = self._format_trade_notification(trade, selection_details, "trade_notification_new_auto_selected", chat_id_context or self.default_chat_id_for_internal_errors)
-                                self.send_notification(entry_message, target_chat_id=chat_id_context) # Send to specific user if context exists
-                time.sleep(random.uniform(4, 7))
-            except Exception as e:
-                logger.error(_t("error_trading_loop", chat_id_context or self.default_chat_id_for_internal_errors, e=e), exc_info=True)
-                time.sleep(10)
+    def trading_loop(self, chat_id_context=None): # Pass chat_id for context specific notifications
+        # Entries are only re-evaluated when something they depend on changed: a new market snapshot,
+        # a closed trade (a free slot, new daily P/L) or a config change. Events arriving within
+        # entry_evaluation_interval of the last evaluation are folded into the next one.
+        inbox = EventInbox(self.clock)
+        self.event_bus.subscribe((EVENT_MARKET_UPDATED, EVENT_TRADE_CLOSED, EVENT_CONFIG_CHANGED, EVENT_TRADING_STOPPED), inbox.post)
+        pending, next_evaluation = True, 0
+        try:
+            while self.running:
+                try:
+                    if pending and self.clock.time() >= next_evaluation:
+                        pending = False
+                        next_evaluation = self.clock.time() + self.config.get("entry_evaluation_interval", 5)
+                        self._evaluate_entry(chat_id_context)
+                    if inbox.wait(max(0.0, next_evaluation - self.clock.time()) if pending else None):
+                        pending = True
+                except Exception as e:
+                    logger.error(_t("error_trading_loop", chat_id_context or self.default_chat_id_for_internal_errors, e=e), exc_info=True)
+                    time.sleep(10)
+        finally:
+            self.event_bus.unsubscribe(inbox.post)
+            inbox.close()
+
+    def _evaluate_entry(self, chat_id_context=None):
+        if not self.config.get("trading_enabled", False):
+            return
+        if not self.check_daily_limits(chat_id_context):
+            return # _on_daily_limit paused entries
+        slots = self.config.get("max_concurrent_trades", 3) - self.trade_store.active_count()
+        if slots <= 0 or not (self.config.get("auto_select_pairs", True) and self.market_analyzer):
+            return
+        if self.config.get("ai_dynamic_mode") and self.ai_model and not self.ai_breaker.is_open() and \
+                (self.local_advisor is None or self.config.get("ai_advisor", "gemini") != "local"):
+            self.advice_service.prefetch([row['pair'] for row in self.market_analyzer.get_best_trading_pairs(limit=self.config.get("ai_prefetch_pairs", 5))])
+        with self.market_analyzer.lock:
+            signals = self.strategy_engine.select_entries(self.market_analyzer.snapshot, self.trade_store.active_trades(), slots)
+        for signal in signals:
+            logger.info(_t("info_attempt_auto_create_trade", chat_id_context or self.default_chat_id_for_internal_errors, pair_name=signal.pair, trade_type=signal.side))
+            trade = self.create_trade(signal.pair, signal.side, signal.price, chat_id_for_trade=chat_id_context, strategy=signal.strategy)
+            if trade:
+                self.strategy_engine.record_entry(signal)
+                selection_details = f"{signal.strategy.replace('_', ' ').capitalize()}, score {signal.score:.2f}"
+                entry_message = self._format_trade_notification(trade, selection_details, "trade_notification_new_auto_selected", chat_id_context or self.default_chat_id_for_internal_errors)
+                self.send_notification(entry_message, target_chat_id=chat_id_context, priority=NOTIFY_ENTRY) # Send to specific user if context exists
 
     def monitor_trades_loop(self, chat_id_context=None):
-        while self.running:
-            try:
-                current_active_trades = [t for t in ACTIVE_TRADES if not t.get('completed', False)]
-                for trade in current_active_trades:
-                    current_time = time.time()
-                    trade_duration = current_time - trade.get('timestamp', current_time)
-                    current_price = None
-                    if trade.get('real_trade_filled') and self.binance_api and self.config.get("use_real_trading"):
-                        current_price = self.binance_api.get_ticker_price(trade['pair'])
-                        if current_price is None:
-                            logger.warning(_t("warning_failed_get_real_price_fallback_simulated", chat_id_context or self.default_chat_id_for_internal_errors, pair=trade['pair']))
-                            current_price = self.simulate_price_movement(trade)
+        inbox = EventInbox(self.clock)
+        # Replayed trades are priced from the recorded streams, so every market update can move them
+        self.event_bus.subscribe((EVENT_PRICE_TICK, EVENT_TRADE_OPENED, EVENT_TRADE_CLOSED, EVENT_TRADING_STOPPED) +
+                                 ((EVENT_MARKET_UPDATED,) if self.replay else ()), inbox.post)
+        events = {EVENT_TRADE_OPENED: []}
+        next_full_pass, feed_symbols = 0, None
+        try:
+            while self.running:
+                try:
+                    current_active_trades = self.trade_store.active_trades()
+                    feed_live = self.price_feed is not None and self.price_feed.is_live()
+                    if self.price_feed is not None and self.price_feed.stream.running:
+                        wanted_symbols = {t['pair'] for t in current_active_trades if t.get('real_trade_filled')}
+                        if wanted_symbols != feed_symbols:
+                            self.price_feed.set_symbols(wanted_symbols)
+                            feed_symbols = wanted_symbols
+                    # A tick only re-checks trades on the symbols that moved; everything is checked
+                    # when a trade opens and at the next deadline.
+                    if EVENT_TRADE_OPENED in events or EVENT_MARKET_UPDATED in events or \
+                       (next_full_pass is not None and self.clock.time() >= next_full_pass):
+                        trades_to_check = current_active_trades
                     else:
-                        current_price = self.simulate_price_movement(trade)
-                    if current_price is None: continue
-
-                    tp_hit = (trade['type'] == "BUY" and current_price >= trade['take_profit']) or \
-                             (trade['type'] == "SELL" and current_price <= trade['take_profit'])
-                    sl_hit = (trade['type'] == "BUY" and current_price <= trade['stop_loss']) or \
-                             (trade['type'] == "SELL" and current_price >= trade['stop_loss'])
-                    time_limit_reached = trade_duration >= trade.get('max_time_seconds', 300)
-
-                    if tp_hit: self.complete_trade(trade, current_price, "take_profit", chat_id_context)
-                    elif sl_hit: self.complete_trade(trade, current_price, "stop_loss", chat_id_context)
-                    elif time_limit_reached: self.complete_trade(trade, current_price, "time_limit", chat_id_context)
-                time.sleep(1)
-            except Exception as e:
-                logger.error(_t("error_trade_monitor_loop", chat_id_context or self.default_chat_id_for_internal_errors, e=e), exc_info=True)
-                time.sleep(5)
+                        ticked_symbols = {data['symbol'] for data in events.get(EVENT_PRICE_TICK, ())}
+                        trades_to_check = [t for t in current_active_trades if t['pair'] in ticked_symbols and (t.get('real_trade_filled') or self.replay)]
+                    for trade in trades_to_check:
+                        self._check_trade_exit(trade, chat_id_context)
+                    next_full_pass = self._next_exit_deadline(self.trade_store.active_trades(), feed_live)
+                    events = inbox.wait(max(0.0, next_full_pass - self.clock.time()) if next_full_pass is not None else None)
+                except Exception as e:
+                    logger.error(_t("error_trade_monitor_loop", chat_id_context or self.default_chat_id_for_internal_errors, e=e), exc_info=True)
+                    events, next_full_pass, feed_symbols = {EVENT_TRADE_OPENED: []}, 0, None
+                    time.sleep(5)
+        finally:
+            self.event_bus.unsubscribe(inbox.post)
+            inbox.close()
+
+    def _next_exit_deadline(self, active_trades, feed_live):
+        """When the monitor has to look at the trades again without a tick: in a second for simulated
+        prices or REST-polled real trades, otherwise (and always in a replay) at the earliest time limit.
+        None with no trades."""
+        if not active_trades:
+            return None
+        now = self.clock.time()
+        streamed = feed_live and self.binance_api and self.config.get("use_real_trading")
+        if not self.replay and (not streamed or not all(t.get('real_trade_filled') for t in active_trades)):
+            return now + 1
+        return max(now + 1, min(t.get('timestamp', 0) + t.get('max_time_seconds', 300) for t in active_trades))
+
+    def _get_market_exit_price(self, trade):
+        """Current exit price for a real trade: the streamed book price if fresh, otherwise a REST ticker call."""
+        if self.price_feed is not None:
+            streamed_price = self.price_feed.get_exit_price(trade['pair'], trade['type'])
+            if streamed_price is not None:
+                return streamed_price
+        return self.binance_api.get_ticker_price(trade['pair'])
+
+    def _get_replayed_exit_price(self, trade):
+        """Last recorded price of a replayed trade's pair: the book if bookTicker was recorded, else the
+        mini ticker's last price, else a simulated move."""
+        if self.price_feed is not None:
+            streamed_price = self.price_feed.get_exit_price(trade['pair'], trade['type'])
+            if streamed_price is not None:
+                return streamed_price
+        with self.market_analyzer.lock:
+            pair_data = self.market_analyzer.snapshot.row(trade['pair'])
+        if pair_data and pair_data.get('last_price'):
+            return pair_data['last_price']
+        return self.simulate_price_movement(trade)
+
+    def _check_trade_exit(self, trade, chat_id_context=None):
+        current_time = self.clock.time()
+        trade_duration = current_time - trade.get('timestamp', current_time)
+        current_price = None
+        if trade.get('real_trade_filled') and self.binance_api and self.config.get("use_real_trading"):
+            current_price = self._get_market_exit_price(trade)
+            if current_price is None:
+                logger.warning(_t("warning_failed_get_real_price_fallback_simulated", chat_id_context or self.default_chat_id_for_internal_errors, pair=trade['pair']))
+                current_price = self.simulate_price_movement(trade)
+        elif self.replay:
+            current_price = self._get_replayed_exit_price(trade)
+        else:
+            current_price = self.simulate_price_movement(trade)
+        if current_price is None: return
+
+        tp_hit = (trade['type'] == "BUY" and current_price >= trade['take_profit']) or \
+                 (trade['type'] == "SELL" and current_price <= trade['take_profit'])
+        sl_hit = (trade['type'] == "BUY" and current_price <= trade['stop_loss']) or \
+                 (trade['type'] == "SELL" and current_price >= trade['stop_loss'])
+        time_limit_reached = trade_duration >= trade.get('max_time_seconds', 300)
+
+        if tp_hit: self.complete_trade(trade, current_price, "take_profit", chat_id_context)
+        elif sl_hit: self.complete_trade(trade, current_price, "stop_loss", chat_id_context)
+        elif time_limit_reached: self.complete_trade(trade, current_price, "time_limit", chat_id_context)
 
     def simulate_price_movement(self, trade):
-        elapsed_time = time.time() - trade.get('timestamp', time.time())
+        elapsed_time = self.clock.time() - trade.get('timestamp', self.clock.time())
         max_time = trade.get('max_time_seconds', 300)
         if max_time == 0: max_time = 300
         time_factor = min(elapsed_time / max_time, 1.0)
         mode_vol_factor = {"conservative_scalp": 0.7, "consistent_drip": 0.8, "balanced_growth": 1.0, "momentum_rider": 1.2}.get(trade.get('mode', 'balanced_growth'), 1.0)
         max_movement_pct = 1.5 * time_factor * mode_vol_factor
-        movement_pct = random.uniform(-max_movement_pct, max_movement_pct)
+        movement_pct = self.clock.random.uniform(-max_movement_pct, max_movement_pct)
         current_price = trade.get('entry_price',0) * (1 + movement_pct / 100)
         return max(1e-8, current_price)
 
     # --- NEW: AI Integration Methods ---
-    def _calculate_indicators(self, klines_df):
-        """Calculates indicators from klines DataFrame."""
-        indicators = {}
-        if klines_df.empty or len(klines_df) < 20: # Need enough data for most indicators
-            logger.warning(_t("warning_ai_not_enough_data_for_indicators", self.default_chat_id_for_internal_errors, pair=klines_df.name if hasattr(klines_df, 'name') else 'N/A', count=len(klines_df)))
-            return indicators
-
-        try:
-            # RSI
-            rsi = klines_df.ta.rsi(length=14)
-            if rsi is not None and not rsi.empty:
-                indicators['rsi'] = rsi.iloc[-1]
-
-            # EMA (e.g., 20-period)
-            ema = klines_df.ta.ema(length=20)
-            if ema is not None and not ema.empty:
-                indicators['ema20'] = ema.iloc[-1]
-            
-            # Bollinger Bands
-            bbands = klines_df.ta.bbands(length=20, std=2)
-            if bbands is not None and not bbands.empty:
-                indicators['bb_lower'] = bbands['BBL_20_2.0'].iloc[-1]
-                indicators['bb_middle'] = bbands['BBM_20_2.0'].iloc[-1]
-                indicators['bb_upper'] = bbands['BBU_20_2.0'].iloc[-1]
-                indicators['bb_width'] = (indicators['bb_upper'] - indicators['bb_lower']) / indicators['bb_middle'] * 100 if indicators['bb_middle'] else 0
-        except Exception as e:
-            logger.error(f"Error calculating indicators for {klines_df.name if hasattr(klines_df, 'name') else 'DataFrame'}: {e}")
-        return indicators
-
-    def get_ai_trade_advice(self, pair_name, chat_id_context=None):
-        """Gets trading advice (TP, SL, MaxTime) from Gemini AI."""
-        if not gemini_model:
+    def _choose_advisor(self):
+        """"local" or "gemini": where the advice for the next AI dynamic mode trade comes from."""
+        setting = self.config.get("ai_advisor", "gemini")
+        if self.local_advisor is None or setting == "gemini":
+            return "gemini"
+        if setting == "ab":
+            return "local" if self.clock.random.random() < self.config.get("ai_advisor_ab_local_share", 0.5) else "gemini"
+        return "local"
+
+    def _entry_features(self, pair, side):
+        """LocalAdvisor features of `pair` from the warm indicator state, closed candles only as in training, or
+        None when the state is missing or has missed a closed candle. Never touches the network."""
+        interval = LocalAdvisor.INTERVAL
+        if self.indicator_engine.klines_needed(pair, interval, int(self.clock.time() * 1000)) > 2: return None
+        indicators = self.indicator_engine.indicators(pair, interval, forming=False)
+        candles = self.indicator_engine.recent_candles(pair, interval, forming=False)
+        if 'rsi' not in indicators or 'bb_middle' not in indicators or not candles: return None
+        return LocalAdvisor.features(indicators, candles, side)
+
+    def get_local_trade_advice(self, features, chat_id_context=None):
+        """Trading advice (TP, SL, MaxTime) from the local model for a LocalAdvisor feature vector."""
+        started = time.perf_counter()
+        advice = self.local_advisor.predict(features)
+        elapsed = time.perf_counter() - started
+        advice["sl_percentage"] = self.config.get("stop_loss", 5.0) # not learned, see LocalAdvisor
+        with self.ai_metrics_lock:
+            self.ai_metrics["local_predictions"] += 1
+            self.ai_metrics["local_seconds"] += elapsed
+        advice["rationale"] = _t("local_advisor_rationale", chat_id_context or self.default_chat_id_for_internal_errors,
+                                 version=self.local_advisor.version, samples=self.local_advisor.samples)
+        return advice
+
+    def get_ai_trade_advice(self, pair_name, chat_id_context=None, max_wait=None):
+        """Trading advice (TP, SL, MaxTime) from Gemini AI, as kept by the AdviceService. Waits at most
+        `max_wait` seconds (default `ai_advice_max_wait`) when the pair has no advice yet."""
+        if not self.ai_model:
             logger.warning("Gemini model not available, AI advice skipped.")
             return None
+        if self.ai_breaker.is_open(): max_wait = 0 # Nothing new can arrive before the breaker lets a probe call through
+        return self.advice_service.get(pair_name, self.config.get("ai_advice_max_wait", 0) if max_wait is None else max_wait)
 
-        # Check cache
-        cache_key = f"ai_advice_{pair_name}"
-        cached_item = self.ai_advice_cache.get(cache_key)
-        if cached_item and (time.time() - cached_item['timestamp'] < self.config.get("ai_advice_cache_duration", 300)):
-            logger.info(_t("info_ai_mode_using_cached", chat_id_context or self.default_chat_id_for_internal_errors, pair=pair_name, seconds_left=int(self.config.get("ai_advice_cache_duration", 300) - (time.time() - cached_item['timestamp']))))
-            return cached_item['advice']
+    AI_ADVICE_GUIDELINES = """
+Based on this data, suggest:
+1. Take Profit (TP) as a percentage from current price (e.g., 0.5 for 0.5%). Range: 0.3% to 5%.
+2. Stop Loss (SL) as a percentage from current price (e.g., 0.8 for 0.8%). Range: 0.3% to 5%. SL should generally be tighter or equal to TP.
+3. Maximum Trade Time in seconds (e.g., 300 for 5 minutes). Range: 60 to 1800 seconds.
+4. A very brief (1-2 sentence) rationale for your suggestion.
 
-        logger.info(_t("info_ai_mode_update_attempt", chat_id_context or self.default_chat_id_for_internal_errors, pair=pair_name))
+Consider the volatility and recent trend. The goal is a quick, profitable trade.
+"""
 
-        # 1. Fetch K-lines
-        klines_data = self.binance_api.get_klines(symbol=pair_name, interval='15m', limit=100) # 100 candles * 15m = ~1 day
-        if not klines_data or len(klines_data) < 20: # Need enough data for indicators
-            logger.warning(_t("warning_ai_no_klines", chat_id_context or self.default_chat_id_for_internal_errors, pair=pair_name, interval='15m'))
+    def _request_ai_advice(self, pair_name, chat_id_context=None):
+        """Builds the prompt for `pair_name` and asks Gemini; runs on the AdviceService workers."""
+        prepared = self._prepare_ai_advice(pair_name, chat_id_context)
+        if prepared is None: return None
+        feature_key, cached_advice, summary = prepared
+        if cached_advice is not None: return cached_advice
+        return self._ask_ai_advice(pair_name, feature_key, summary, chat_id_context)
+
+    def _request_ai_advice_batch(self, pair_names, chat_id_context=None):
+        """Advice for several pairs from one Gemini request: {pair: advice}. Pairs the answer leaves out or
+        gets wrong are asked for again one by one; runs on the AdviceService workers."""
+        chat_id = chat_id_context or self.default_chat_id_for_internal_errors
+        results, pending = {}, {}
+        for pair_name in pair_names:
+            prepared = self._prepare_ai_advice(pair_name, chat_id_context)
+            if prepared is None: continue
+            if prepared[1] is not None: results[pair_name] = prepared[1]
+            else: pending[pair_name] = prepared
+        if len(pending) == 1:
+            pair_name, (feature_key, _, summary) = pending.popitem()
+            results[pair_name] = self._ask_ai_advice(pair_name, feature_key, summary, chat_id_context)
+        if not pending:
+            return results
+
+        prompt = f"You are an expert crypto trading analyst. Your task is to suggest optimal parameters for a short-term (scalp/day trade) on each of these {len(pending)} pairs: {', '.join(pending)}.\n"
+        for pair_name, (_, _, summary) in pending.items():
+            prompt += f"\nPAIR {pair_name}:\n{summary}"
+        prompt += self.AI_ADVICE_GUIDELINES + """
+Answer for every pair separately, from its own data. Respond ONLY in JSON format, with an array holding one object per pair, like this:
+[
+  {
+    "pair": "string (the pair name as given above)",
+    "tp_percentage": float (e.g., 1.2),
+    "sl_percentage": float (e.g., 0.8),
+    "max_trade_time_seconds": int (e.g., 600),
+    "rationale": "string"
+  }
+]
+"""
+        logger.info(_t("info_ai_batch_request", chat_id, count=len(pending), pairs=", ".join(pending)))
+        response_text = None
+        try:
+            response_text = self._generate_ai_content(prompt, batch_pairs=len(pending))
+            answers = self._parse_ai_response(response_text)
+            if not isinstance(answers, list):
+                raise ValueError("Batch AI advice is not a JSON array")
+            for answer in answers:
+                pair_name = answer.get("pair") if isinstance(answer, dict) else None
+                if pair_name not in pending: continue
+                try:
+                    advice = self._validate_ai_advice(answer)
+                except ValueError as e_val:
+                    logger.error(f"AI Error: Invalid advice for {pair_name} in a batch answer from Gemini. Error: {e_val}")
+                    continue
+                logger.info(_t("info_ai_trade_advice_received", chat_id, pair=pair_name, tp=advice['tp_percentage'],
+                                sl=advice['sl_percentage'], rationale=advice['rationale']))
+                self.advice_cache.put(pending.pop(pair_name)[0], advice)
+                results[pair_name] = advice
+        except AIUnavailableError:
+            logger.info(_t("info_ai_breaker_skipped", chat_id, pair=", ".join(pending)))
+            return results
+        except ValueError as e_val: # json.JSONDecodeError is a ValueError
+            logger.error(f"AI Error: Unusable batch answer from Gemini for {len(pending)} pairs. Error: {e_val}. Response: '{response_text or 'N/A'}'")
+        except Exception as e:
+            logger.error(f"AI Error: Exception during batch Gemini API call for {', '.join(pending)}: {e}")
+
+        if pending:
+            logger.warning(_t("warning_ai_batch_fallback", chat_id, pairs=", ".join(pending)))
+            with self.ai_metrics_lock:
+                self.ai_metrics["fallback_pairs"] += len(pending)
+            for pair_name, (feature_key, _, summary) in pending.items():
+                results[pair_name] = self._ask_ai_advice(pair_name, feature_key, summary, chat_id_context)
+        return results
+
+    def _prepare_ai_advice(self, pair_name, chat_id_context=None):
+        """Brings the pair's candles and indicators up to date: (feature_key, cached advice or None, market
+        summary for the prompt), or None without enough data."""
+        chat_id = chat_id_context or self.default_chat_id_for_internal_errors
+        logger.info(_t("info_ai_mode_update_attempt", chat_id, pair=pair_name))
+
+        # 1. Bring the local candle store up to date, then feed the indicator state the candles it has not seen
+        interval = '15m'
+        self.kline_store.sync(self.binance_api, pair_name, interval)
+        klines_data = self.kline_store.latest(pair_name, interval, self.indicator_engine.klines_needed(pair_name, interval))
+        if not klines_data or self.indicator_engine.update(pair_name, interval, klines_data) < 20: # Need enough data for indicators
+            logger.warning(_t("warning_ai_no_klines", chat_id, pair=pair_name, interval=interval))
             return None
 
-        # Convert to DataFrame
-        columns = ['OpenTime', 'Open', 'High', 'Low', 'Close', 'Volume', 'CloseTime', 
-                   'QuoteAssetVolume', 'NumberTrades', 'TakerBuyBaseVol', 'TakerBuyQuoteVol', 'Ignore']
-        df = pd.DataFrame(klines_data, columns=columns)
-        df[['Open', 'High', 'Low', 'Close', 'Volume', 'QuoteAssetVolume']] = df[['Open', 'High', 'Low', 'Close', 'Volume', 'QuoteAssetVolume']].apply(pd.to_numeric)
-        df['OpenTime'] = pd.to_datetime(df['OpenTime'], unit='ms')
-        df['CloseTime'] = pd.to_datetime(df['CloseTime'], unit='ms')
-        df.set_index('CloseTime', inplace=True) # Set time as index for pandas_ta
-        df.name = pair_name # Store pair name for logging in indicator calculation
-
-        # 2. Calculate Indicators
-        indicators = self._calculate_indicators(df.copy()) # Pass a copy
-        current_price = df['Close'].iloc[-1]
-
-        # 3. Construct Prompt for Gemini
-        prompt = f"""You are an expert crypto trading analyst. Your task is to suggest optimal parameters for a short-term (scalp/day trade) on the pair {pair_name}.
-Current market conditions for {pair_name}:
+        # 2. Indicators, including the forming candle
+        indicators = self.indicator_engine.indicators(pair_name, interval)
+        candles = self.indicator_engine.recent_candles(pair_name, interval)
+        current_price = candles[-1][3]
+        feature_key = AdviceCache.feature_key(pair_name, indicators, current_price)
+        cached_advice = self.advice_cache.get(feature_key)
+        if cached_advice is not None:
+            logger.info(_t("info_ai_mode_using_cached", chat_id, pair=pair_name, conditions=feature_key))
+            return feature_key, cached_advice, None
+
+        # 3. Market summary for the prompt
+        summary = f"""Current market conditions for {pair_name}:
 - Current Price: {current_price:.6f}
 - Recent Candlestick Data (last 5 candles, OHLCV):
 """
-        for i in range(1, min(6, len(df))):
-            candle = df.iloc[-i]
-            prompt += f"  - T-{i}: O={candle['Open']:.4f}, H={candle['High']:.4f}, L={candle['Low']:.4f}, C={candle['Close']:.4f}, V={candle['Volume']:.2f}\n"
+        for i, (open_price, high, low, close, volume) in enumerate(reversed(candles), 1):
+            summary += f"  - T-{i}: O={open_price:.4f}, H={high:.4f}, L={low:.4f}, C={close:.4f}, V={volume:.2f}\n"
         
-        prompt += "- Technical Indicators:\n"
-        if 'rsi' in indicators: prompt += f"  - RSI(14): {indicators['rsi']:.2f} "
-        if 'ema20' in indicators: prompt += f"(Price vs EMA20: {'Above' if current_price > indicators['ema20'] else 'Below' if current_price < indicators['ema20'] else 'At'})\n"
+        summary += "- Technical Indicators:\n"
+        if 'rsi' in indicators: summary += f"  - RSI(14): {indicators['rsi']:.2f} "
+        if 'ema20' in indicators: summary += f"(Price vs EMA20: {'Above' if current_price > indicators['ema20'] else 'Below' if current_price < indicators['ema20'] else 'At'})\n"
         if 'bb_middle' in indicators:
-            prompt += f"  - Bollinger Bands(20,2): Lower={indicators['bb_lower']:.4f}, Middle={indicators['bb_middle']:.4f}, Upper={indicators['bb_upper']:.4f} (Width: {indicators.get('bb_width',0):.2f}%)\n"
-
-        prompt += f"""
-Based on this data, suggest:
-1. Take Profit (TP) as a percentage from current price (e.g., 0.5 for 0.5%). Range: 0.3% to 5%.
-2. Stop Loss (SL) as a percentage from current price (e.g., 0.8 for 0.8%). Range: 0.3% to 5%. SL should generally be tighter or equal to TP.
-3. Maximum Trade Time in seconds (e.g., 300 for 5 minutes). Range: 60 to 1800 seconds.
-4. A very brief (1-2 sentence) rationale for your suggestion.
-
-Consider the volatility and recent trend. The goal is a quick, profitable trade.
-
+            summary += f"  - Bollinger Bands(20,2): Lower={indicators['bb_lower']:.4f}, Middle={indicators['bb_middle']:.4f}, Upper={indicators['bb_upper']:.4f} (Width: {indicators.get('bb_width',0):.2f}%)\n"
+        logger.info(_t("info_ai_generated_comprehensive_summary", chat_id, pair=pair_name))
+        return feature_key, None, summary
+
+    def _ask_ai_advice(self, pair_name, feature_key, summary, chat_id_context=None):
+        """Asks Gemini for the advice of one pair and caches it under `feature_key`."""
+        chat_id = chat_id_context or self.default_chat_id_for_internal_errors
+        prompt = f"You are an expert crypto trading analyst. Your task is to suggest optimal parameters for a short-term (scalp/day trade) on the pair {pair_name}.\n"
+        prompt += summary + self.AI_ADVICE_GUIDELINES + """
 Respond ONLY in JSON format like this:
-{{
+{
   "tp_percentage": float (e.g., 1.2),
   "sl_percentage": float (e.g., 0.8),
   "max_trade_time_seconds": int (e.g., 600),
   "rationale": "string"
-}}
+}
 """
-        logger.info(_t("info_ai_generated_comprehensive_summary", chat_id_context or self.default_chat_id_for_internal_errors, pair=pair_name))
         # logger.debug(f"Gemini Prompt for {pair_name}:\n{prompt}") # Can be very verbose
-
-        # 4. Call Gemini API
+        response_text = None
         try:
-            response = gemini_model.generate_content(prompt)
-            # Clean the response: Gemini sometimes wraps JSON in ```json ... ```
-            cleaned_response_text = response.text.strip()
-            if cleaned_response_text.startswith("```json"):
-                cleaned_response_text = cleaned_response_text[7:]
-            if cleaned_response_text.endswith("```"):
-                cleaned_response_text = cleaned_response_text[:-3]
-            
-            advice = json.loads(cleaned_response_text)
-
-            # Validate advice structure and types
-            if not all(k in advice for k in ["tp_percentage", "sl_percentage", "max_trade_time_seconds", "rationale"]):
-                raise ValueError("Missing keys in AI advice")
-            if not isinstance(advice["tp_percentage"], (float, int)) or \
-               not isinstance(advice["sl_percentage"], (float, int)) or \
-               not isinstance(advice["max_trade_time_seconds"], int):
-                raise ValueError("Incorrect data types in AI advice")
-
-            # Further validation of ranges (optional, but good practice)
-            advice["tp_percentage"] = max(0.1, min(10.0, float(advice["tp_percentage"])))
-            advice["sl_percentage"] = max(0.1, min(10.0, float(advice["sl_percentage"])))
-            advice["max_trade_time_seconds"] = max(60, min(3600, int(advice["max_trade_time_seconds"])))
-
-            logger.info(_t("info_ai_trade_advice_received", chat_id_context or self.default_chat_id_for_internal_errors,
-                            pair=pair_name, tp=advice['tp_percentage'], sl=advice['sl_percentage'], rationale=advice['rationale']))
-            
-            # Cache the successful advice
-            self.ai_advice_cache[cache_key] = {"timestamp": time.time(), "advice": advice}
+            response_text = self._generate_ai_content(prompt)
+            advice = self._validate_ai_advice(self._parse_ai_response(response_text))
+            logger.info(_t("info_ai_trade_advice_received", chat_id, pair=pair_name, tp=advice['tp_percentage'],
+                            sl=advice['sl_percentage'], rationale=advice['rationale']))
+            self.advice_cache.put(feature_key, advice)
             return advice
+        except AIUnavailableError:
+            logger.info(_t("info_ai_breaker_skipped", chat_id, pair=pair_name))
+            return None
         except json.JSONDecodeError as e_json:
-            logger.error(f"AI Error: Failed to decode JSON from Gemini for {pair_name}. Response: '{response.text if 'response' in locals() else 'N/A'}'. Error: {e_json}")
+            logger.error(f"AI Error: Failed to decode JSON from Gemini for {pair_name}. Response: '{response_text or 'N/A'}'. Error: {e_json}")
         except ValueError as e_val: # Custom validation errors
-             logger.error(f"AI Error: Invalid advice structure or values from Gemini for {pair_name}. Error: {e_val}. Response: '{response.text if 'response' in locals() else 'N/A'}'")
+             logger.error(f"AI Error: Invalid advice structure or values from Gemini for {pair_name}. Error: {e_val}. Response: '{response_text or 'N/A'}'")
         except Exception as e:
             logger.error(f"AI Error: Exception during Gemini API call or processing for {pair_name}: {e}")
         
-        logger.warning(_t("warning_ai_failed_get_valid_advice", chat_id_context or self.default_chat_id_for_internal_errors, pair=pair_name))
+        logger.warning(_t("warning_ai_failed_get_valid_advice", chat_id, pair=pair_name))
         return None
+
+    def _generate_ai_content(self, prompt, batch_pairs=0):
+        """Sends `prompt` to the model, asking for a JSON answer within `ai_call_timeout` seconds, and returns
+        the answer text. Raises AIUnavailableError without calling it while the circuit breaker is open."""
+        if not self.ai_breaker.allow():
+            raise AIUnavailableError("Gemini calls are paused by the circuit breaker")
+        with self.ai_metrics_lock:
+            self.ai_metrics["calls"] += 1
+            if batch_pairs:
+                self.ai_metrics["batch_calls"] += 1
+                self.ai_metrics["batch_pairs"] += batch_pairs
+        budget = self.config.get("ai_call_timeout", 20)
+        started = time.perf_counter()
+        try:
+            response_text = self.ai_model.generate_content(prompt, generation_config={"response_mime_type": "application/json"},
+                                                           request_options={"timeout": budget}).text
+        except Exception:
+            self.ai_breaker.record(time.perf_counter() - started, failed=True)
+            raise
+        latency = time.perf_counter() - started
+        self.ai_breaker.record(latency, slow=latency > budget)
+        return response_text
+
+    def _on_ai_breaker_open(self, failures, calls):
+        self.send_notification(_t("ai_breaker_opened", self.default_chat_id_for_internal_errors, failures=failures, calls=calls,
+                                  seconds=self.ai_breaker.open_seconds), priority=NOTIFY_CRITICAL)
+
+    @staticmethod
+    def _parse_ai_response(response_text):
+        # Clean the response: Gemini sometimes wraps JSON in ```json ... ```
+        cleaned_response_text = response_text.strip()
+        if cleaned_response_text.startswith("```json"):
+            cleaned_response_text = cleaned_response_text[7:]
+        if cleaned_response_text.endswith("```"):
+            cleaned_response_text = cleaned_response_text[:-3]
+        return json.loads(cleaned_response_text)
+
+    @staticmethod
+    def _validate_ai_advice(advice):
+        """The advice fields of one answer, with values clamped to their ranges; ValueError if unusable."""
+        # Validate advice structure and types
+        if not isinstance(advice, dict) or not all(k in advice for k in ["tp_percentage", "sl_percentage", "max_trade_time_seconds", "rationale"]):
+            raise ValueError("Missing keys in AI advice")
+        if not isinstance(advice["tp_percentage"], (float, int)) or \
+           not isinstance(advice["sl_percentage"], (float, int)) or \
+           not isinstance(advice["max_trade_time_seconds"], int):
+            raise ValueError("Incorrect data types in AI advice")
+
+        # Further validation of ranges (optional, but good practice)
+        return {"tp_percentage": max(0.1, min(10.0, float(advice["tp_percentage"]))),
+                "sl_percentage": max(0.1, min(10.0, float(advice["sl_percentage"]))),
+                "max_trade_time_seconds": max(60, min(3600, int(advice["max_trade_time_seconds"]))),
+                "rationale": advice["rationale"]}
     # --- END NEW: AI Integration Methods ---
 
 
-    def create_trade(self, pair, trade_type, current_price=None, chat_id_for_trade=None):
+    def create_trade(self, pair, trade_type, current_price=None, chat_id_for_trade=None, strategy=None):
         # Determine chat_id for notifications from this trade creation
         effective_chat_id = chat_id_for_trade or self.default_chat_id_for_internal_errors
         
@@ -1223,7 +4342,7 @@ Respond ONLY in JSON format like this:
         
         if current_price is None or current_price <= 0:
             logger.error(_t("warning_invalid_current_price_trade_creation", effective_chat_id, current_price=current_price, pair=pair))
-            self.send_notification(_t("trade_failed_invalid_price", effective_chat_id, pair=pair, current_price=current_price), target_chat_id=effective_chat_id)
+            self.send_notification(_t("trade_failed_invalid_price", effective_chat_id, pair=pair, current_price=current_price), target_chat_id=effective_chat_id, priority=NOTIFY_ENTRY)
             return None
 
         min_bnb_value_per_trade = self.config.get('min_bnb_per_trade', 0.011)
@@ -1231,7 +4350,7 @@ Respond ONLY in JSON format like this:
 
         if self.config.get('use_percentage', False) and self.binance_api and self.config.get('use_real_trading', False):
             try:
-                account_info = self.binance_api.get_account_info()
+                account_info = self.binance_api.get_cached_account_info()
                 if account_info and 'balances' in account_info:
                     bnb_balance_free = next((float(bal['free']) for bal in account_info['balances'] if bal['asset'] == 'BNB'), 0)
                     if bnb_balance_free > 0:
@@ -1253,7 +4372,7 @@ Respond ONLY in JSON format like this:
             bnb_to_invest_calculated = max(min_bnb_value_per_trade, self.config.get('amount', 0.01))
 
         if self.config.get('use_real_trading', False) and self.binance_api:
-            account_info_final_check = self.binance_api.get_account_info()
+            account_info_final_check = self.binance_api.get_cached_account_info()
             bnb_available_real = 0
             if account_info_final_check and 'balances' in account_info_final_check:
                 bnb_available_real = next((float(bal['free']) for bal in account_info_final_check['balances'] if bal['asset'] == 'BNB'), 0)
@@ -1261,7 +4380,7 @@ Respond ONLY in JSON format like this:
                 err_msg = _t("trade_failed_insufficient_balance_binance_api", effective_chat_id,
                                pair=pair, needed_bnb=bnb_to_invest_calculated, available_bnb=bnb_available_real)
                 logger.error(err_msg)
-                self.send_notification(err_msg, target_chat_id=effective_chat_id)
+                self.send_notification(err_msg, target_chat_id=effective_chat_id, priority=NOTIFY_ENTRY)
                 return None
 
         trade_quantity = 0
@@ -1279,10 +4398,26 @@ Respond ONLY in JSON format like this:
             logger.error(f"Calculated trade quantity zero or negative ({trade_quantity}) for {pair}. BNB to invest: {bnb_to_invest_calculated}, Price: {current_price}")
             return None
 
+        if self.binance_api and self.config.get("use_real_trading", False):
+            self.binance_api.exchange_info.ensure_fresh(self.binance_api)
+            filter_problem = self.binance_api.exchange_info.check_order(pair, trade_quantity, current_price)
+            if filter_problem:
+                err_msg = _t("trade_failed_api_error_binance", effective_chat_id, pair=pair, trade_type=trade_type,
+                             quantity=trade_quantity, error_code="FILTER", error_message=filter_problem)
+                logger.error(err_msg)
+                self.send_notification(err_msg, target_chat_id=effective_chat_id, priority=NOTIFY_ENTRY)
+                return None
+
         # --- Dynamic parameters from AI if enabled ---
-        ai_rationale = None
-        if self.config.get("ai_dynamic_mode", False):
-            ai_advice = self.get_ai_trade_advice(pair, chat_id_context=effective_chat_id)
+        ai_rationale, advice_source = None, None
+        advisor = self._choose_advisor() if self.config.get("ai_dynamic_mode", False) else None
+        entry_features = self._entry_features(pair, trade_type)
+        if advisor:
+            if advisor == "local": # without current candles the mode settings apply, no network call on the entry path
+                ai_advice = self.get_local_trade_advice(entry_features, effective_chat_id) if entry_features else None
+            else:
+                ai_advice = self.get_ai_trade_advice(pair, chat_id_context=effective_chat_id)
+            advice_source = advisor if ai_advice else "mode"
             if ai_advice:
                 take_profit_pct = ai_advice["tp_percentage"]
                 stop_loss_pct = ai_advice["sl_percentage"]
@@ -1293,8 +4428,10 @@ Respond ONLY in JSON format like this:
                 self.send_notification(_t("trading_modes_ai_update_notification", effective_chat_id, 
                                           pair=pair, tp=take_profit_pct, sl=stop_loss_pct, rationale=ai_rationale), 
                                           target_chat_id=effective_chat_id)
-            else: # Fallback to mode settings if AI fails
-                logger.warning(f"AI advice failed for {pair}, falling back to mode settings.")
+            else: # Fallback to mode settings if AI fails or has not answered yet
+                logger.warning(f"No AI advice for {pair} yet, falling back to mode settings.")
+                with self.ai_metrics_lock:
+                    self.ai_metrics["mode_fallbacks"] += 1
                 take_profit_pct = self.config.get("take_profit", 1.5)
                 stop_loss_pct = self.config.get("stop_loss", 5.0)
                 max_trade_time_seconds = self.config.get('max_trade_time',300)
@@ -1308,24 +4445,27 @@ Respond ONLY in JSON format like this:
         tp_price = entry_price_for_calc * (1 + take_profit_pct / 100) if trade_type == "BUY" else entry_price_for_calc * (1 - take_profit_pct / 100)
         sl_price = entry_price_for_calc * (1 - stop_loss_pct / 100) if trade_type == "BUY" else entry_price_for_calc * (1 + stop_loss_pct / 100)
 
-        trade = {
-            'id': int(time.time() * 1000), 'timestamp': time.time(), 'pair': pair,
+        trade = TradeRecord({
+            'id': self.trade_store.next_trade_id(), 'timestamp': self.clock.time(), 'pair': pair,
             'base_asset': base_asset, 'quote_asset': quote_asset, 'type': trade_type,
             'entry_price': entry_price_for_calc, 'amount': trade_quantity,
             'bnb_value_of_trade': actual_bnb_value_of_trade,
             'take_profit': tp_price, 'stop_loss': sl_price,
             'max_time_seconds': max_trade_time_seconds,
-            'entry_time': datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+            'entry_time': self.clock.now().strftime("%Y-%m-%d %H:%M:%S"),
             'completed': False, 'mode': self.config.get('trading_mode','N/A'),
             'order_id': None, 'real_trade_opened': False, 'real_trade_filled': False,
-            'strategy': 'Standard Auto-Selected',
+            'strategy': strategy or 'Standard Auto-Selected',
             'percentage_based': self.config.get('use_percentage', False),
             'ai_rationale': ai_rationale # Store AI rationale if used
-        }
+        })
+        if advice_source: trade['advice_source'] = advice_source # gemini, local or mode, for comparing advisors (train-advisor)
+        if entry_features: trade['entry_features'] = entry_features # LocalAdvisor training input
 
         if self.binance_api and self.config.get("use_real_trading", False):
             logger.info(_t("info_attempt_real_order_binance", effective_chat_id, pair=pair, side=trade_type, quantity=trade_quantity))
             order_response = self.binance_api.create_order(symbol=pair, side=trade_type, order_type="MARKET", quantity=trade_quantity)
+            self.binance_api.account_state.invalidate()
 
             if order_response and order_response.get('orderId'):
                 trade['order_id'] = order_response['orderId']
@@ -1357,7 +4497,7 @@ Respond ONLY in JSON format like this:
                     self.send_notification(_t("trade_rejected_by_binance", effective_chat_id,
                                               pair=pair, trade_type=trade_type, quantity=trade_quantity,
                                               order_id=trade['order_id'], code=order_response.get('code',''), msg=order_response.get('msg','')),
-                                           target_chat_id=effective_chat_id)
+                                           target_chat_id=effective_chat_id, priority=NOTIFY_CRITICAL)
                 else:
                     logger.warning(_t("warning_real_trade_order_status_not_filled", effective_chat_id,
                                       order_id=trade['order_id'], status=order_response.get('status')))
@@ -1370,11 +4510,12 @@ Respond ONLY in JSON format like this:
                 self.send_notification(_t("trade_failed_api_error_binance", effective_chat_id,
                                           pair=pair, trade_type=trade_type, quantity=trade_quantity,
                                           error_code=err_code, error_message=err_msg_api[:100]),
-                                       target_chat_id=effective_chat_id)
+                                       target_chat_id=effective_chat_id, priority=NOTIFY_CRITICAL)
         elif self.config.get("use_real_trading", False) and not self.binance_api:
             logger.warning(_t("warning_real_trading_no_binance_api", effective_chat_id))
 
-        ACTIVE_TRADES.append(trade)
+        self.trade_store.add(trade)
+        self.event_bus.publish(EVENT_TRADE_OPENED, trade=trade)
         return trade
 
     def create_trade_from_whale(self, whale_transaction, trade_type, is_auto_trade=False, chat_id_for_trade=None):
@@ -1386,11 +4527,12 @@ Respond ONLY in JSON format like this:
         trade = self.create_trade(pair, trade_type, current_price, chat_id_for_trade=effective_chat_id)
         if not trade: return None
         trade.update({'whale_id': whale_transaction['id'], 'strategy': f"Whale-Based ({self.config.get('trading_strategy','N/A')})"})
+        self.trade_store.update(trade)
         
         notification_key = "trade_notification_new_auto_selected" if is_auto_trade else "trade_notification_new_whale_manual_follow"
         selection_details = f"Whale Alert ID: {whale_transaction['id']}" if is_auto_trade else ""
         entry_message = self._format_trade_notification(trade, selection_details, notification_key, effective_chat_id)
-        self.send_notification(entry_message, target_chat_id=effective_chat_id)
+        self.send_notification(entry_message, target_chat_id=effective_chat_id, priority=NOTIFY_ENTRY)
         return trade
 
     def complete_trade(self, trade, exit_price=None, reason="unknown", chat_id_context=None):
@@ -1402,7 +4544,7 @@ Respond ONLY in JSON format like this:
             if reason == "take_profit": estimated_exit_price = trade['take_profit']
             elif reason == "stop_loss": estimated_exit_price = trade['stop_loss']
             else:
-                current_market_price = self.binance_api.get_ticker_price(trade['pair']) if trade.get('real_trade_filled') and self.binance_api and self.config.get("use_real_trading") else None
+                current_market_price = self._get_market_exit_price(trade) if trade.get('real_trade_filled') and self.binance_api and self.config.get("use_real_trading") else None
                 estimated_exit_price = current_market_price if current_market_price else self.simulate_price_movement(trade)
         
         final_exit_price = estimated_exit_price
@@ -1414,6 +4556,7 @@ Respond ONLY in JSON format like this:
                 logger.info(_t("info_attempt_close_real_trade_binance", effective_chat_id,
                                 pair=trade['pair'], side=opposite_side, quantity=closing_quantity, original_order_id=trade['order_id']))
                 close_order_response = self.binance_api.create_order(symbol=trade['pair'], side=opposite_side, order_type="MARKET", quantity=closing_quantity)
+                self.binance_api.account_state.invalidate()
 
                 if close_order_response and close_order_response.get('orderId'):
                     trade['close_order_id'] = close_order_response['orderId']
@@ -1457,7 +4600,7 @@ Respond ONLY in JSON format like this:
             profit_in_bnb = (result_pct / 100.0) * trade['amount']
 
         trade.update({'completed': True, 'exit_price': final_exit_price,
-                      'exit_time': datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+                      'exit_time': self.clock.now().strftime("%Y-%m-%d %H:%M:%S"),
                       'result': result_pct, 'close_reason': reason, 'profit_in_bnb': profit_in_bnb})
 
         DAILY_STATS.update({"total_trades": DAILY_STATS["total_trades"] + 1,
@@ -1494,16 +4637,16 @@ Respond ONLY in JSON format like this:
                               pair=trade['pair'], type=trade['type'], entry_price=trade['entry_price'], exit_price=final_exit_price,
                               result_pct=result_pct, profit_in_bnb=profit_in_bnb, amount=trade['amount'], base_asset=trade['base_asset'],
                               reason_text=_t(reason_text_key, effective_chat_id), entry_time=trade['entry_time'], exit_time=trade['exit_time'],
-                              duration_seconds=int(time.time() - trade.get('timestamp', time.time())),
+                              duration_seconds=int(self.clock.time() - trade.get('timestamp', self.clock.time())),
                               mode=trade.get('mode', 'N/A').capitalize(), strategy=trade.get('strategy', 'N/A'),
                               real_trade_status_text=_t(real_trade_status_text_key, effective_chat_id, entry_order_id=entry_order_id_val, exit_order_id=exit_order_id_val))
         
         if trade.get("ai_rationale"): # Add AI rationale if it was an AI trade
             complete_message += f"\nAI Rationale: {trade['ai_rationale']}"
 
-        self.send_notification(complete_message, target_chat_id=effective_chat_id)
-        if trade in ACTIVE_TRADES: ACTIVE_TRADES.remove(trade)
-        COMPLETED_TRADES.append(trade)
+        self.send_notification(complete_message, target_chat_id=effective_chat_id, priority=NOTIFY_FILL)
+        self.trade_store.complete(trade)
+        self.event_bus.publish(EVENT_TRADE_CLOSED, trade=trade, reason=reason)
 
     def get_daily_stats_message(self, chat_id):
         win_rate = (DAILY_STATS["winning_trades"] / DAILY_STATS["total_trades"] * 100) if DAILY_STATS["total_trades"] > 0 else 0
@@ -1524,13 +4667,210 @@ Respond ONLY in JSON format like this:
         )
 
 
+class NotificationDispatcher:
+    """Delivers TradingBot notifications from the python-telegram-bot event loop.
+
+    Worker threads hand messages over with the thread-safe `submit`. Every chat has its own sender
+    task, so admin chats are served concurrently. A sender always takes the most urgent lane first
+    and joins several waiting messages of that lane into one digest message. Sends are paced to
+    Telegram's limits (about one message per second per chat, 30 per second overall, of which the
+    last few are kept for critical messages and fills) and RetryAfter is honoured.
+    """
+    PER_CHAT_INTERVAL = 1.0
+    GLOBAL_MESSAGES_PER_SECOND = 30
+    URGENT_RESERVED_PER_SECOND = 5
+    MAX_MESSAGE_LENGTH = 4096
+    DIGEST_SEPARATOR = "\n\n"
+    MAX_SEND_ATTEMPTS = 3
+
+    def __init__(self, bot, chat_id_for_translation=None, critical_latency_target=5.0):
+        self.bot = bot
+        self.chat_id = chat_id_for_translation
+        self.critical_latency_target = critical_latency_target
+        self.loop = None
+        self.pending = {priority: collections.deque() for priority in NOTIFICATION_LANES} # (chat_id, priority, item) per lane, submitted before the loop was running
+        self.lock = threading.Lock() # guards loop and pending between submitting threads and start/stop
+        self.chat_lanes = {} # chat_id -> {priority: deque of (message, keyboard, submitted_at)}
+        self.chat_events = {}
+        self.chat_tasks = {}
+        self.recent_sends = collections.deque() # send times in the last second, for the global limit
+        self.latencies = {priority: collections.deque(maxlen=500) for priority in NOTIFICATION_LANES} # submit -> delivery seconds
+        self.dropped = {priority: 0 for priority in NOTIFICATION_LANES}
+        self.metrics = {"submitted": 0, "messages_sent": 0, "digests": 0, "coalesced": 0, "failed": 0, "rate_limited": 0}
+
+    def start(self):
+        """Binds to the running loop and flushes anything submitted before it. Call from the PTB loop."""
+        with self.lock:
+            self.loop = asyncio.get_running_loop()
+            for lane in self.pending.values():
+                while lane:
+                    self._enqueue(*lane.popleft())
+
+    async def stop(self):
+        for task in self.chat_tasks.values():
+            task.cancel()
+        await asyncio.gather(*self.chat_tasks.values(), return_exceptions=True)
+        self.chat_tasks.clear()
+        with self.lock:
+            self.loop = None
+
+    def submit(self, message, keyboard, chat_ids, priority=NOTIFY_INFO):
+        """Queues `message` for every chat in `chat_ids`. Safe to call from any thread."""
+        item = (message, keyboard, time.time())
+        with self.lock: # so nothing lands in pending after start() has drained it
+            self.metrics["submitted"] += 1
+            for chat_id in chat_ids:
+                loop = self.loop
+                if loop is None or loop.is_closed():
+                    lane = self.pending[priority] # bounded per lane, so early chatter cannot push out critical messages
+                    if len(lane) >= NOTIFICATION_LANES[priority]["capacity"]:
+                        lane.popleft()
+                        self.dropped[priority] += 1
+                    lane.append((chat_id, priority, item))
+                else:
+                    loop.call_soon_threadsafe(self._enqueue, chat_id, priority, item)
+
+    def _enqueue(self, chat_id, priority, item):
+        lanes = self.chat_lanes.setdefault(chat_id, {p: collections.deque() for p in NOTIFICATION_LANES})
+        lane = lanes[priority]
+        if len(lane) >= NOTIFICATION_LANES[priority]["capacity"]:
+            lane.popleft()
+            self.dropped[priority] += 1
+        lane.append(item)
+        self.chat_events.setdefault(chat_id, asyncio.Event()).set()
+        task = self.chat_tasks.get(chat_id)
+        if task is None or task.done():
+            self.chat_tasks[chat_id] = self.loop.create_task(self._chat_sender(chat_id))
+
+    def _next_batch(self, lanes):
+        """Pops the next message from the most urgent non-empty lane, merged with following keyboard-less
+        messages of the same lane while they fit one Telegram message. None when all lanes are empty."""
+        now = time.time()
+        for priority, lane in lanes.items():
+            max_age = NOTIFICATION_LANES[priority]["max_age"]
+            while lane and max_age is not None and now - lane[0][2] > max_age:
+                lane.popleft()
+                self.dropped[priority] += 1
+            if not lane: continue
+            message, keyboard, submitted_at = lane.popleft()
+            parts, submitted = [message], [submitted_at]
+            if keyboard is None:
+                length = len(message)
+                while lane and lane[0][1] is None and \
+                      length + len(self.DIGEST_SEPARATOR) + len(lane[0][0]) <= self.MAX_MESSAGE_LENGTH:
+                    next_message, _, next_submitted_at = lane.popleft()
+                    parts.append(next_message)
+                    submitted.append(next_submitted_at)
+                    length += len(self.DIGEST_SEPARATOR) + len(next_message)
+            return priority, self.DIGEST_SEPARATOR.join(parts), keyboard, submitted
+        return None
+
+    async def _chat_sender(self, chat_id):
+        lanes, event = self.chat_lanes[chat_id], self.chat_events[chat_id]
+        while True:
+            await event.wait()
+            event.clear()
+            while True:
+                batch = self._next_batch(lanes)
+                if batch is None: break
+                priority, text, keyboard, submitted = batch
+                if len(submitted) > 1:
+                    self.metrics["digests"] += 1
+                    self.metrics["coalesced"] += len(submitted)
+                started = time.monotonic()
+                if await self._send(chat_id, text, keyboard, priority):
+                    now = time.time()
+                    self.latencies[priority].extend(now - submitted_at for submitted_at in submitted)
+                    self.metrics["messages_sent"] += 1
+                    if priority == NOTIFY_CRITICAL and now - submitted[0] > self.critical_latency_target:
+                        logger.warning(f"Critical notification to chat {chat_id} took {now - submitted[0]:.1f}s "
+                                       f"(target {self.critical_latency_target}s).")
+                else:
+                    self.metrics["failed"] += len(submitted)
+                await asyncio.sleep(max(0.0, self.PER_CHAT_INTERVAL - (time.monotonic() - started)))
+
+    async def _acquire_global_slot(self, priority):
+        limit = self.GLOBAL_MESSAGES_PER_SECOND
+        if priority > NOTIFY_FILL: limit -= self.URGENT_RESERVED_PER_SECOND
+        while True:
+            now = time.monotonic()
+            while self.recent_sends and now - self.recent_sends[0] >= 1.0:
+                self.recent_sends.popleft()
+            if len(self.recent_sends) < limit:
+                self.recent_sends.append(now)
+                return
+            await asyncio.sleep(1.0 - (now - self.recent_sends[-limit]))
+
+    async def _send(self, chat_id, text, keyboard, priority):
+        for attempt in range(1, self.MAX_SEND_ATTEMPTS + 1):
+            await self._acquire_global_slot(priority)
+            try:
+                await self.bot.send_message(chat_id=chat_id, text=text, parse_mode=ParseMode.HTML,
+                                            reply_markup=InlineKeyboardMarkup(keyboard) if keyboard else None)
+                return True
+            except RetryAfter as e:
+                self.metrics["rate_limited"] += 1
+                retry_after = e.retry_after.total_seconds() if isinstance(e.retry_after, timedelta) else float(e.retry_after)
+                logger.warning(f"Telegram rate limit for chat {chat_id}; retrying in {retry_after:.0f}s")
+                await asyncio.sleep(retry_after)
+            except (TimedOut, NetworkError) as e:
+                logger.warning(_t("error_notification_failed_async", chat_id, chat_id=chat_id, type_name=type(e).__name__, e=e))
+                await asyncio.sleep(attempt)
+            except Exception as e:
+                logger.error(_t("error_notification_failed_async", chat_id, chat_id=chat_id, type_name=type(e).__name__, e=e))
+                return False
+        return False
+
+    @staticmethod
+    def _percentile(values, q):
+        values = sorted(values)
+        return values[min(len(values) - 1, int(q * len(values)))] if values else 0.0
+
+    def get_metrics(self):
+        all_latencies = [latency for lane_latencies in self.latencies.values() for latency in lane_latencies]
+        metrics = dict(self.metrics, queue_depth=sum(len(lane) for lane in self.pending.values()) + sum(len(lane) for lanes in self.chat_lanes.values() for lane in lanes.values()),
+                       dropped=sum(self.dropped.values()), latency_p50=self._percentile(all_latencies, 0.5),
+                       latency_p95=self._percentile(all_latencies, 0.95))
+        for priority, lane in NOTIFICATION_LANES.items():
+            metrics[f"{lane['name']}_dropped"] = self.dropped[priority]
+            metrics[f"{lane['name']}_latency_p95"] = self._percentile(self.latencies[priority], 0.95)
+        return metrics
+
+class BlockingExecutor:
+    """Bounded thread pool for the blocking work (BinanceAPI, MarketAnalyzer, create_trade) that the
+    async Telegram handlers need, so one slow exchange response never stalls the event loop."""
+    def __init__(self, max_workers):
+        self.pool = concurrent.futures.ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="handler-blocking")
+        self.lock = threading.Lock()
+        self.in_flight = 0 # calls queued or running; a handler that stopped waiting does not end the call
+
+    def submit(self, func, *args, **kwargs):
+        """Queues `func` and returns its concurrent.futures.Future."""
+        with self.lock:
+            self.in_flight += 1
+        future = self.pool.submit(functools.partial(func, *args, **kwargs))
+        future.add_done_callback(self._on_done)
+        return future
+
+    def _on_done(self, future):
+        with self.lock:
+            self.in_flight -= 1
+
+    def shutdown(self):
+        self.pool.shutdown(wait=False)
+
 class TelegramBotHandler:
     def __init__(self, token, admin_ids):
         self.token = token
         self.admin_user_ids = admin_ids
         self.admin_chat_ids = [] # Dynamically populated per session
         self.trading_bot = None
-        self.application = Application.builder().token(token).build()
+        self.async_binance_api = None # Non-blocking client for handlers running on the PTB event loop
+        self.blocking_executor = BlockingExecutor(CONFIG.get("handler_workers", 4))
+        self._pending_trade_pairs = set() # Pairs with a manual trade being opened, to ignore double taps
+        self.application = Application.builder().token(token).post_init(self._on_post_init).post_shutdown(self._on_post_shutdown).build()
+        self.notification_dispatcher = NotificationDispatcher(self.application.bot, admin_ids[0] if admin_ids else None,
+                                                              CONFIG.get("notification_critical_latency_target", 5))
         self.register_handlers()
         # Add initial admin_user_ids to admin_chat_ids if they are direct chat_ids (common for single user bots)
         # Bot needs to receive a message from an admin first to reliably get chat_id if it's a group.
@@ -1569,6 +4909,53 @@ class TelegramBotHandler:
         self.application.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, self.handle_message))
         self.application.add_error_handler(self.error_handler)
 
+    def _get_async_binance_api(self, cfg, chat_id):
+        api = self.async_binance_api
+        if not api or api.api_key != cfg["api_key"] or api.api_secret != cfg["api_secret"] or \
+           api.base_url != (BINANCE_TEST_API_URL if cfg["use_testnet"] else BINANCE_API_URL):
+            self.async_binance_api = AsyncBinanceAPI(cfg, chat_id)
+        return self.async_binance_api
+
+    async def _run_blocking(self, chat_id, func, *args, progress_message=None, on_done=None, **kwargs):
+        """Runs `func` on the blocking executor and awaits its result.
+
+        Past `handler_latency_budget` seconds `progress_message` is edited to say the work is still
+        running; past `handler_max_wait` asyncio.TimeoutError is raised. The work itself is never
+        cancelled once started, so an order that is already on its way still completes; `on_done` is
+        called (from the worker thread) when it really has finished, whether or not anyone still waits.
+        """
+        cfg = self.trading_bot.config if self.trading_bot else CONFIG
+        budget, max_wait = cfg.get("handler_latency_budget", 3), cfg.get("handler_max_wait", 60)
+        work = self.blocking_executor.submit(func, *args, **kwargs)
+        if on_done is not None:
+            work.add_done_callback(lambda _: on_done())
+        future = asyncio.wrap_future(work)
+        try:
+            return await asyncio.wait_for(asyncio.shield(future), budget)
+        except asyncio.TimeoutError:
+            logger.warning(f"{getattr(func, '__name__', func)} is over the {budget}s handler latency budget ({self.blocking_executor.in_flight} blocking calls in flight).")
+            if progress_message is not None:
+                try: await progress_message.edit_text(_t("handler_still_working", chat_id))
+                except Exception as e: logger.debug(f"Could not edit progress message: {e}")
+        return await asyncio.wait_for(future, max(0, max_wait - budget))
+
+    def _open_manual_trade(self, pair, chat_id):
+        """Blocking part of the trade_ button: fresh pair data, then create_trade. Returns (trade, pair_data)."""
+        pair_data = self.trading_bot.market_analyzer.get_pair_data(pair)
+        if not pair_data or pair_data.get("last_price", 0) <= 0:
+            return None, None
+        trade_type = "BUY" if pair_data.get("price_change", 0) > 0 else "SELL"
+        return self.trading_bot.create_trade(pair, trade_type, pair_data["last_price"], chat_id_for_trade=chat_id), pair_data
+
+    async def _on_post_init(self, application):
+        self.notification_dispatcher.start()
+
+    async def _on_post_shutdown(self, application):
+        await self.notification_dispatcher.stop()
+        await AsyncBinanceAPI.close_shared_session()
+        self.blocking_executor.shutdown()
+        if self.trading_bot: self.trading_bot.trade_store.close() # Writes out any queued trade updates
+
     async def is_authorized(self, update: Update) -> bool:
         user_id = update.effective_user.id
         chat_id = update.effective_chat.id if update.effective_chat else None
@@ -1679,7 +5066,7 @@ class TelegramBotHandler:
             await (update.callback_query or update.message).reply_text(_t("error_bot_not_initialized", chat_id))
             return
 
-        active_trades_list = [t for t in ACTIVE_TRADES if not t.get('completed', False)]
+        active_trades_list = self.trading_bot.trade_store.active_trades()
         ds = DAILY_STATS
         win_rate_daily = (ds["winning_trades"] / ds["total_trades"] * 100) if ds["total_trades"] > 0 else 0
         balance_change_bnb = ds.get("current_balance",0) - ds.get("starting_balance",0)
@@ -1695,7 +5082,7 @@ class TelegramBotHandler:
             f"{_t('status_tpsl_from_mode', chat_id)}: {tb_cfg.get('take_profit',0)}% / {tb_cfg.get('stop_loss',0)}%\n"
             f"{_t('status_max_trade_time', chat_id)}: {tb_cfg.get('max_trade_time',0)}s\n\n"
             f"{_t('status_active_trades', chat_id)}: {len(active_trades_list)}/{tb_cfg.get('max_concurrent_trades',0)}\n"
-            f"{_t('status_completed_session', chat_id)}: {len(COMPLETED_TRADES)}\n\n"
+            f"{_t('status_completed_session', chat_id)}: {self.trading_bot.trade_store.completed_count}\n\n"
             f"{_t('status_daily_stats_title', chat_id, date=ds.get('date', 'N/A'))}\n"
             f"{_t('status_daily_trades', chat_id, total_trades=ds.get('total_trades',0), winning_trades=ds.get('winning_trades',0), losing_trades=ds.get('losing_trades',0))}\n"
             f"{_t('status_daily_win_rate', chat_id)}: {win_rate_daily:.1f}%\n"
@@ -1705,6 +5092,40 @@ class TelegramBotHandler:
             f"{_t('status_auto_select_pairs', chat_id)}: {_t('status_on', chat_id) if tb_cfg.get('auto_select_pairs') else _t('status_off', chat_id)}\n"
             f"{_t('status_percentage_based_trading', chat_id)}: {(_t('status_on', chat_id) + ' ' + _t('status_percentage_value', chat_id, percentage=tb_cfg.get('trade_percentage'))) if tb_cfg.get('use_percentage') else _t('status_off', chat_id)}"
         )
+        rate_metrics = RequestScheduler.for_base_url(BINANCE_TEST_API_URL if tb_cfg.get('use_testnet') else BINANCE_API_URL, tb_cfg).get_metrics()
+        status_text += "\n\n" + _t('status_api_usage', chat_id, used_weight=rate_metrics['used_weight'], weight_limit=rate_metrics['weight_limit'],
+                                     peak_weight=rate_metrics['peak_weight'], order_count=rate_metrics['order_count'], order_limit=rate_metrics['order_limit'],
+                                     throttled=rate_metrics['throttled'], rejected=rate_metrics['rejected'],
+                                     rate_limited=rate_metrics['http_429'] + rate_metrics['http_418'])
+        notification_metrics = self.notification_dispatcher.get_metrics()
+        status_text += "\n" + _t('status_notifications', chat_id, queue_depth=notification_metrics['queue_depth'], sent=notification_metrics['messages_sent'],
+                                  coalesced=notification_metrics['coalesced'], latency_p95=notification_metrics['latency_p95'], failed=notification_metrics['failed'],
+                                  dropped=notification_metrics['dropped'], critical_latency_p95=notification_metrics['critical_latency_p95'])
+        for strategy_name, strategy_metrics in self.trading_bot.strategy_engine.get_metrics().items():
+            status_text += "\n" + _t('status_strategy', chat_id, name=strategy_name, state=_t('status_on', chat_id) if strategy_metrics['enabled'] else _t('status_off', chat_id),
+                                      opened=strategy_metrics['trades_opened'], closed=strategy_metrics['trades_closed'], wins=strategy_metrics['wins'],
+                                      pnl_pct=strategy_metrics['pnl_pct'], symbols_per_second=strategy_metrics['symbols_per_second'])
+        if tb_cfg.get("ai_dynamic_mode"):
+            advice_metrics, cache_metrics = self.trading_bot.advice_service.get_metrics(), self.trading_bot.advice_cache.get_metrics()
+            status_text += "\n" + _t('status_ai_advice', chat_id, fresh=advice_metrics['fresh_hits'], stale=advice_metrics['stale_hits'],
+                                      misses=advice_metrics['misses'], requests=advice_metrics['requests'], failures=advice_metrics['failures'],
+                                      in_flight=advice_metrics['in_flight'], latency_p95=advice_metrics['latency_p95'])
+            status_text += "\n" + _t('status_ai_advice_cache', chat_id, size=cache_metrics['size'], hits=cache_metrics['hits'],
+                                      gemini_calls=self.trading_bot.ai_metrics['calls'], evictions=cache_metrics['evictions'], expired=cache_metrics['expired'])
+            ai_metrics = self.trading_bot.ai_metrics
+            breaker_metrics = self.trading_bot.ai_breaker.get_metrics()
+            status_text += "\n" + _t('status_ai_calls', chat_id, state=breaker_metrics['state'], calls=breaker_metrics['calls'],
+                                      failure_rate=breaker_metrics['failure_rate'], slow=breaker_metrics['slow'], rejected=breaker_metrics['rejected'],
+                                      latency_p95=breaker_metrics['latency_p95'], mode_fallbacks=ai_metrics['mode_fallbacks'])
+            if tb_cfg.get("ai_advisor", "gemini") != "gemini":
+                local_advisor = self.trading_bot.local_advisor
+                status_text += "\n" + (_t('status_ai_local', chat_id, advisor=tb_cfg['ai_advisor'], version=local_advisor.version, samples=local_advisor.samples,
+                                           predictions=ai_metrics['local_predictions'],
+                                           avg_us=ai_metrics['local_seconds'] / max(ai_metrics['local_predictions'], 1) * 1e6)
+                                        if local_advisor else _t('status_ai_local_missing', chat_id, advisor=tb_cfg['ai_advisor']))
+            if ai_metrics['batch_calls']:
+                status_text += "\n" + _t('status_ai_batches', chat_id, batch_calls=ai_metrics['batch_calls'], batch_pairs=ai_metrics['batch_pairs'],
+                                          fallback_pairs=ai_metrics['fallback_pairs'])
         keyboard = [
             [InlineKeyboardButton(_t("button_start_trading", chat_id), callback_data="select_trading_mode_start"),
              InlineKeyboardButton(_t("button_stop_trading", chat_id), callback_data="stop_trading")],
@@ -1818,6 +5239,7 @@ class TelegramBotHandler:
             return
 
         self.trading_bot.config[param] = new_value
+        self.trading_bot.event_bus.publish(EVENT_CONFIG_CHANGED, param=param)
         msg_parts = [_t("config_updated", chat_id, param=param, new_value=new_value)]
 
         if param in ['api_key', 'api_secret', 'use_testnet']:
@@ -1861,12 +5283,15 @@ class TelegramBotHandler:
             await update.effective_message.reply_text(_t("error_bot_not_initialized", chat_id))
             return
 
-        all_trades = ACTIVE_TRADES + COMPLETED_TRADES
-        if not all_trades:
+        try: # flushes pending writes and reads SQLite, so not on the event loop
+            recent_trades = await self._run_blocking(chat_id, self.trading_bot.trade_store.recent_trades, 10)
+        except asyncio.TimeoutError:
+            await update.effective_message.reply_text(_t("handler_timed_out", chat_id))
+            return
+        if not recent_trades:
             await update.effective_message.reply_text(_t("trade_no_trades_recorded", chat_id))
             return
 
-        recent_trades = sorted(all_trades, key=lambda x: x.get('timestamp',0), reverse=True)[:10]
         trades_text = f"{_t('trade_recent_trades_title', chat_id)}\n\n"
         for trade in recent_trades:
             status_key = "trade_status_active" if not trade.get('completed', False) else "trade_status_completed_reason"
@@ -1875,7 +5300,7 @@ class TelegramBotHandler:
             
             time_info = _t("trade_entry_time_short", chat_id, time=trade.get('entry_time', 'N/A').split(' ')[1])
             if not trade.get('completed', False):
-                elapsed = int(time.time() - trade.get('timestamp',0))
+                elapsed = int(self.trading_bot.clock.time() - trade.get('timestamp',0))
                 time_info += _t("trade_elapsed_time_short", chat_id, seconds=elapsed)
             else:
                 time_info += _t("trade_exit_time_short", chat_id, time=trade.get('exit_time', 'N/A').split(' ')[1])
@@ -1905,10 +5330,10 @@ class TelegramBotHandler:
     async def whales_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         if not await self.is_authorized(update): return
         chat_id = update.effective_chat.id
-        if not MOCK_WHALE_TRANSACTIONS:
+        if not WHALE_TRANSACTIONS:
             await update.effective_message.reply_text(_t("whale_no_mock_alerts", chat_id))
             return
-        recent_whales = sorted(MOCK_WHALE_TRANSACTIONS, key=lambda x: x['id'], reverse=True)[:5]
+        recent_whales = list(WHALE_TRANSACTIONS)[-5:][::-1]
         whales_text = f"{_t('whale_recent_mock_alerts_title', chat_id)}\n\n"
         for whale in recent_whales:
             whales_text += (
@@ -1983,24 +5408,28 @@ class TelegramBotHandler:
            self.trading_bot.binance_api.api_key != cfg["api_key"] or \
            self.trading_bot.binance_api.api_secret != cfg["api_secret"] or \
            self.trading_bot.binance_api.base_url != (BINANCE_TEST_API_URL if cfg["use_testnet"] else BINANCE_API_URL):
-             self.trading_bot.binance_api = BinanceAPI(cfg, chat_id)
+             self.trading_bot.binance_api = BinanceAPI(cfg, chat_id) # keys set since startup are used for trading too
+        api = self._get_async_binance_api(cfg, chat_id)
 
-        if self.trading_bot.binance_api:
+        if api:
             try:
-                ping_url = f"{self.trading_bot.binance_api.base_url}/api/v3/ping"
-                ping_response = requests.get(ping_url, timeout=10)
-                if ping_response.status_code != 200:
-                    await status_msg.edit_text(_t("error_api_test_ping_failed", chat_id, status_code=ping_response.status_code, response_text=ping_response.text))
+                ping_status, ping_text = await api.ping()
+                if ping_status != 200:
+                    await status_msg.edit_text(_t("error_api_test_ping_failed", chat_id, status_code=ping_status, response_text=ping_text))
                     return
-                server_time_data = requests.get(f"{self.trading_bot.binance_api.base_url}/api/v3/time", timeout=10).json()
-                server_time_str = datetime.fromtimestamp(server_time_data['serverTime'] / 1000).strftime("%Y-%m-%d %H:%M:%S UTC")
+                server_time_ms = await api.get_server_time()
+                if server_time_ms is None:
+                    await status_msg.edit_text(_t("error_api_test_ping_failed", chat_id, status_code=ping_status,
+                                                  response_text="/api/v3/time returned no serverTime"))
+                    return
+                server_time_str = datetime.fromtimestamp(server_time_ms / 1000).strftime("%Y-%m-%d %H:%M:%S UTC")
                 
                 await status_msg.edit_text(
                     _t("api_test_ping_server_time_ok", chat_id,
                        mode=_t('status_testnet', chat_id) if cfg.get('use_testnet') else _t('status_production', chat_id),
-                       base_url=self.trading_bot.binance_api.base_url, server_time=server_time_str)
+                       base_url=api.base_url, server_time=server_time_str)
                 )
-                account_info = self.trading_bot.binance_api.get_account_info()
+                account_info = await api.get_account_info()
                 if account_info and 'balances' in account_info:
                     balances = [f"{b['asset']}: {b['free']} + {b['locked']}" for b in account_info['balances'] if float(b['free']) > 0 or float(b['locked']) > 0][:5]
                     balances_str = "\n".join(balances) if balances else _t("api_test_no_assets_with_balance", chat_id)
@@ -2022,7 +5451,7 @@ class TelegramBotHandler:
                            mode=_t('status_testnet', chat_id) if cfg.get('use_testnet') else _t('status_production', chat_id),
                            error_detail=_t(err_detail_key, chat_id, msg=bin_msg, code=bin_code))
                     )
-            except requests.exceptions.Timeout: await status_msg.edit_text(_t("error_api_timeout", chat_id))
+            except (requests.exceptions.Timeout, asyncio.TimeoutError): await status_msg.edit_text(_t("error_api_timeout", chat_id))
             except Exception as e_conn: await status_msg.edit_text(_t("error_api_connection_failed_generic", chat_id, e_conn=str(e_conn)))
         else: await status_msg.edit_text(_t("error_api_not_initialized_config", chat_id))
 
@@ -2057,8 +5486,8 @@ class TelegramBotHandler:
 
         status_msg = await update.effective_message.reply_text(_t("api_test_enable_real_testing_production", chat_id))
         test_cfg = {**cfg, "use_real_trading": True, "use_testnet": False}
-        test_api = BinanceAPI(test_cfg, chat_id)
-        account_info = test_api.get_account_info()
+        test_api = AsyncBinanceAPI(test_cfg, chat_id)
+        account_info = await test_api.get_account_info()
 
         if account_info and account_info.get('canTrade'):
             cfg.update({"use_real_trading": True, "use_testnet": False, "mock_mode": False})
@@ -2102,14 +5531,13 @@ class TelegramBotHandler:
             await update.effective_message.reply_text(_t("error_api_credentials_not_set", chat_id))
             return
         status_msg = await update.effective_message.reply_text(_t("api_test_fetching_balance", chat_id))
-        if not self.trading_bot.binance_api or \
-           self.trading_bot.binance_api.api_key != cfg["api_key"] or \
-           self.trading_bot.binance_api.api_secret != cfg["api_secret"] or \
-           self.trading_bot.binance_api.base_url != (BINANCE_TEST_API_URL if cfg["use_testnet"] else BINANCE_API_URL):
-             self.trading_bot.binance_api = BinanceAPI(cfg, chat_id)
+        api = self._get_async_binance_api(cfg, chat_id)
 
-        if self.trading_bot.binance_api:
-            account_info = self.trading_bot.binance_api.get_account_info()
+        if api:
+            cached_state = self.trading_bot.binance_api.account_state if self.trading_bot.binance_api else None
+            account_info = cached_state.cached_account_info() if cached_state else None
+            if account_info is None:
+                account_info = await api.get_account_info()
             if account_info and 'balances' in account_info:
                 balances = [b for b in account_info['balances'] if float(b['free']) > 0 or float(b['locked']) > 0]
                 balances_text = "\n".join([f"{b['asset']}: {b['free']} + {b['locked']}" for b in balances[:15]])
@@ -2138,11 +5566,14 @@ class TelegramBotHandler:
         if not ma:
             await (update.callback_query or update.message).reply_text(_t("error_market_analyzer_not_ready", chat_id))
             return
-        if not ma.config.get("mock_mode", True) and (not ma.market_data or time.time() - ma.last_update > 60):
+        if not ma.config.get("mock_mode", True) and not ma.replaying and (not ma.market_data or time.time() - ma.last_update > 60):
             msg_to_edit = await (update.callback_query or update.message).reply_text(_t("bnb_pairs_updating_market_data", chat_id))
-            ma.update_market_data()
-            edit_target = msg_to_edit.edit_text if update.callback_query else msg_to_edit.edit_text # for message objects, it's the same
-            await edit_target(_t("bnb_pairs_market_data_updated_fetching", chat_id))
+            try:
+                await self._run_blocking(chat_id, ma.update_market_data, progress_message=msg_to_edit)
+            except asyncio.TimeoutError:
+                await msg_to_edit.edit_text(_t("handler_timed_out", chat_id))
+                return
+            await msg_to_edit.edit_text(_t("bnb_pairs_market_data_updated_fetching", chat_id))
 
         pairs = ma.market_data
         bnb_base = [p for p in pairs if p["pair"].startswith("BNB")]
@@ -2253,7 +5684,7 @@ class TelegramBotHandler:
             f"{_t('whale_config_detection_status', chat_id, status=(_t('status_on', chat_id) if cfg.get('whale_detection') else _t('status_off', chat_id)))}\n"
             f"{_t('whale_config_auto_trade_status', chat_id, status=(_t('status_on', chat_id) if cfg.get('auto_trade_on_whale') else _t('status_off', chat_id)))}\n"
             f"{_t('whale_config_strategy_status', chat_id, strategy=cfg.get('trading_strategy','N/A'))}\n"
-            f"{_t('whale_config_threshold_status_mock', chat_id, threshold=cfg.get('whale_threshold',0))}"
+            f"{_t('whale_config_threshold_status', chat_id, threshold=cfg.get('whale_threshold',0), quantile=cfg.get('whale_quantile', 0.999) * 100)}"
         )
         target = update.callback_query.edit_message_text if update.callback_query else update.effective_message.reply_text
         await target(text, reply_markup=InlineKeyboardMarkup(kb))
@@ -2296,7 +5727,12 @@ class TelegramBotHandler:
         if not self.trading_bot:
             await update.effective_message.reply_text(_t("error_bot_not_initialized", chat_id))
             return
-        if self.trading_bot.stop_trading(chat_id):
+        try:
+            stopped = await self._run_blocking(chat_id, self.trading_bot.stop_trading, chat_id)
+        except asyncio.TimeoutError:
+            await update.effective_message.reply_text(_t("handler_timed_out", chat_id))
+            return
+        if stopped:
             await update.effective_message.reply_text(_t("trading_modes_stopped_success", chat_id))
         else:
             await update.effective_message.reply_text(_t("trading_modes_already_stopped", chat_id))
@@ -2316,8 +5752,15 @@ class TelegramBotHandler:
             msg = _t("trading_modes_ai_dynamic_mode_enabled", chat_id)
             # Try to get initial AI parameters for a default pair like BNBUSDT to show an example
             # This can be slow, so consider making it optional or showing a "Fetching initial AI params..." message
-            if gemini_model: # Only if AI is configured
-                initial_ai_advice = self.trading_bot.get_ai_trade_advice("BNBUSDT", chat_id_context=chat_id)
+            if self.trading_bot.ai_model: # Only if AI is configured
+                progress_message = await (update.callback_query.edit_message_text if update.callback_query else update.effective_message.reply_text)(
+                    msg + "\n" + _t("handler_working", chat_id))
+                try:
+                    initial_ai_advice = await self._run_blocking(chat_id, self.trading_bot.get_ai_trade_advice, "BNBUSDT",
+                                                                 chat_id_context=chat_id, max_wait=cfg.get("handler_max_wait", 60),
+                                                                 progress_message=progress_message)
+                except asyncio.TimeoutError:
+                    initial_ai_advice = None
                 if initial_ai_advice:
                     msg += "\n" + _t("trading_modes_ai_current_params", chat_id, pair="BNBUSDT", 
                                      tp=initial_ai_advice['tp_percentage'], sl=initial_ai_advice['sl_percentage'], 
@@ -2328,6 +5771,7 @@ class TelegramBotHandler:
             msg = _t("trading_modes_ai_dynamic_mode_disabled", chat_id, previous_mode=cfg.get('trading_mode', 'default'))
         
         target = update.callback_query.edit_message_text if update.callback_query else update.effective_message.reply_text
+        if cfg["ai_dynamic_mode"] and self.trading_bot.ai_model: target = progress_message.edit_text
         await target(msg)
         # Optionally, refresh the config or status view
         if update.callback_query: await self.config_command(update, context)
@@ -2373,12 +5817,19 @@ class TelegramBotHandler:
                 tm_cfg = TRADING_MODES[mode_key]
                 if is_starting:
                     cfg["trading_enabled"] = True
+                    self.trading_bot.event_bus.publish(EVENT_CONFIG_CHANGED, param="trading_enabled")
                     if cfg.get("use_real_trading") and \
                        (not cfg.get("api_key") or cfg.get("api_key","").startswith("YOUR_") or \
                         not cfg.get("api_secret") or cfg.get("api_secret","").startswith("YOUR_")):
                         await query.edit_message_text(_t("trading_modes_cannot_start_real_no_api", chat_id))
                         return
-                    if self.trading_bot.start_trading(chat_id):
+                    await query.edit_message_text(_t("handler_working", chat_id))
+                    try:
+                        started = await self._run_blocking(chat_id, self.trading_bot.start_trading, chat_id, progress_message=query.message)
+                    except asyncio.TimeoutError:
+                        await query.edit_message_text(_t("handler_timed_out", chat_id))
+                        return
+                    if started:
                         await query.edit_message_text(_t("trading_modes_started_success", chat_id, mode_name=mode_key.replace('_',' ').capitalize(),
                                                           tp=tm_cfg['take_profit'], sl=tm_cfg['stop_loss'], max_time=tm_cfg['max_trade_time']))
                     else:
@@ -2390,7 +5841,12 @@ class TelegramBotHandler:
             return
 
         if data == "stop_trading":
-            if self.trading_bot.stop_trading(chat_id): await query.edit_message_text(_t("trading_modes_stopped_success", chat_id))
+            try:
+                stopped = await self._run_blocking(chat_id, self.trading_bot.stop_trading, chat_id)
+            except asyncio.TimeoutError:
+                await query.edit_message_text(_t("handler_timed_out", chat_id))
+                return
+            if stopped: await query.edit_message_text(_t("trading_modes_stopped_success", chat_id))
             else: await query.edit_message_text(_t("trading_modes_already_stopped", chat_id))
             return
 
@@ -2402,20 +5858,30 @@ class TelegramBotHandler:
             if not self.trading_bot.market_analyzer:
                 await query.answer(_t("trade_market_analyzer_not_ready_manual", chat_id), show_alert=True)
                 return
-            pair_data = self.trading_bot.market_analyzer.get_pair_data(pair)
-            if pair_data and pair_data.get("last_price",0) > 0:
-                trade_type = "BUY" if pair_data.get("price_change",0) > 0 else "SELL"
-                if any(t['pair'] == pair and not t.get('completed', False) for t in ACTIVE_TRADES):
-                    await query.answer(_t("trade_pair_already_active", chat_id, pair=pair), show_alert=True)
-                    return
-                trade = self.trading_bot.create_trade(pair, trade_type, pair_data["last_price"], chat_id_for_trade=chat_id)
-                if trade:
-                    details = f"Manual Selection ({pair})" # Not translated, internal detail
-                    msg = self.trading_bot._format_trade_notification(trade, details, "trade_notification_new_auto_selected", chat_id)
-                    await context.bot.send_message(chat_id=query.message.chat_id, text=msg, parse_mode=ParseMode.HTML)
-                    await query.edit_message_text(_t("trade_initiate_manual_success", chat_id, pair=pair), reply_markup=None)
-                else: await query.answer(_t("trade_initiate_manual_fail", chat_id, pair=pair), show_alert=True)
-            else: await query.answer(_t("trade_initiate_manual_no_valid_data", chat_id, pair=pair), show_alert=True)
+            if self.trading_bot.trade_store.has_open_trade(pair) or pair in self._pending_trade_pairs:
+                await query.answer(_t("trade_pair_already_active", chat_id, pair=pair), show_alert=True)
+                return
+            self._pending_trade_pairs.add(pair)
+            try:
+                progress_message = await query.message.reply_text(_t("handler_working", chat_id))
+            except Exception:
+                self._pending_trade_pairs.discard(pair)
+                raise
+            try:
+                # The guard is lifted when create_trade returns, not when this handler stops waiting for it
+                trade, pair_data = await self._run_blocking(chat_id, self._open_manual_trade, pair, chat_id, progress_message=progress_message,
+                                                            on_done=lambda: self._pending_trade_pairs.discard(pair))
+            except asyncio.TimeoutError:
+                await progress_message.edit_text(_t("handler_timed_out", chat_id))
+                return
+            if pair_data is None:
+                await progress_message.edit_text(_t("trade_initiate_manual_no_valid_data", chat_id, pair=pair))
+            elif trade:
+                details = f"Manual Selection ({pair})" # Not translated, internal detail
+                msg = self.trading_bot._format_trade_notification(trade, details, "trade_notification_new_auto_selected", chat_id)
+                await progress_message.edit_text(msg, parse_mode=ParseMode.HTML)
+                await query.edit_message_text(_t("trade_initiate_manual_success", chat_id, pair=pair), reply_markup=None)
+            else: await progress_message.edit_text(_t("trade_initiate_manual_fail", chat_id, pair=pair))
             return
 
         if data == "toggle_real_trading":
@@ -2426,7 +5892,11 @@ class TelegramBotHandler:
             # await self.config_command(update, context) # This will refresh the config menu
             return
         if data == "toggle_percentage_based": self.trading_bot.config["use_percentage"] = not self.trading_bot.config.get("use_percentage", False); await self.config_command(update, context); return
-        if data == "toggle_auto_select": self.trading_bot.config["auto_select_pairs"] = not self.trading_bot.config.get("auto_select_pairs", True); await self.config_command(update, context); return
+        if data == "toggle_auto_select":
+            self.trading_bot.config["auto_select_pairs"] = not self.trading_bot.config.get("auto_select_pairs", True)
+            self.trading_bot.event_bus.publish(EVENT_CONFIG_CHANGED, param="auto_select_pairs")
+            await self.config_command(update, context)
+            return
         if data == "toggle_whale_detection": self.trading_bot.config["whale_detection"] = not self.trading_bot.config.get("whale_detection", True); await self.whale_config_command(update, context); return
         if data == "toggle_auto_trade_whale": self.trading_bot.config["auto_trade_on_whale"] = not self.trading_bot.config.get("auto_trade_on_whale", False); await self.whale_config_command(update, context); return
         if data == "strategy_follow_whale": self.trading_bot.config["trading_strategy"] = "follow_whale"; await self.whale_config_command(update, context); return
@@ -2444,13 +5914,19 @@ class TelegramBotHandler:
             if not self.trading_bot.running or not self.trading_bot.config.get("trading_enabled"):
                 await query.answer(_t("whale_follow_engine_not_active", chat_id), show_alert=True); return
             whale_id = int(data.split("_")[2])
-            whale_tx = next((w for w in MOCK_WHALE_TRANSACTIONS if w['id'] == whale_id), None)
+            whale_tx = next((w for w in WHALE_TRANSACTIONS if w['id'] == whale_id), None)
             if not whale_tx: await query.answer(_t("whale_follow_tx_not_found", chat_id, whale_id=whale_id), show_alert=True); return
-            if any(t['pair'] == whale_tx['token'] and not t.get('completed', False) for t in ACTIVE_TRADES):
+            if self.trading_bot.trade_store.has_open_trade(whale_tx['token']):
                 await query.answer(_t("trade_pair_already_active", chat_id, pair=whale_tx['token']), show_alert=True); return
-            trade_obj = self.trading_bot.create_trade_from_whale(whale_tx, whale_tx['type'], is_auto_trade=False, chat_id_for_trade=chat_id)
+            await query.edit_message_text(_t("handler_working", chat_id), reply_markup=None)
+            try:
+                trade_obj = await self._run_blocking(chat_id, self.trading_bot.create_trade_from_whale, whale_tx, whale_tx['type'],
+                                                     is_auto_trade=False, chat_id_for_trade=chat_id, progress_message=query.message)
+            except asyncio.TimeoutError:
+                await query.edit_message_text(_t("handler_timed_out", chat_id))
+                return
             if trade_obj: await query.edit_message_text(_t("whale_follow_attempt_success", chat_id, whale_id=whale_id, token=whale_tx['token']), reply_markup=None)
-            else: await query.answer(_t("whale_follow_attempt_fail", chat_id, whale_id=whale_id), show_alert=True)
+            else: await query.edit_message_text(_t("whale_follow_attempt_fail", chat_id, whale_id=whale_id))
             return
         if data.startswith("ignore_whale_"):
             whale_id = int(data.split("_")[2])
@@ -2498,6 +5974,9 @@ class TelegramBotHandler:
         self.trading_bot = trading_bot
 
 def main():
+    if RUNNING_OFFLINE:
+        {"backtest": run_backtest_cli, "replay": run_replay_cli, "train-advisor": run_train_advisor_cli}[sys.argv[1]](sys.argv[2:])
+        return
     _load_translations() # Ensure translations are loaded first
 
     if BINANCE_API_KEY and BINANCE_API_KEY != "YOUR_BINANCE_API_KEY": CONFIG["api_key"] = BINANCE_API_KEY
@@ -0,0 +1,38 @@
+import os
+import sys
+
+import pytest
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+os.environ.setdefault("TELEGRAM_BOT_TOKEN", "123456:test-token") # spotAI exits at import without one
+os.environ["GEMINI_API_KEY"] = "" # never configure the real model in tests
+
+import spotAI # noqa: E402
+
+
+@pytest.fixture(scope="session", autouse=True)
+def translations():
+    cwd = os.getcwd()
+    os.chdir(REPO_ROOT) # language files are read from the working directory
+    try:
+        spotAI._load_translations()
+    finally:
+        os.chdir(cwd)
+
+
+@pytest.fixture
+def make_bot(tmp_path):
+    """Factory for TradingBots whose journal, advice cache and kline store live in tmp_path, never the working directory."""
+    bots = []
+
+    def make(telegram_bot=None, ai_model=None, **overrides):
+        config = dict(spotAI.CONFIG, api_key="", api_secret="", trade_db_file=str(tmp_path / "trades.db"),
+                      ai_advice_cache_file=str(tmp_path / "ai_advice_cache.json"), kline_store_dir=str(tmp_path / "klines"), **overrides)
+        bot = spotAI.TradingBot(config, telegram_bot, ai_model=ai_model)
+        bots.append(bot)
+        return bot
+
+    yield make
+    for bot in bots:
+        bot.trade_store.close()
@@ -0,0 +1,85 @@
+"""TradingBot._request_ai_advice_batch against a stub model: full, partial and malformed batch answers."""
+import json
+import re
+import types
+import zlib
+
+import pytest
+
+
+class StubModel:
+    """Stand-in for the Gemini model that answers advice prompts with fixed, per-pair advice.
+
+    Pairs in `omit_pairs` are left out of batch answers; `malformed` makes batch answers unparsable.
+    Single-pair prompts are always answered.
+    """
+    def __init__(self, omit_pairs=(), malformed=False):
+        self.omit_pairs = set(omit_pairs)
+        self.malformed = malformed
+        self.prompts = []
+
+    def generate_content(self, prompt, generation_config=None, request_options=None):
+        self.prompts.append(prompt)
+        batch_pairs = re.findall(r"^PAIR (\S+):$", prompt, re.MULTILINE)
+        if batch_pairs and self.malformed:
+            return types.SimpleNamespace(text='```json\n[{"pair": "' + batch_pairs[0] + '", "tp_percentage": 1.2,\n```')
+        if batch_pairs:
+            answer = [dict(self.advice(pair), pair=pair) for pair in batch_pairs if pair not in self.omit_pairs]
+        else:
+            answer = self.advice(re.search(r"on the pair (\S+)\.", prompt).group(1))
+        return types.SimpleNamespace(text="```json\n" + json.dumps(answer) + "\n```")
+
+    @staticmethod
+    def advice(pair):
+        seed = zlib.crc32(pair.encode())
+        return {"tp_percentage": round(0.8 + seed % 20 / 10, 1), "sl_percentage": round(0.5 + seed % 7 / 10, 1),
+                "max_trade_time_seconds": 300 + seed % 10 * 60, "rationale": f"Stub advice for {pair}."}
+
+
+PAIRS = ["BNBUSDT", "ETHUSDT", "SOLUSDT"]
+
+
+@pytest.fixture
+def make_advised_bot(make_bot):
+    def make(model):
+        bot = make_bot(ai_model=model)
+        # Market data is not under test: every pair is ready for a prompt and has nothing cached
+        bot._prepare_ai_advice = lambda pair, chat_id_context=None: (f"features-{pair}", None, f"Current market conditions for {pair}\n")
+        return bot
+
+    return make
+
+
+def test_full_batch_answer_takes_one_call(make_advised_bot):
+    model = StubModel()
+    bot = make_advised_bot(model)
+    results = bot._request_ai_advice_batch(PAIRS)
+    assert len(model.prompts) == 1
+    assert results == {pair: StubModel.advice(pair) for pair in PAIRS}
+    assert bot.ai_metrics["batch_calls"] == 1 and bot.ai_metrics["batch_pairs"] == 3 and bot.ai_metrics["fallback_pairs"] == 0
+    assert bot.advice_cache.get("features-ETHUSDT") == StubModel.advice("ETHUSDT")
+
+
+def test_partial_batch_answer_falls_back_per_pair(make_advised_bot):
+    model = StubModel(omit_pairs={"SOLUSDT"})
+    bot = make_advised_bot(model)
+    results = bot._request_ai_advice_batch(PAIRS)
+    assert len(model.prompts) == 2
+    assert "on the pair SOLUSDT." in model.prompts[1]
+    assert results == {pair: StubModel.advice(pair) for pair in PAIRS}
+    assert bot.ai_metrics["fallback_pairs"] == 1
+
+
+def test_malformed_batch_answer_falls_back_for_every_pair(make_advised_bot):
+    model = StubModel(malformed=True)
+    bot = make_advised_bot(model)
+    results = bot._request_ai_advice_batch(PAIRS)
+    assert len(model.prompts) == 1 + len(PAIRS)
+    assert results == {pair: StubModel.advice(pair) for pair in PAIRS}
+    assert bot.ai_metrics["fallback_pairs"] == len(PAIRS)
+    assert bot.ai_breaker.is_open() is False # a parse failure is the model's answer, not an unavailable API
+
+
+def test_no_model_means_no_advice(make_advised_bot):
+    bot = make_advised_bot(None)
+    assert bot.get_ai_trade_advice("BNBUSDT") is None
@@ -0,0 +1,17 @@
+"""Backtester on a kline store without usable data."""
+import spotAI
+
+PARAMS = dict(spotAI.TRADING_MODES["balanced_growth"])
+ZERO = {'trades': 0, 'win_rate': 0.0, 'pnl_pct': 0.0, 'pnl_bnb': 0.0, 'max_drawdown_bnb': 0.0}
+
+
+def test_run_without_data_is_a_zero_result(tmp_path):
+    backtester = spotAI.Backtester(spotAI.KlineStore(str(tmp_path)), ["BNBUSDT", "ETHBNB"])
+    assert backtester.data == {}
+    assert backtester.run(PARAMS) == ZERO
+
+
+def test_sweep_workers_without_data(tmp_path):
+    backtester = spotAI.Backtester(spotAI.KlineStore(str(tmp_path)), ["BNBUSDT"])
+    results = backtester.sweep([PARAMS, dict(PARAMS, take_profit=2.0)], workers=2, store_directory=str(tmp_path), symbols=["BNBUSDT"])
+    assert results == [ZERO, ZERO]
@@ -0,0 +1,24 @@
+"""The blocking and awaitable Binance clients share signing but not endpoint methods."""
+import inspect
+
+import spotAI
+
+
+def public_methods(cls):
+    return {name for name, member in inspect.getmembers(cls, inspect.isfunction) if not name.startswith("_")}
+
+
+def test_async_client_only_has_coroutine_endpoints():
+    shared = public_methods(spotAI.BinanceClientBase)
+    for name in public_methods(spotAI.AsyncBinanceAPI) - shared:
+        assert inspect.iscoroutinefunction(getattr(spotAI.AsyncBinanceAPI, name)), name
+    for name in ("get_market_data", "get_bnb_pairs", "get_cached_account_info", "create_listen_key", "keepalive_listen_key", "close_listen_key"):
+        assert not hasattr(spotAI.AsyncBinanceAPI, name), name
+
+
+def test_both_clients_sign_orders_identically():
+    config = dict(spotAI.CONFIG, api_key="key", api_secret="secret", use_testnet=True)
+    sync_api, async_api = spotAI.BinanceAPI(config), spotAI.AsyncBinanceAPI(config)
+    params = {"symbol": "ETHBNB", "side": "BUY", "type": "MARKET", "quantity": "1", "timestamp": 1_700_000_000_000}
+    assert sync_api._generate_signature(params) == async_api._generate_signature(params)
+    assert sync_api._get_headers() == async_api._get_headers() == {"X-MBX-APIKEY": "key"}
@@ -0,0 +1,27 @@
+"""Daily profit target and loss limit."""
+import pytest
+
+import spotAI
+
+
+@pytest.fixture
+def bot(make_bot):
+    trading_bot = make_bot(use_real_trading=True, trading_enabled=True, daily_profit_target=10.0, daily_loss_limit=5.0)
+    yield trading_bot
+    trading_bot.reset_daily_stats()
+
+
+@pytest.mark.parametrize("current_balance, limit", [(0.94, "loss_limit"), (1.11, "profit_target")])
+def test_reaching_a_daily_limit_pauses_entries(bot, current_balance, limit):
+    published = []
+    bot.event_bus.subscribe((spotAI.EVENT_DAILY_LIMIT,), lambda event_type, data: published.append(data["limit"]))
+    spotAI.DAILY_STATS.update(starting_balance=1.0, current_balance=current_balance)
+    bot._evaluate_entry()
+    assert published == [limit]
+    assert not bot.config["trading_enabled"]
+
+
+def test_within_the_daily_limits_entries_stay_enabled(bot):
+    spotAI.DAILY_STATS.update(starting_balance=1.0, current_balance=1.02)
+    assert bot.check_daily_limits()
+    assert bot.config["trading_enabled"] and bot.event_bus.published[spotAI.EVENT_DAILY_LIMIT] == 0
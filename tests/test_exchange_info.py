@@ -0,0 +1,42 @@
+"""ExchangeInfoCache background refresh."""
+import threading
+import time
+import types
+
+import spotAI
+
+
+class SlowExchangeInfoAPI:
+    def __init__(self):
+        self.calls = 0
+        self.release = threading.Event()
+        self.scheduler = types.SimpleNamespace(weight_limit=6000)
+
+    def used_weight_1m(self):
+        return 0
+
+    def get_exchange_info(self):
+        self.calls += 1
+        self.release.wait(5)
+        return {"symbols": [{"symbol": "ETHBNB", "baseAsset": "ETH", "quoteAsset": "BNB", "status": "TRADING", "filters": []}]}
+
+
+def test_stale_data_seen_by_many_threads_starts_one_refresh():
+    cache = spotAI.ExchangeInfoCache("https://exchange-info.test", dict(spotAI.CONFIG, exchange_info_snapshot_file=""))
+    cache._index([{"symbol": "ETHBNB", "baseAsset": "ETH", "quoteAsset": "BNB", "status": "TRADING", "filters": []}], 0) # stale
+    api = SlowExchangeInfoAPI()
+    barrier = threading.Barrier(16)
+
+    def check():
+        barrier.wait()
+        cache.ensure_fresh(api)
+
+    threads = [threading.Thread(target=check) for _ in range(16)]
+    for thread in threads: thread.start()
+    for thread in threads: thread.join()
+    api.release.set()
+    for _ in range(500):
+        if not cache._refreshing: break
+        time.sleep(0.01)
+    assert api.calls == 1
+    assert not cache._refreshing and not cache.is_stale()
@@ -0,0 +1,137 @@
+"""Telegram command handlers, driven with stand-in updates and Binance clients."""
+import asyncio
+import threading
+import types
+
+import pytest
+
+import spotAI
+
+ADMIN = 4242
+
+
+class FakeMessage:
+    def __init__(self, texts):
+        self.texts = texts
+
+    async def reply_text(self, text, **kwargs):
+        self.texts.append(text)
+        return FakeMessage(self.texts)
+
+    async def edit_text(self, text, **kwargs):
+        self.texts.append(text)
+        return self
+
+
+class FakeQuery:
+    def __init__(self, data, texts):
+        self.data, self.texts = data, texts
+        self.message = FakeMessage(texts)
+        self.alerts = []
+
+    async def answer(self, text=None, show_alert=False):
+        if text: self.alerts.append(text)
+
+    async def edit_message_text(self, text, **kwargs):
+        self.texts.append(text)
+
+
+def make_update(texts, callback_data=None):
+    chat = types.SimpleNamespace(id=ADMIN)
+    return types.SimpleNamespace(effective_user=types.SimpleNamespace(id=ADMIN), effective_chat=chat,
+                                 effective_message=FakeMessage(texts),
+                                 callback_query=FakeQuery(callback_data, texts) if callback_data else None)
+
+
+class FakeAsyncAPI:
+    def __init__(self, config, server_time=1_700_000_000_000):
+        self.api_key, self.api_secret = config["api_key"], config["api_secret"]
+        self.base_url = spotAI.BINANCE_TEST_API_URL if config["use_testnet"] else spotAI.BINANCE_API_URL
+        self.server_time = server_time
+
+    async def ping(self):
+        return 200, "{}"
+
+    async def get_server_time(self):
+        return self.server_time
+
+    async def get_account_info(self):
+        return {"canTrade": True, "accountType": "SPOT", "balances": [{"asset": "BNB", "free": "1.0", "locked": "0.0"}]}
+
+
+@pytest.fixture
+def handler(make_bot):
+    telegram_handler = spotAI.TelegramBotHandler("123456:test-token", [ADMIN])
+    telegram_handler.trading_bot = make_bot(telegram_handler, use_testnet=False)
+    yield telegram_handler
+    telegram_handler.blocking_executor.shutdown()
+
+
+def test_api_test_reports_a_missing_server_time(handler):
+    handler.trading_bot.config.update(api_key="key", api_secret="secret")
+    handler.async_binance_api = FakeAsyncAPI(handler.trading_bot.config, server_time=None)
+    texts = []
+    asyncio.run(handler.test_api_command(make_update(texts), None))
+    assert texts[-1] == spotAI._t("error_api_test_ping_failed", ADMIN, status_code=200, response_text="/api/v3/time returned no serverTime")
+
+
+def test_api_test_puts_new_keys_into_the_trading_client(handler):
+    assert handler.trading_bot.binance_api is None # no keys at startup
+    handler.trading_bot.config.update(api_key="key", api_secret="secret")
+    handler.async_binance_api = FakeAsyncAPI(handler.trading_bot.config)
+    texts = []
+    asyncio.run(handler.test_api_command(make_update(texts), None))
+    assert "BNB: 1.0 + 0.0" in texts[-1]
+    assert (handler.trading_bot.binance_api.api_key, handler.trading_bot.binance_api.api_secret) == ("key", "secret")
+
+
+def test_executor_counts_work_until_it_finishes_not_until_the_caller_gives_up(handler):
+    release = threading.Event()
+
+    async def give_up():
+        future = asyncio.wrap_future(handler.blocking_executor.submit(release.wait, 5))
+        with pytest.raises(asyncio.TimeoutError):
+            await asyncio.wait_for(future, 0.05)
+
+    asyncio.run(give_up())
+    assert handler.blocking_executor.in_flight == 1 # still running on the worker
+    release.set()
+    handler.blocking_executor.pool.shutdown(wait=True)
+    assert handler.blocking_executor.in_flight == 0
+
+
+def test_manual_trade_keeps_the_double_tap_guard_until_create_trade_returns(handler):
+    bot = handler.trading_bot
+    bot.running = True
+    bot.config.update(trading_enabled=True, handler_latency_budget=0.02, handler_max_wait=0.05)
+    release, finished = threading.Event(), threading.Event()
+
+    def slow_open(pair, chat_id):
+        release.wait(5)
+        finished.set()
+        return None, None
+
+    handler._open_manual_trade = slow_open
+    texts = []
+    asyncio.run(handler.button_callback(make_update(texts, "trade_ETHBNB"), None))
+    assert texts[-1] == spotAI._t("handler_timed_out", ADMIN)
+    assert "ETHBNB" in handler._pending_trade_pairs # the order may still be placed
+
+    retry = make_update([], "trade_ETHBNB")
+    asyncio.run(handler.button_callback(retry, None))
+    assert retry.callback_query.alerts == [spotAI._t("trade_pair_already_active", ADMIN, pair="ETHBNB")]
+
+    release.set()
+    assert finished.wait(5)
+    handler.blocking_executor.pool.shutdown(wait=True)
+    assert "ETHBNB" not in handler._pending_trade_pairs
+
+
+def test_stop_trading_reports_a_timeout(handler):
+    release = threading.Event()
+    handler.trading_bot.config.update(handler_latency_budget=0.02, handler_max_wait=0.05)
+    handler.trading_bot.stop_trading = lambda chat_id: release.wait(5)
+    texts = []
+    asyncio.run(handler.stop_trading_command(make_update(texts), None))
+    release.set()
+    assert texts == [spotAI._t("handler_timed_out", ADMIN)]
@@ -0,0 +1,96 @@
+"""IndicatorState/IndicatorEngine against full recomputations with pandas_ta's definitions."""
+import numpy as np
+import pandas as pd
+import pytest
+
+import spotAI
+
+INTERVAL_MS = spotAI.KLINE_INTERVAL_MS["15m"]
+
+
+def klines(count, seed=7, start_ms=1_700_000_000_000):
+    """Binance kline rows of a seeded random walk, oldest first."""
+    rng = np.random.default_rng(seed)
+    closes = 100 * np.exp(np.cumsum(rng.normal(0, 0.01, count)))
+    rows = []
+    for i, close in enumerate(closes):
+        open_price = closes[i - 1] if i else close
+        high, low = max(open_price, close) * 1.002, min(open_price, close) * 0.998
+        open_time = start_ms + i * INTERVAL_MS
+        rows.append([open_time, str(open_price), str(high), str(low), str(close), str(10 + i % 7), open_time + INTERVAL_MS - 1])
+    return rows
+
+
+def reference(closes):
+    """RSI(14), EMA(20) and BBands(20, 2) of the last close, computed the way pandas_ta does."""
+    close = pd.Series(closes, dtype=float)
+    diff = close.diff()
+    gains, losses = diff.clip(lower=0), (-diff).clip(lower=0)
+    gain_avg = gains.ewm(alpha=1 / 14, min_periods=14).mean() # pandas_ta rma
+    loss_avg = losses.ewm(alpha=1 / 14, min_periods=14).mean()
+    rsi = 100 * gain_avg / (gain_avg + loss_avg)
+    seeded = close.copy()
+    seeded.iloc[:19] = np.nan
+    seeded.iloc[19] = close.iloc[:20].mean() # pandas_ta ema with presma
+    ema = seeded.ewm(span=20, adjust=False).mean()
+    middle = close.rolling(20).mean()
+    std = close.rolling(20).std(ddof=0)
+    return {"rsi": rsi.iloc[-1], "ema20": ema.iloc[-1], "bb_middle": middle.iloc[-1],
+            "bb_lower": middle.iloc[-1] - 2 * std.iloc[-1], "bb_upper": middle.iloc[-1] + 2 * std.iloc[-1],
+            "bb_width": 100 * 4 * std.iloc[-1] / middle.iloc[-1]}
+
+
+def assert_matches(values, expected):
+    assert set(values) == set(expected)
+    for key, value in expected.items():
+        assert values[key] == pytest.approx(value, rel=1e-9), key
+
+
+@pytest.mark.parametrize("count", [21, 35, 150, 400])
+def test_closed_candles_match_full_recomputation(count):
+    rows = klines(count)
+    state = spotAI.IndicatorState()
+    for row in rows:
+        state.add_candle((row[0],) + tuple(float(v) for v in row[1:6]))
+    assert_matches(state.values(), reference([float(row[4]) for row in rows]))
+
+
+def test_forming_candle_is_included_as_if_closed():
+    rows = klines(120)
+    engine = spotAI.IndicatorEngine()
+    now_ms = rows[-1][0] + INTERVAL_MS // 2 # the last row is still forming
+    assert engine.update("TESTBNB", "15m", rows, now_ms) == 120
+    assert_matches(engine.indicators("TESTBNB", "15m"), reference([float(row[4]) for row in rows]))
+    assert engine.recent_candles("TESTBNB", "15m")[-1][3] == float(rows[-1][4])
+
+
+def test_incremental_updates_match_one_shot_warmup():
+    rows = klines(300)
+    engine = spotAI.IndicatorEngine()
+    engine.update("TESTBNB", "15m", rows[:100], rows[100][0])
+    for i in range(100, 300): # each update re-sends the last applied candle, as klines_needed asks for
+        engine.update("TESTBNB", "15m", rows[i - 1:i + 1], rows[i][6] + 1)
+    assert_matches(engine.indicators("TESTBNB", "15m"), reference([float(row[4]) for row in rows]))
+
+
+def test_values_are_left_out_without_enough_history():
+    state = spotAI.IndicatorState()
+    for row in klines(14):
+        state.add_candle((row[0],) + tuple(float(v) for v in row[1:6]))
+    assert "rsi" not in state.values() and "bb_middle" not in state.values() and "ema20" not in state.values()
+
+
+def test_matches_pandas_ta():
+    ta = pytest.importorskip("pandas_ta")
+    rows = klines(200)
+    close = pd.Series([float(row[4]) for row in rows])
+    state = spotAI.IndicatorState()
+    for row in rows:
+        state.add_candle((row[0],) + tuple(float(v) for v in row[1:6]))
+    values = state.values()
+    bbands = ta.bbands(close, length=20, std=2)
+    assert values["rsi"] == pytest.approx(ta.rsi(close, length=14).iloc[-1], rel=1e-9)
+    assert values["ema20"] == pytest.approx(ta.ema(close, length=20).iloc[-1], rel=1e-9)
+    assert values["bb_lower"] == pytest.approx(bbands.iloc[-1, 0], rel=1e-9)
+    assert values["bb_middle"] == pytest.approx(bbands.iloc[-1, 1], rel=1e-9)
+    assert values["bb_upper"] == pytest.approx(bbands.iloc[-1, 2], rel=1e-9)
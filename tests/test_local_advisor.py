@@ -0,0 +1,147 @@
+"""LocalAdvisor: training, versioned save/load, prediction, train/serve feature parity and the train-advisor command."""
+import json
+import os
+import time
+
+import numpy as np
+import pytest
+
+import spotAI
+
+INTERVAL_MS = spotAI.KLINE_INTERVAL_MS[spotAI.LocalAdvisor.INTERVAL]
+
+
+def synthetic_samples(count=200, seed=3):
+    """Samples whose targets are a known linear function of the features, plus a little noise."""
+    rng = np.random.default_rng(seed)
+    samples = []
+    for _ in range(count):
+        features = [rng.uniform(20, 80), rng.normal(0, 1), rng.uniform(1, 6), rng.uniform(0, 1),
+                    rng.normal(0, 2), rng.uniform(0.2, 2), rng.uniform(0.5, 2), rng.choice([-1.0, 1.0])]
+        tp = 0.5 + 0.02 * features[0] + 0.3 * features[2]
+        max_time = 400 + 100 * features[5] + 50 * features[7]
+        samples.append((features, [tp + rng.normal(0, 0.01), max_time + rng.normal(0, 1)]))
+    return samples
+
+
+def kline_rows(count, now_ms, seed=5):
+    """`count` Binance kline rows (11 columns) of the 15m interval, the last one still forming at `now_ms`."""
+    rng = np.random.default_rng(seed)
+    forming_open = now_ms // INTERVAL_MS * INTERVAL_MS
+    close, rows = 600.0, []
+    for i in range(count):
+        open_time = forming_open - (count - 1 - i) * INTERVAL_MS
+        open_price, close = close, close * (1 + rng.normal(0, 0.004))
+        high, low = max(open_price, close) * 1.001, min(open_price, close) * 0.999
+        volume = float(rng.uniform(100, 1000))
+        rows.append([open_time, open_price, high, low, close, volume, open_time + INTERVAL_MS - 1, volume * close, 100, volume / 2, volume * close / 2])
+    return rows
+
+
+def test_train_recovers_linear_targets():
+    samples = synthetic_samples()
+    model = spotAI.LocalAdvisor.train(samples, ridge=0.01)
+    assert model["targets"] == list(spotAI.LocalAdvisor.TARGETS) and model["samples"] == len(samples)
+    for target in spotAI.LocalAdvisor.TARGETS:
+        assert model["holdout_mae"][target] < model["baseline_mae"][target] / 5
+    advisor = spotAI.LocalAdvisor(dict(model, version=1))
+    features, (tp, max_time) = samples[0]
+    advice = advisor.predict(features)
+    assert set(advice) == {"tp_percentage", "max_trade_time_seconds"}
+    assert advice["tp_percentage"] == pytest.approx(tp, abs=0.05)
+    assert advice["max_trade_time_seconds"] == pytest.approx(max_time, abs=5)
+
+
+def test_predict_clamps_like_gemini_advice():
+    advisor = spotAI.LocalAdvisor(dict(spotAI.LocalAdvisor.train(synthetic_samples(), ridge=0.01), version=1))
+    advice = advisor.predict([1000.0, 0, 50, 0, 0, -50, 0, -1])
+    assert advice["tp_percentage"] == 10.0 and advice["max_trade_time_seconds"] == 60
+
+
+def test_save_and_load_versions(tmp_path):
+    directory = str(tmp_path / "advisor_models")
+    assert spotAI.LocalAdvisor.load(directory) is None
+    first = spotAI.LocalAdvisor.train(synthetic_samples(seed=1))
+    second = spotAI.LocalAdvisor.train(synthetic_samples(seed=2))
+    assert spotAI.LocalAdvisor.save(first, directory).endswith("advisor_v0001.json")
+    assert spotAI.LocalAdvisor.save(second, directory).endswith("advisor_v0002.json")
+    assert spotAI.LocalAdvisor.versions(directory) == [1, 2]
+    newest, chosen = spotAI.LocalAdvisor.load(directory), spotAI.LocalAdvisor.load(directory, 1)
+    assert (newest.version, chosen.version) == (2, 1)
+    assert chosen.model["weights"] == first["weights"]
+    assert spotAI.LocalAdvisor.load(directory, 3) is None
+
+
+def test_load_rejects_a_model_with_other_targets(tmp_path):
+    directory = str(tmp_path / "advisor_models")
+    model = spotAI.LocalAdvisor.train(synthetic_samples())
+    spotAI.LocalAdvisor.save(dict(model, targets=["tp_percentage", "sl_percentage", "max_trade_time_seconds"]), directory)
+    assert spotAI.LocalAdvisor.load(directory) is None
+
+
+def test_live_features_match_the_training_features(make_bot):
+    bot = make_bot()
+    now_ms = int(bot.clock.time() * 1000)
+    rows = kline_rows(100, now_ms) # 99 closed candles, the lookback of features_at, and the forming one
+    bot.kline_store._append(("BNBUSDT", "15m"), rows[:-1])
+    bot.indicator_engine.update("BNBUSDT", "15m", rows, now_ms)
+    assert bot.indicator_engine.indicators("BNBUSDT", "15m") != bot.indicator_engine.indicators("BNBUSDT", "15m", forming=False)
+    live = bot._entry_features("BNBUSDT", "SELL")
+    assert live is not None
+    assert live == spotAI.LocalAdvisor.features_at(bot.kline_store, "BNBUSDT", "SELL", now_ms / 1000)
+
+
+def test_entry_features_need_current_candles(make_bot):
+    bot = make_bot()
+    assert bot._entry_features("BNBUSDT", "BUY") is None # no indicator state
+    now_ms = int(bot.clock.time() * 1000)
+    rows = kline_rows(100, now_ms - 3 * INTERVAL_MS)
+    bot.indicator_engine.update("BNBUSDT", "15m", rows, now_ms)
+    assert bot._entry_features("BNBUSDT", "BUY") is None # missed closed candles; no klines request is made to catch up
+
+
+def test_local_advice_keeps_the_mode_stop_loss(make_bot, tmp_path):
+    directory = str(tmp_path / "advisor_models")
+    spotAI.LocalAdvisor.save(spotAI.LocalAdvisor.train(synthetic_samples()), directory)
+    bot = make_bot(ai_advisor="local", ai_model_dir=directory, stop_loss=1.7)
+    advice = bot.get_local_trade_advice(synthetic_samples(1)[0][0])
+    assert advice["sl_percentage"] == 1.7 and advice["rationale"]
+    assert bot.ai_metrics["local_predictions"] == 1
+
+
+def journal(path, count=40):
+    store = spotAI.TradeStore(path)
+    base = time.time() - count * 3600
+    for i, (features, (tp, max_time)) in enumerate(synthetic_samples(count)):
+        opened = base + i * 3600
+        won = i % 4 != 0
+        trade = spotAI.TradeRecord({
+            'id': store.next_trade_id(), 'timestamp': opened, 'pair': "BNBUSDT", 'type': "BUY" if features[7] > 0 else "SELL",
+            'entry_price': 600.0, 'stop_loss': 590.0, 'max_time_seconds': int(max_time), 'completed': True,
+            'entry_time': time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(opened)),
+            'exit_time': time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(opened + 120)),
+            'close_reason': "take_profit" if won else "stop_loss", 'result': tp if won else -1.0,
+            'entry_features': features, 'advice_source': "local" if i % 2 else "gemini"})
+        store.add(trade)
+    store.flush()
+    store.close()
+
+
+def test_train_advisor_cli(tmp_path, monkeypatch, capsys):
+    db, directory = str(tmp_path / "trades.db"), str(tmp_path / "advisor_models")
+    monkeypatch.setitem(spotAI.CONFIG, "kline_store_dir", str(tmp_path / "klines"))
+    journal(db)
+
+    spotAI.run_train_advisor_cli(["--db", db, "--model-dir", directory, "--min-samples", "100"])
+    assert "nothing saved" in capsys.readouterr().out
+    assert spotAI.LocalAdvisor.versions(directory) == []
+
+    spotAI.run_train_advisor_cli(["--db", db, "--model-dir", directory, "--min-samples", "20"])
+    out = capsys.readouterr().out
+    assert "30 training samples from 40 closed trades, 10 not profitable" in out
+    assert "Saved" in out and "holdout MAE" in out
+    with open(os.path.join(directory, "advisor_v0001.json"), encoding="utf-8") as f:
+        assert json.load(f)["samples"] == 30
+
+    spotAI.run_train_advisor_cli(["--model-dir", directory, "--list"])
+    assert capsys.readouterr().out.startswith("v1     trained ")
@@ -0,0 +1,26 @@
+"""MarketAnalyzer snapshot access while a REST request is in flight."""
+import threading
+
+import spotAI
+
+
+class LockProbingAPI:
+    def __init__(self, analyzer):
+        self.analyzer = analyzer
+        self.lock_held = None
+
+    def get_ticker_24hr(self, symbol=None):
+        free = []
+        probe = threading.Thread(target=lambda: free.append(self.analyzer.lock.acquire(blocking=False) and self.analyzer.lock.release() is None))
+        probe.start()
+        probe.join()
+        self.lock_held = not free[0] # another thread, such as select_entries, could have taken the lock
+        return {"symbol": symbol, "volume": "900.0", "quoteVolume": "3600.0", "priceChangePercent": "2.5", "lastPrice": "4.0"}
+
+
+def test_pair_data_is_fetched_without_holding_the_snapshot_lock():
+    analyzer = spotAI.MarketAnalyzer(dict(spotAI.CONFIG, mock_mode=False, api_key="", api_secret=""))
+    analyzer.binance_api = LockProbingAPI(analyzer)
+    row = analyzer.get_pair_data("ETHBNB")
+    assert analyzer.binance_api.lock_held is False
+    assert row == {"pair": "ETHBNB", "volume": 900.0, "quote_volume": 3600.0, "price_change": 2.5, "last_price": 4.0}
@@ -0,0 +1,187 @@
+"""BinanceStream and the streaming MarketAnalyzer against a local websocket stand-in replaying recorded frames."""
+import base64
+import hashlib
+import json
+import socket
+import threading
+import time
+
+import pytest
+
+import spotAI
+
+pytestmark = pytest.mark.skipif(spotAI.websocket is None, reason="websocket-client is not installed")
+
+
+class WebSocketStandIn:
+    """Minimal ws:// server that plays recorded StreamRecorder lines to its clients as combined-stream frames.
+
+    Frames go out in order across connections. With `drop_after`, the first connection is closed after
+    that many frames and the next one carries on with the rest; once all frames are sent the connection
+    stays open, silent, until the client leaves. Pings are answered with a pong unless `answer_pings` is False.
+    """
+    GUID = "258EAFA5-E914-47DA-95CA-C5AB0DC85B11"
+
+    def __init__(self, lines, drop_after=None, answer_pings=True):
+        self.frames = [line if isinstance(line, str) else json.dumps({"stream": line["stream"], "data": line["data"]}) for line in lines]
+        self.drop_after = drop_after
+        self.answer_pings = answer_pings
+        self.pings = 0
+        self.sent = 0
+        self.paths = []
+        self.server = socket.create_server(("127.0.0.1", 0))
+        self.url = f"ws://127.0.0.1:{self.server.getsockname()[1]}"
+        threading.Thread(target=self._serve, daemon=True).start()
+
+    def close(self):
+        self.server.close()
+
+    def _serve(self):
+        while True:
+            try:
+                connection, _ = self.server.accept()
+            except OSError:
+                return
+            threading.Thread(target=self._handle, args=(connection,), daemon=True).start()
+
+    def _handle(self, connection):
+        with connection:
+            request = b""
+            while b"\r\n\r\n" not in request:
+                request += connection.recv(4096)
+            lines = request.decode().split("\r\n")
+            self.paths.append(lines[0].split(" ")[1])
+            key = next(line.split(":", 1)[1].strip() for line in lines if line.lower().startswith("sec-websocket-key:"))
+            accept = base64.b64encode(hashlib.sha1((key + self.GUID).encode()).digest()).decode()
+            connection.sendall(("HTTP/1.1 101 Switching Protocols\r\nUpgrade: websocket\r\nConnection: Upgrade\r\n"
+                                f"Sec-WebSocket-Accept: {accept}\r\n\r\n").encode())
+            first_connection = len(self.paths) == 1
+            while self.sent < len(self.frames):
+                if first_connection and self.drop_after is not None and self.sent >= self.drop_after:
+                    return
+                connection.sendall(self._text_frame(self.frames[self.sent]))
+                self.sent += 1
+            try:
+                while True: # answer the client's close frame, so its close() does not wait for a timeout
+                    data = connection.recv(4096)
+                    if not data or data[0] & 0x0F == 0x8:
+                        connection.sendall(b"\x88\x00")
+                        return
+                    if data[0] & 0x0F == 0x9:
+                        self.pings += 1
+                        if self.answer_pings:
+                            connection.sendall(b"\x8a\x00")
+            except OSError:
+                pass
+
+    @staticmethod
+    def _text_frame(text):
+        payload = text.encode()
+        if len(payload) < 126:
+            header = bytes([0x81, len(payload)])
+        elif len(payload) < 65536:
+            header = bytes([0x81, 126]) + len(payload).to_bytes(2, "big")
+        else:
+            header = bytes([0x81, 127]) + len(payload).to_bytes(8, "big")
+        return header + payload
+
+
+def recorded(t_ms, *tickers):
+    return {"t": t_ms, "stream": "!miniTicker@arr",
+            "data": [{"e": "24hrMiniTicker", "E": t_ms, "s": symbol, "c": str(close), "o": str(open_price), "h": str(close),
+                      "l": str(open_price), "v": str(volume), "q": str(volume * close)} for symbol, open_price, close, volume in tickers]}
+
+
+def wait_until(condition, timeout=10.0):
+    deadline = time.time() + timeout
+    while not condition() and time.time() < deadline:
+        time.sleep(0.02)
+    return condition()
+
+
+@pytest.fixture
+def analyzer():
+    config = dict(spotAI.CONFIG, mock_mode=False, api_key="", api_secret="", stream_gap_resync_seconds=0.5)
+    market_analyzer = spotAI.MarketAnalyzer(config)
+    market_analyzer.market_data = [{"pair": "ETHBNB", "volume": 1.0, "quote_volume": 1.0, "price_change": 0.0, "last_price": 4.0},
+                                   {"pair": "SOLBNB", "volume": 1.0, "quote_volume": 1.0, "price_change": 0.0, "last_price": 0.2}]
+    market_analyzer._stream_symbols = {"ETHBNB", "SOLBNB"} # from the REST snapshot the stream then keeps current
+    return market_analyzer
+
+
+def stream_for(analyzer, standin):
+    config = dict(analyzer.config, binance_ws_url=standin.url)
+    return spotAI.BinanceStream(config, ["!miniTicker@arr"], analyzer._on_mini_ticker_frame,
+                                on_reconnect=analyzer._on_stream_reconnect, name="test-market-data")
+
+
+def test_replayed_frames_update_the_snapshot_in_place(analyzer):
+    standin = WebSocketStandIn([
+        recorded(1, ("ETHBNB", 4.0, 4.2, 900.0), ("BTCUSDT", 60000, 61000, 5.0)),
+        "not json", # a malformed frame is skipped without dropping the connection
+        '{"result": null, "id": 1}', # a SUBSCRIBE acknowledgement
+        recorded(2, ("SOLBNB", 0.2, 0.19, 5000.0), ("ETHBNB", 4.0, 4.4, 950.0)),
+    ])
+    stream = stream_for(analyzer, standin)
+    stream.start()
+    try:
+        assert wait_until(lambda: stream.message_count == 4)
+        assert wait_until(lambda: analyzer.snapshot.rows()[0]["last_price"] == 4.4)
+    finally:
+        stream.stop()
+        standin.close()
+    rows = {row["pair"]: row for row in analyzer.market_data}
+    assert set(rows) == {"ETHBNB", "SOLBNB"} # symbols outside the REST snapshot are ignored
+    assert rows["ETHBNB"]["price_change"] == pytest.approx(10.0) and rows["ETHBNB"]["volume"] == 950.0
+    assert rows["SOLBNB"]["last_price"] == 0.19 and rows["SOLBNB"]["price_change"] == pytest.approx(-5.0)
+    assert stream.reconnect_count == 0
+    assert standin.paths == ["/stream?streams=!miniTicker@arr"]
+
+
+def test_reconnect_resumes_the_replay_and_requests_a_resync(analyzer):
+    frames = [recorded(i, ("ETHBNB", 4.0, 4.0 + i / 100, 900.0 + i)) for i in range(1, 11)]
+    standin = WebSocketStandIn(frames, drop_after=4)
+    gaps = []
+    stream = stream_for(analyzer, standin)
+    stream.on_reconnect = lambda gap: (gaps.append(gap), analyzer._on_stream_reconnect(gap))
+    stream.start()
+    try:
+        assert wait_until(lambda: stream.message_count == 10)
+        assert wait_until(lambda: analyzer.market_data[0]["volume"] == 910.0)
+    finally:
+        stream.stop()
+        standin.close()
+    assert stream.reconnect_count == 1 and len(standin.paths) == 2
+    assert len(gaps) == 1 and gaps[0] >= 0.5 # the reconnect backoff is the gap in the data
+    assert analyzer._resync_requested
+
+
+def quiet_stream(standin):
+    config = dict(spotAI.CONFIG, binance_ws_url=standin.url)
+    return spotAI.BinanceStream(config, ["listen-key"], lambda stream, data: None, name="test-user-data",
+                                stale_timeout=2.5, ping_interval=1)
+
+
+def test_answered_pings_keep_a_quiet_stream_connected():
+    standin = WebSocketStandIn([])
+    stream = quiet_stream(standin)
+    stream.start()
+    try:
+        time.sleep(4)
+        assert stream.is_healthy()
+    finally:
+        stream.stop()
+        standin.close()
+    assert standin.pings >= 2 and stream.reconnect_count == 0 and len(standin.paths) == 1
+
+
+def test_unanswered_pings_reconnect_the_stream():
+    standin = WebSocketStandIn([], answer_pings=False)
+    stream = quiet_stream(standin)
+    stream.start()
+    try:
+        assert wait_until(lambda: len(standin.paths) == 2)
+    finally:
+        stream.stop()
+        standin.close()
+    assert standin.pings >= 1
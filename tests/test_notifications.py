@@ -0,0 +1,84 @@
+"""NotificationDispatcher hand-over between worker threads and the event loop."""
+import asyncio
+import threading
+
+import spotAI
+
+
+class RecordingBot:
+    def __init__(self):
+        self.texts = []
+
+    async def send_message(self, chat_id, text, **kwargs):
+        self.texts.append(text)
+
+
+def delivered(bot):
+    return [part for text in bot.texts for part in text.split(spotAI.NotificationDispatcher.DIGEST_SEPARATOR)]
+
+
+async def wait_for(condition, timeout=5.0):
+    deadline = asyncio.get_running_loop().time() + timeout
+    while not condition() and asyncio.get_running_loop().time() < deadline:
+        await asyncio.sleep(0.01)
+
+
+def test_messages_submitted_before_start_are_delivered():
+    async def scenario():
+        bot = RecordingBot()
+        dispatcher = spotAI.NotificationDispatcher(bot)
+        dispatcher.submit("early", None, [1, 2], spotAI.NOTIFY_CRITICAL)
+        dispatcher.start()
+        await wait_for(lambda: len(bot.texts) == 2)
+        await dispatcher.stop()
+        return bot.texts
+
+    assert asyncio.run(scenario()) == ["early", "early"]
+
+
+def test_no_message_is_lost_while_start_drains_pending():
+    count = 100
+
+    async def scenario():
+        bot = RecordingBot()
+        dispatcher = spotAI.NotificationDispatcher(bot)
+        dispatcher.PER_CHAT_INTERVAL = 0
+        go = threading.Event()
+
+        def produce():
+            go.wait()
+            for i in range(count):
+                dispatcher.submit(f"m{i}", None, [1], spotAI.NOTIFY_CRITICAL)
+
+        producer = threading.Thread(target=produce)
+        producer.start()
+        go.set()
+        dispatcher.start()
+        await asyncio.get_running_loop().run_in_executor(None, producer.join)
+        await wait_for(lambda: len(delivered(bot)) == count)
+        await dispatcher.stop()
+        return delivered(bot)
+
+    assert sorted(asyncio.run(scenario()), key=lambda m: int(m[1:])) == [f"m{i}" for i in range(count)]
+
+
+def test_info_burst_before_start_does_not_drop_critical_messages():
+    burst = 2 * sum(lane["capacity"] for lane in spotAI.NOTIFICATION_LANES.values()) # more than every lane holds together
+
+    async def scenario():
+        bot = RecordingBot()
+        dispatcher = spotAI.NotificationDispatcher(bot)
+        dispatcher.submit("stop loss hit", None, [1], spotAI.NOTIFY_CRITICAL)
+        dispatcher.submit("trade closed", None, [1], spotAI.NOTIFY_FILL)
+        for i in range(burst):
+            dispatcher.submit(f"whale {i}", None, [1], spotAI.NOTIFY_INFO)
+        dropped = dict(dispatcher.dropped)
+        dispatcher.start()
+        await wait_for(lambda: "trade closed" in delivered(bot))
+        await dispatcher.stop()
+        return delivered(bot), dropped
+
+    texts, dropped = asyncio.run(scenario())
+    assert texts[:2] == ["stop loss hit", "trade closed"]
+    assert dropped[spotAI.NOTIFY_CRITICAL] == dropped[spotAI.NOTIFY_FILL] == 0
+    assert dropped[spotAI.NOTIFY_INFO] == burst - spotAI.NOTIFICATION_LANES[spotAI.NOTIFY_INFO]["capacity"]
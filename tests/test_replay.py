@@ -0,0 +1,48 @@
+"""MarketReplay setup: speed range, start time from the first usable line, a fresh trade journal per run."""
+import json
+
+import pytest
+
+import spotAI
+
+
+def recording(path, lines):
+    path.write_text("".join(line + "\n" for line in lines), encoding="utf-8")
+    return str(path)
+
+
+def frame(t_ms, symbol="BNBUSDT"):
+    return json.dumps({"t": t_ms, "stream": "!miniTicker@arr", "data": [{"s": symbol, "c": "600.0"}]})
+
+
+@pytest.mark.parametrize("speed", [0, 1, 1000, "250"])
+def test_valid_speeds(tmp_path, speed):
+    replay = spotAI.MarketReplay(recording(tmp_path / "streams.jsonl", [frame(1_700_000_000_000)]), speed)
+    assert replay.speed == float(speed)
+
+
+@pytest.mark.parametrize("speed", [0.5, -1, 1001])
+def test_speeds_outside_the_range_are_rejected(tmp_path, speed):
+    with pytest.raises(ValueError):
+        spotAI.MarketReplay(recording(tmp_path / "streams.jsonl", [frame(1_700_000_000_000)]), speed)
+
+
+def test_cli_rejects_a_fractional_speed(tmp_path, capsys):
+    with pytest.raises(SystemExit):
+        spotAI.run_replay_cli([recording(tmp_path / "streams.jsonl", [frame(1_700_000_000_000)]), "--speed", "0.5"])
+    assert "--speed must be 0 or from 1 to 1000" in capsys.readouterr().err
+
+
+def test_malformed_first_lines_are_skipped_for_the_start_time(tmp_path):
+    path = recording(tmp_path / "streams.jsonl", ['{"t": 17000', '{"stream": "x"}', "", frame(1_700_000_123_000)])
+    assert spotAI.MarketReplay(path).clock.time() == 1_700_000_123
+
+
+def test_replay_starts_from_an_empty_journal(tmp_path, make_bot):
+    path = recording(tmp_path / "streams.jsonl", [frame(1_700_000_000_000)])
+    for suffix in ("", "-wal", "-shm"):
+        (tmp_path / f"streams.jsonl.trades.db{suffix}").write_bytes(b"stale")
+    bot = make_bot(replay_file=path, replay_speed=0)
+    assert bot.trade_store.recent_trades() == []
+    wal = tmp_path / "streams.jsonl.trades.db-wal"
+    assert not wal.exists() or wal.read_bytes() != b"stale"
@@ -0,0 +1,87 @@
+"""RequestScheduler weight windows, priority shares, order count and 429/418 bans, on a patched clock."""
+import types
+
+import pytest
+
+import spotAI
+
+WINDOW_START = 1_700_000_040 # a whole minute
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = types.SimpleNamespace(now=WINDOW_START + 5.0, slept=[])
+    clock.sleep = lambda seconds: (clock.slept.append(seconds), setattr(clock, "now", clock.now + seconds))
+    monkeypatch.setattr(spotAI, "time", types.SimpleNamespace(time=lambda: clock.now, sleep=clock.sleep))
+    return clock
+
+
+def make_scheduler(**overrides):
+    config = dict(spotAI.CONFIG, rate_limit_weight_per_minute=100, rate_limit_orders_per_10s=3, rate_limit_max_wait=10, **overrides)
+    return spotAI.RequestScheduler("https://scheduler.test", config)
+
+
+def fill(scheduler, method, path, params=None):
+    count = 0
+    while scheduler._try_reserve(method, path, params) == 0:
+        count += 1
+    return count
+
+
+def test_lower_priorities_leave_headroom_for_orders(clock):
+    scheduler = make_scheduler()
+    assert fill(scheduler, "GET", "/api/v3/klines") == 40 # 2 each, stops at 80% of 100
+    assert scheduler._try_reserve("GET", "/api/v3/klines", None) == pytest.approx(55) # until the minute ends
+    assert scheduler._try_reserve("GET", "/api/v3/account", None) > 0 # 80 + 20 is over the 90% account share
+    assert scheduler._try_reserve("GET", "/api/v3/order", None) == 0 # 80 + 4 fits it
+    assert scheduler._try_reserve("DELETE", "/api/v3/order", None) == 0 # cancels may use the whole minute
+    assert scheduler.used_weight == 85
+
+
+def test_weight_window_rolls_over_each_minute(clock):
+    scheduler = make_scheduler()
+    fill(scheduler, "GET", "/api/v3/klines")
+    clock.now = WINDOW_START + 60.0
+    assert scheduler.current_weight() == 0
+    assert scheduler._try_reserve("GET", "/api/v3/klines", None) == 0 and scheduler.used_weight == 2
+
+
+def test_server_reported_weight_is_authoritative(clock):
+    scheduler = make_scheduler()
+    scheduler._try_reserve("GET", "/api/v3/klines", None)
+    scheduler.record_response(200, {"X-MBX-USED-WEIGHT-1M": "79"}) # other processes on the same IP
+    assert scheduler.used_weight == 79
+    assert scheduler._try_reserve("GET", "/api/v3/klines", None) > 0
+    scheduler.record_response(200, {"x-mbx-used-weight-1m": "10"}) # lower than reserved ones still in flight
+    assert scheduler.used_weight == 79
+
+
+def test_order_count_limit_per_ten_seconds(clock):
+    scheduler = make_scheduler()
+    assert fill(scheduler, "POST", "/api/v3/order") == 3
+    assert scheduler._try_reserve("POST", "/api/v3/order", None) == pytest.approx(5) # the 10 s window started 5 s ago
+    assert scheduler._try_reserve("DELETE", "/api/v3/order", None) == 0 # cancels do not count
+    clock.now = WINDOW_START + 10.0
+    assert scheduler._try_reserve("POST", "/api/v3/order", None) == 0
+
+
+@pytest.mark.parametrize("status_code", [429, 418])
+def test_retry_after_blocks_every_request(clock, status_code):
+    scheduler = make_scheduler()
+    scheduler.record_response(status_code, {"Retry-After": "30"})
+    assert scheduler._try_reserve("POST", "/api/v3/order", None) == pytest.approx(30)
+    assert scheduler._try_reserve("GET", "/api/v3/klines", None) == pytest.approx(30)
+    clock.now += 30
+    assert scheduler._try_reserve("POST", "/api/v3/order", None) == 0
+    assert scheduler.metrics[f"http_{status_code}"] == 1
+
+
+def test_acquire_waits_for_a_short_ban_and_rejects_a_long_one(clock):
+    scheduler = make_scheduler()
+    scheduler.record_response(429, {"Retry-After": "2.5"})
+    scheduler.acquire("GET", "/api/v3/klines")
+    assert sum(clock.slept) == pytest.approx(2.5) and scheduler.metrics["throttled"] == 1
+    scheduler.record_response(418, {"Retry-After": "120"})
+    with pytest.raises(spotAI.BinanceRateLimitError):
+        scheduler.acquire("POST", "/api/v3/order")
+    assert scheduler.metrics["rejected"] == 1
@@ -0,0 +1,102 @@
+"""StrategyEngine: deterministic selection, per-strategy budgets and the per-symbol indicator feed."""
+import threading
+import types
+
+import spotAI
+
+INTERVAL_MS = spotAI.KLINE_INTERVAL_MS["15m"]
+NOW = 1_700_001_000.0
+
+
+class FakeClock(spotAI.SystemClock):
+    def __init__(self, now):
+        self.now_seconds = now
+
+    def time(self):
+        return self.now_seconds
+
+
+def snapshot():
+    rows = [{"pair": f"P{i}BNB", "volume": 1000.0, "quote_volume": 5000.0 + i * 100, "price_change": 3.0,
+             "last_price": 1.0 + i} for i in range(8)]
+    return spotAI.MarketSnapshot(rows)
+
+
+def make_engine(momentum=2, rsi=1, **overrides):
+    config = dict(spotAI.CONFIG, min_volume=100, min_price_change=1.0, **overrides)
+    config["strategies"] = {"momentum": {"enabled": True, "max_open_trades": momentum},
+                            "rsi_reversion": {"enabled": True, "max_open_trades": rsi, "oversold": 30, "overbought": 70}}
+    return spotAI.StrategyEngine(config, spotAI.EventBus(), FakeClock(NOW))
+
+
+def test_selection_is_deterministic_and_respects_each_budget():
+    engine = make_engine()
+    engine.update_indicators("P0BNB", "15m", {"rsi": 20.0})
+    engine.update_indicators("P1BNB", "15m", {"rsi": 25.0})
+    engine.update_indicators("P2BNB", "15m", {"rsi": 50.0})
+    market = snapshot()
+    entries = engine.select_entries(market, [], slots=10)
+    assert entries == engine.select_entries(market, [], slots=10)
+    assert [(signal.strategy, signal.pair, signal.side) for signal in entries] == [
+        ("momentum", "P7BNB", "BUY"), ("momentum", "P6BNB", "BUY"), ("rsi_reversion", "P0BNB", "BUY")]
+
+    open_trades = [{"pair": "P7BNB", "strategy": "momentum"}, {"pair": "P0BNB", "strategy": "rsi_reversion"}]
+    entries = engine.select_entries(market, open_trades, slots=10)
+    assert [(signal.strategy, signal.pair) for signal in entries] == [("momentum", "P6BNB")] # one momentum slot left, none for rsi
+    assert [signal.pair for signal in engine.select_entries(market, [], slots=1)] == ["P7BNB"] # earlier strategies get scarce slots
+
+
+def test_stale_and_other_interval_indicators_are_ignored():
+    engine = make_engine(momentum=0)
+    engine.update_indicators("P0BNB", "15m", {"rsi": 20.0})
+    engine.update_indicators("P1BNB", "1m", {"rsi": 10.0}) # e.g. a replayed 1m kline stream
+    assert [signal.pair for signal in engine.select_entries(snapshot(), [], slots=10)] == ["P0BNB"]
+    engine.clock.now_seconds += engine.config["strategy_indicator_max_age"] + 1
+    assert engine.select_entries(snapshot(), [], slots=10) == []
+
+
+def test_indicators_can_be_updated_while_strategies_evaluate():
+    engine = make_engine(momentum=0)
+    market, errors, done = snapshot(), [], threading.Event()
+
+    def feed():
+        for i in range(20000):
+            engine.update_indicators(f"X{i}BNB", "15m", {"rsi": 50.0})
+        done.set()
+
+    thread = threading.Thread(target=feed)
+    thread.start()
+    while not done.is_set():
+        try:
+            engine.select_entries(market, [], slots=10)
+        except RuntimeError as e: # dictionary changed size during iteration
+            errors.append(e)
+            break
+    thread.join()
+    assert errors == []
+
+
+class KlineAPI:
+    """Serves a steadily falling 15m series, so the RSI of every symbol ends up oversold."""
+    def get_klines(self, symbol, interval, limit=100, start_time=None):
+        first = max(start_time, int(NOW * 1000) - 200 * INTERVAL_MS)
+        first -= first % INTERVAL_MS
+        rows = []
+        for open_time in range(first, int(NOW * 1000), INTERVAL_MS):
+            close = 100.0 - (open_time - first) / INTERVAL_MS * 0.1
+            rows.append([open_time, close + 0.1, close + 0.2, close - 0.1, close, 10.0, open_time + INTERVAL_MS - 1, 1000.0, 5, 5.0, 500.0])
+        return rows[:limit]
+
+
+def test_feed_fills_indicators_for_snapshot_symbols_without_ai(make_bot):
+    bot = make_bot(mock_mode=False, strategies={"rsi_reversion": {"enabled": True, "max_open_trades": 1}})
+    assert bot.ai_model is None
+    bot.strategy_engine.clock = types.SimpleNamespace(time=lambda: NOW)
+    bot.market_analyzer.snapshot = snapshot()
+    for pair in bot.market_analyzer.snapshot.pairs:
+        bot.refresh_strategy_indicators(pair, KlineAPI(), int(NOW * 1000))
+    indicators = bot.strategy_engine.current_indicators()
+    assert set(indicators) == set(bot.market_analyzer.snapshot.pairs)
+    assert all(values["rsi"] < 30 for values in indicators.values())
+    entries = bot.strategy_engine.select_entries(bot.market_analyzer.snapshot, [], slots=3)
+    assert [(signal.strategy, signal.side) for signal in entries] == [("rsi_reversion", "BUY")]
@@ -0,0 +1,82 @@
+"""TradeStore: open trades survive a restart, queued writes reach SQLite in batches, history merges memory and disk."""
+import sqlite3
+
+import spotAI
+
+
+class FixedClock(spotAI.SystemClock):
+    def __init__(self, now):
+        self.now_seconds = now
+
+    def time(self):
+        return self.now_seconds
+
+
+def open_trade(store, pair, opened_at):
+    store.clock.now_seconds = opened_at
+    trade = spotAI.TradeRecord({'id': store.next_trade_id(), 'timestamp': opened_at, 'pair': pair, 'type': "BUY",
+                                'entry_price': 1.0, 'amount': 1.0, 'completed': False})
+    store.add(trade)
+    return trade
+
+
+def close_trade(store, trade, closed_at):
+    store.clock.now_seconds = closed_at
+    trade.update({'completed': True, 'exit_price': 1.1, 'result': 10.0})
+    assert store.complete(trade)
+
+
+def rows(path):
+    connection = sqlite3.connect(path)
+    try:
+        return connection.execute("SELECT id, status, opened_at, closed_at FROM trades ORDER BY opened_at").fetchall()
+    finally:
+        connection.close()
+
+
+def test_open_trades_are_reloaded_at_startup(tmp_path):
+    path = str(tmp_path / "trades.db")
+    store = spotAI.TradeStore(path, clock=FixedClock(0))
+    held = open_trade(store, "ETHBNB", 1_000)
+    close_trade(store, open_trade(store, "SOLBNB", 1_010), 1_020)
+    store.close()
+
+    reopened = spotAI.TradeStore(path, clock=FixedClock(2_000))
+    try:
+        assert reopened.recovered_count == 1
+        assert [trade['id'] for trade in reopened.active_trades()] == [held['id']]
+        assert reopened.has_open_trade("ETHBNB") and not reopened.has_open_trade("SOLBNB")
+        assert reopened.next_trade_id() > held['id']
+    finally:
+        reopened.close()
+
+
+def test_queued_writes_are_flushed_with_the_trade_clock(tmp_path):
+    path = str(tmp_path / "trades.db")
+    store = spotAI.TradeStore(path, clock=FixedClock(0))
+    try:
+        trades = [open_trade(store, f"P{i}BNB", 1_000 + i) for i in range(spotAI.TradeStore.WRITE_BATCH_SIZE * 2 + 5)]
+        for trade in trades[:10]:
+            close_trade(store, trade, 5_000) # virtual time, far from the wall clock
+        assert store.flush()
+        written = rows(path)
+    finally:
+        store.close()
+    assert len(written) == len(trades)
+    closed = [row for row in written if row[1] == 'closed']
+    assert len(closed) == 10 and {row[3] for row in closed} == {5_000}
+    assert all(row[3] is None for row in written if row[1] == 'open')
+
+
+def test_recent_trades_merge_memory_and_database(tmp_path):
+    store = spotAI.TradeStore(str(tmp_path / "trades.db"), completed_in_memory=2, clock=FixedClock(0))
+    try:
+        completed = [open_trade(store, f"P{i}BNB", 1_000 + i) for i in range(5)]
+        for trade in completed:
+            close_trade(store, trade, 2_000)
+        held = open_trade(store, "ETHBNB", 1_500)
+        recent = store.recent_trades(4)
+    finally:
+        store.close()
+    # The open trade and the two completed trades still in memory, then the next one from the database
+    assert [trade['id'] for trade in recent] == [held['id']] + [trade['id'] for trade in reversed(completed)][:3]